@@ -0,0 +1,2 @@
+from .streams import StreamEngine, StreamState, create_s_id_info, device_names, CHUNK_FRAMES, BUFFER_CHUNKS, \
+    CONFIG_VERSION, DEFAULT_CONFIG, LATENCY_PROFILES, IDLE, STARTING, STREAMING, STOPPING, SUSPENDED
@@ -0,0 +1,143 @@
+import time
+from threading import Lock
+from .convert import FormatConverter, OutputAdapter
+
+
+class AudioEngine:
+    # Owns the one PyAudio instance for the process. Streams run in callback mode
+    # so PortAudio's own thread moves the audio and no Python thread blocks on I/O.
+    # backend is the pyaudio module or anything with the same interface, such as
+    # engine.fake_backend.FakeBackend; a backend with a clock() of its own sets self.clock.
+    def __init__(self, chunk_frames=2048, rate=44100, channels=2, backend=None):
+        if backend is None:
+            import pyaudio as backend
+        self.chunk_frames = chunk_frames
+        self.rate = rate
+        self.channels = channels
+        self.backend = backend
+        self.clock = getattr(backend, "clock", time.monotonic)
+        self.audio = backend.PyAudio()
+        self.devices = None
+        self.streams = []
+        # dev_index -> callbacks flagged with an input overflow or output underflow
+        self.xruns = {}
+        self.lock = Lock()
+        # PortAudio's open and close are not thread safe, streams are opened and closed one at a time
+        self.device_lock = Lock()
+
+    def refresh_devices(self):
+        devices = []
+        for i in range(self.audio.get_host_api_count()):
+            info = self.audio.get_host_api_info_by_index(i)
+            for dev in range(info["deviceCount"]):
+                dev_info = self.audio.get_device_info_by_host_api_device_index(i, dev)
+                devices.append({"api_name": info["name"], "name": dev_info["name"], "index": dev_info["index"],
+                                "max_input_channels": dev_info["maxInputChannels"],
+                                "max_output_channels": dev_info["maxOutputChannels"],
+                                "default_rate": dev_info["defaultSampleRate"]})
+        if len(devices) < 1:
+            print("No APIs available")
+        self.devices = devices
+        return devices
+
+    def get_device_list(self, d_type):
+        if self.devices is None:
+            self.refresh_devices()
+        dev_list = []
+        for dev in self.devices:
+            if (d_type == "playback" and dev["max_output_channels"] > 0) \
+                    or (d_type == "capture" and dev["max_input_channels"] > 0):
+                dev_list.append([dev["api_name"], dev["name"], dev["index"]])
+        return dev_list
+
+    def get_device_info(self, dev_index):
+        if self.devices is None:
+            self.refresh_devices()
+        for dev in self.devices:
+            if dev["index"] == dev_index:
+                return dev
+        return None
+
+    def native_format(self, dev_index, direction):
+        # (rate, channels) the device runs at without any driver side conversion. The
+        # channel maximum is not a native format: ALSA default, pulse and dmix report 32
+        # to 128, so devices open at the engine's count and only fewer channels are converted.
+        dev = self.get_device_info(dev_index)
+        if dev is None:
+            return self.rate, self.channels
+        max_channels = dev["max_input_channels"] if direction == "input" else dev["max_output_channels"]
+        if not max_channels or max_channels >= self.channels:
+            channels = self.channels
+        else:
+            channels = min(max_channels, 2)
+        return int(dev["default_rate"]) or self.rate, channels
+
+    def device_frames(self, rate, block_frames=None):
+        return max(1, round((block_frames or self.chunk_frames) * rate / self.rate))
+
+    def open_input(self, dev_index, on_data, native=True, block_frames=None):
+        # on_data(in_data) is called from the PortAudio thread for every block, already
+        # converted to the engine rate and channel count. block_frames defaults to chunk_frames.
+        rate, channels = self.native_format(dev_index, "input") if native else (self.rate, self.channels)
+        converter = None
+        if (rate, channels) != (self.rate, self.channels):
+            converter = FormatConverter(rate, channels, self.rate, self.channels)
+            print("dev", dev_index, "input converted from", rate, "Hz", channels, "ch")
+
+        def callback(in_data, _frame_count, _time_info, status):
+            if status:
+                self.xruns[dev_index] = self.xruns.get(dev_index, 0) + 1
+            on_data(in_data if converter is None else converter.process(in_data))
+            return None, self.backend.paContinue
+
+        return self.open_stream(rate, channels, self.device_frames(rate, block_frames), input=True,
+                                input_device_index=dev_index, stream_callback=callback)
+
+    def open_output(self, dev_index, read_func, native=True, block_frames=None):
+        # read_func(frames) returns a bytes-like block or None, in which case silence is played
+        rate, channels = self.native_format(dev_index, "output") if native else (self.rate, self.channels)
+        frames_per_buffer = self.device_frames(rate, block_frames)
+        silence = bytes(frames_per_buffer * channels * 2)
+        if (rate, channels) != (self.rate, self.channels):
+            converter = FormatConverter(self.rate, self.channels, rate, channels)
+            read_func = OutputAdapter(read_func, converter, block_frames or self.chunk_frames, channels).read
+            print("dev", dev_index, "output converted to", rate, "Hz", channels, "ch")
+
+        def callback(_in_data, frame_count, _time_info, status):
+            if status:
+                self.xruns[dev_index] = self.xruns.get(dev_index, 0) + 1
+            out_data = read_func(frame_count)
+            if out_data is None:
+                out_data = silence if frame_count == frames_per_buffer else bytes(frame_count * channels * 2)
+            return out_data, self.backend.paContinue
+
+        return self.open_stream(rate, channels, frames_per_buffer, output=True, output_device_index=dev_index,
+                                stream_callback=callback)
+
+    def open_stream(self, rate, channels, frames_per_buffer, **kwargs):
+        with self.device_lock:
+            stream = self.audio.open(
+                format=self.backend.paInt16,
+                channels=channels,
+                rate=rate,
+                frames_per_buffer=frames_per_buffer,
+                **kwargs
+            )
+        with self.lock:
+            self.streams.append(stream)
+        return stream
+
+    def close_stream(self, stream):
+        with self.lock:
+            if stream not in self.streams:
+                return
+            self.streams.remove(stream)
+        with self.device_lock:
+            stream.stop_stream()
+            stream.close()
+
+    def terminate(self):
+        for stream in list(self.streams):
+            self.close_stream(stream)
+        with self.device_lock:
+            self.audio.terminate()
@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from . import listener_load
+from .fake_backend import FakeBackend
+from .streams import StreamEngine, CHUNK_FRAMES, TARGET_LATENCY, LATENCY_PROFILES
+
+ROUTE_COUNTS = (1, 10, 100, 500)
+
+
+def resident_memory(pid="self"):
+    # bytes, from /proc where there is one, otherwise the peak the OS reports
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if pid != "self":
+            return 0
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_cpu(pid):
+    # user + system seconds of another process, 0 where /proc is not available
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+def engine_counters(engine):
+    overruns = underruns = 0
+    for info in engine.configured_streams.values():
+        for key in ("input_buffer", "output_buffer"):
+            buffer = getattr(info, key)
+            if buffer is not None:
+                overruns += buffer.overruns
+                underruns += buffer.underruns
+    return overruns, underruns
+
+
+def stream_blocks(engine):
+    return sum(m.blocks for m in engine.metrics.streams.values())
+
+
+def start_listeners(port, routes, clients, seconds):
+    # the load runs in its own process so the listeners do not share this one's GIL
+    urls = [f"http://127.0.0.1:{port}/s{s_id}.wav" for s_id in range(routes)]
+    command = [sys.executable, "-m", "engine.listener_load", *urls, "--clients", str(clients),
+               "--seconds", str(seconds), "--json"]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, text=True)
+
+
+def run_routes(routes, seconds=10.0, warmup=3.0, speed=1.0, latency=TARGET_LATENCY, verbose=False,
+               record_dir=None, record_format="wav", signal="ramp", silence_threshold=None, block_frames=CHUNK_FRAMES,
+               listeners=0):
+    # One capture device -> one stream thread -> one jitter buffered playback device per
+    # route, all on fake hardware, or a recording per route with record_dir. Counters are
+    # reset after warmup so connecting the routes and priming the buffers are not measured.
+    # With silence_threshold the routes detect silence with a 1 s hold, so a silent
+    # signal has them suspended before the measured run. With listeners the routes are
+    # also served by the listener server, to that many listeners connecting during warmup.
+    backend = FakeBackend(inputs=routes, outputs=0 if record_dir else routes, speed=speed, signal=signal)
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        engine = StreamEngine(backend=backend)
+        for s_id in range(routes):
+            engine.get_stream(s_id).latency = latency
+            engine.get_stream(s_id).block_frames = block_frames
+            engine.get_stream(s_id).silence_threshold = silence_threshold
+            engine.get_stream(s_id).silence_hold = 1.0
+            engine.set_input_device(s_id, s_id)
+            if record_dir:
+                engine.set_recording_output(s_id, {"directory": record_dir, "record_format": record_format})
+            else:
+                engine.set_hardware_output(s_id, s_id)
+            engine.set_active(s_id, True)
+        load = None
+        if listeners:
+            server = engine.start_listener_server(0, "127.0.0.1")
+            for s_id in range(routes):
+                server.mount(s_id)
+        engine.start()
+        if listeners:
+            load = start_listeners(server.port, routes, listeners, warmup + seconds)
+        time.sleep(warmup)
+        backend.reset_stats()
+        overruns, underruns = engine_counters(engine)
+        blocks = stream_blocks(engine)
+        memory = resident_memory()
+        cpu = time.process_time()
+        wall = time.monotonic()
+        clock = backend.clock()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu - backend.overhead
+        wall = time.monotonic() - wall
+        clock = backend.clock() - clock
+        memory = resident_memory() - memory
+        end_overruns, end_underruns = engine_counters(engine)
+        totals = backend.sink_totals()
+        if record_dir:
+            # no playback devices, count what the stream threads handed to the recorder
+            totals["blocks"] = stream_blocks(engine) - blocks
+        percentiles = backend.latency_percentiles()
+        listener_stats = json.loads(load.communicate()[0]) if load is not None else None
+        engine.stop()
+    expected = routes * clock * engine.audio_engine.rate / block_frames
+    return {"routes": routes, "speed": speed, "seconds": round(wall, 2),
+            "cpu_per_stream": cpu / wall / routes,
+            "latency_p50": percentiles[50], "latency_p95": percentiles[95], "latency_p99": percentiles[99],
+            "delivered": totals["blocks"] / expected if expected else 0.0,
+            "silent": totals["silent"], "dropped": totals["dropped"], "reordered": totals["reordered"],
+            "overruns": end_overruns - overruns, "underruns": end_underruns - underruns,
+            "late_callbacks": backend.late, "memory_growth": memory,
+            "listeners": listener_stats}
+
+
+def shard_totals(engine):
+    totals = {"blocks": 0, "overruns": 0, "underruns": 0}
+    for s_id in engine.shard_entries:
+        status = engine.supervisor.status(s_id)
+        for key in totals:
+            totals[key] += int(status[key])
+    return totals
+
+
+def run_shards(routes, shards, seconds=10.0, warmup=5.0, speed=1.0, latency=TARGET_LATENCY, verbose=False,
+               block_frames=CHUNK_FRAMES):
+    # The same routes spread over worker processes. Latency is measured inside the
+    # workers and not reported; CPU and memory add up the workers and this process.
+    factory = functools.partial(FakeBackend, inputs=routes, outputs=routes, speed=speed)
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        engine = StreamEngine(shards=shards, backend_factory=factory)
+        engine.supervisor.quiet = not verbose
+        for s_id in range(routes):
+            engine.set_block_size(s_id, block_frames, latency)
+            engine.set_input_device(s_id, s_id)
+            engine.set_hardware_output(s_id, s_id)
+            engine.set_active(s_id, True)
+        engine.start()
+        time.sleep(warmup)
+        pids = engine.supervisor.worker_pids()
+        start = shard_totals(engine)
+        memory = resident_memory() + sum(resident_memory(pid) for pid in pids)
+        cpu = time.process_time() + sum(process_cpu(pid) for pid in pids)
+        wall = time.monotonic()
+        time.sleep(seconds)
+        cpu = time.process_time() + sum(process_cpu(pid) for pid in pids) - cpu
+        wall = time.monotonic() - wall
+        memory = resident_memory() + sum(resident_memory(pid) for pid in pids) - memory
+        end = shard_totals(engine)
+        restarts = engine.supervisor.restarts
+        engine.stop()
+    expected = routes * wall * speed * engine.audio_engine.rate / block_frames
+    return {"routes": routes, "shards": shards, "speed": speed, "seconds": round(wall, 2),
+            "cpu_per_stream": cpu / wall / routes, "latency_p50": None, "latency_p95": None, "latency_p99": None,
+            "delivered": (end["blocks"] - start["blocks"]) / expected if expected else 0.0,
+            "silent": 0, "dropped": 0, "reordered": 0,
+            "overruns": end["overruns"] - start["overruns"], "underruns": end["underruns"] - start["underruns"],
+            "late_callbacks": 0, "restarts": restarts, "memory_growth": memory}
+
+
+def format_ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_header():
+    print(f"{'routes':>6} {'cpu/route':>9} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'deliv':>6} "
+          f"{'silent':>6} {'drop':>5} {'reord':>5} {'over':>5} {'under':>5} {'late':>5} {'mem MB':>7}")
+
+
+def print_result(r):
+    print(f"{r['routes']:>6} {r['cpu_per_stream'] * 100:>8.2f}% {format_ms(r['latency_p50']):>7} "
+          f"{format_ms(r['latency_p95']):>7} {format_ms(r['latency_p99']):>7} {r['delivered'] * 100:>5.1f}% "
+          f"{r['silent']:>6} {r['dropped']:>5} {r['reordered']:>5} {r['overruns']:>5} {r['underruns']:>5} "
+          f"{r['late_callbacks']:>5} {r['memory_growth'] / 2 ** 20:>7.2f}", flush=True)
+    if r.get("listeners"):
+        print("       listeners:", listener_load.format_summary(r["listeners"]), flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="route throughput and latency benchmark on fake audio devices")
+    parser.add_argument("--routes", type=int, nargs="+", default=list(ROUTE_COUNTS), help="route counts to run")
+    parser.add_argument("--seconds", type=float, default=10.0, help="measured time per run (real seconds)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="time before measuring (real seconds)")
+    parser.add_argument("--speed", type=float, default=1.0, help="fake clock speed, above 1 is faster than real time")
+    parser.add_argument("--latency", type=float, help="target latency per route (s), default from the profile")
+    parser.add_argument("--block-frames", type=int, help="block size per route, default from the profile")
+    parser.add_argument("--profile", default="normal", choices=sorted(LATENCY_PROFILES),
+                        help="block size and latency profile")
+    parser.add_argument("--record", metavar="DIR", help="record every route to DIR instead of playing it")
+    parser.add_argument("--record-format", default="wav", help="recording format, wav or flac")
+    parser.add_argument("--signal", default="ramp", help="fake input signal: ramp, tone or silence")
+    parser.add_argument("--silence-threshold", type=float, help="suspend routes below this level (dBFS)")
+    parser.add_argument("--shards", type=int, default=0, help="run the routes in this many worker processes")
+    parser.add_argument("--listeners", type=int, default=0,
+                        help="serve the routes to this many local listeners over http, spread over the routes")
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    parser.add_argument("--verbose", action="store_true", help="keep the engine's own output")
+    args = parser.parse_args(argv)
+    block_frames, latency = LATENCY_PROFILES[args.profile]
+    block_frames = args.block_frames or block_frames
+    latency = args.latency or latency
+    if not args.json:
+        print_header()
+    results = []
+    for routes in args.routes:
+        if args.shards:
+            results.append(run_shards(routes, args.shards, args.seconds, args.warmup + 2, args.speed, latency,
+                                      args.verbose, block_frames))
+        else:
+            results.append(run_routes(routes, args.seconds, args.warmup, args.speed, latency, args.verbose,
+                                      args.record, args.record_format, args.signal, args.silence_threshold,
+                                      block_frames, args.listeners))
+        if not args.json:
+            print_result(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
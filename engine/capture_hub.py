@@ -0,0 +1,129 @@
+from threading import Lock
+import numpy as np
+from .ring_buffer import BroadcastRing
+from .metering import MeterBank
+
+
+class CaptureDevice:
+    def __init__(self, engine, dev_index, capacity, meters):
+        self.engine = engine
+        self.dev_index = dev_index
+        self.ring = BroadcastRing(capacity)
+        self.subscribers = 0
+        self.meters = meters
+        self.meter_slot = meters.allocate()
+        self.source = None
+        self.block_frames = None
+        # reader -> block size its subscriber asked for
+        self.requests = {}
+        self.lock = Lock()
+
+    def open(self, block_frames):
+        # Opening can take a while on some host APIs, so it happens outside the hub
+        # lock and routes on other devices are not held up meanwhile (the audio engine
+        # still opens one stream at a time). A device runs at the smallest
+        # block any subscriber asked for; a smaller one reopens it, which loses a few
+        # milliseconds of its input once.
+        with self.lock:
+            if self.source is not None and block_frames >= self.block_frames:
+                return
+            self.start(block_frames)
+
+    def request(self, reader, block_frames):
+        with self.lock:
+            self.requests[reader] = block_frames
+        self.settle()
+
+    def settle(self):
+        # Runs at the smallest block still asked for, so the device also goes back to
+        # larger blocks once the subscriber that wanted small ones has left.
+        with self.lock:
+            if self.source is None or not self.requests:
+                return
+            block_frames = min(self.requests.values())
+            if block_frames != self.block_frames:
+                self.start(block_frames)
+
+    def start(self, block_frames):
+        # called with self.lock held
+        reopen = self.source is not None
+        if reopen:
+            self.engine.close_stream(self.source)
+            self.source = None
+        self.source = self.engine.open_input(self.dev_index, self.on_data, block_frames=block_frames)
+        self.block_frames = block_frames
+        if reopen:
+            print("capture reopened for dev", self.dev_index, "with", block_frames, "frame blocks")
+        else:
+            print("capture started for dev", self.dev_index)
+
+    def on_data(self, in_data):
+        f = np.frombuffer(in_data, dtype=np.int16)
+        self.meters.submit(self.meter_slot, f)
+        self.ring.write(f)
+
+    def close(self):
+        with self.lock:
+            if self.source is not None:
+                self.engine.close_stream(self.source)
+                self.source = None
+        self.meters.release(self.meter_slot)
+        print("capture ended for dev", self.dev_index)
+
+
+class CaptureHub:
+    # Opens each physical input device once and shares it between every s_id
+    # that picked it. Devices are closed when their last subscriber leaves.
+    def __init__(self, engine, buffer_chunks=50):
+        self.engine = engine
+        self.capacity = engine.chunk_frames * buffer_chunks
+        self.devices = {}
+        self.lock = Lock()
+        self.meters = MeterBank()
+        self.meters.start()
+
+    def subscribe(self, dev_index, block_frames=None):
+        block_frames = block_frames or self.engine.chunk_frames
+        with self.lock:
+            device = self.devices.get(dev_index)
+            if device is None:
+                device = CaptureDevice(self.engine, dev_index, self.capacity, self.meters)
+                self.devices[dev_index] = device
+            device.subscribers += 1
+            print("dev", dev_index, "subscribers", device.subscribers)
+        try:
+            device.open(block_frames)
+        except OSError:
+            self.unsubscribe(dev_index)
+            raise
+        reader = device.ring.reader()
+        with device.lock:
+            device.requests[reader] = block_frames
+        return reader
+
+    def set_block_frames(self, dev_index, reader, block_frames):
+        # a subscriber changing its block size
+        device = self.devices.get(dev_index)
+        if device is not None:
+            device.request(reader, block_frames)
+
+    def unsubscribe(self, dev_index, reader=None):
+        with self.lock:
+            device = self.devices.get(dev_index)
+            if device is None:
+                return
+            device.subscribers -= 1
+            with device.lock:
+                device.requests.pop(reader, None)
+            print("dev", dev_index, "subscribers", device.subscribers)
+            if device.subscribers <= 0:
+                del self.devices[dev_index]
+                device.close()
+                return
+        try:
+            device.settle()
+        except OSError as e:
+            print("capture could not be reopened for dev", dev_index, "-", e)
+
+    def get_device(self, dev_index):
+        return self.devices.get(dev_index)
@@ -0,0 +1,129 @@
+from fractions import Fraction
+from functools import lru_cache
+import numpy as np
+
+FULL_SCALE = 32768.0
+
+
+def to_float(block, fmt="int16", channels=2):
+    if fmt == "float32":
+        return np.frombuffer(block, dtype=np.float32).reshape(-1, channels)
+    return np.frombuffer(block, dtype=np.int16).reshape(-1, channels).astype(np.float32) / FULL_SCALE
+
+
+def to_int16(block):
+    out = np.clip(block * FULL_SCALE, -32768, 32767)
+    return out.astype(np.int16)
+
+
+@lru_cache(maxsize=None)
+def remix_matrix(in_channels, out_channels):
+    # mono is copied to every output, anything to mono is averaged,
+    # otherwise channels map one to one and extra ones are dropped or left silent
+    if in_channels == 1:
+        matrix = np.ones((1, out_channels), dtype=np.float32)
+    elif out_channels == 1:
+        matrix = np.full((in_channels, 1), 1.0 / in_channels, dtype=np.float32)
+    else:
+        matrix = np.eye(in_channels, out_channels, dtype=np.float32)
+    matrix.setflags(write=False)
+    return matrix
+
+
+def remix(block, out_channels):
+    if block.shape[1] == out_channels:
+        return block
+    return block @ remix_matrix(block.shape[1], out_channels)
+
+
+@lru_cache(maxsize=None)
+def polyphase_taps(up, down, zero_crossings=8, beta=8.0):
+    # Kaiser windowed sinc low pass at the lower of the two Nyquist rates, split into
+    # `up` phases of equal length. Cached per rate pair since design is the slow part.
+    factor = max(up, down)
+    length = 2 * zero_crossings * factor + 1
+    n = np.arange(length) - (length - 1) / 2
+    taps = np.sinc(n / factor) * np.kaiser(length, beta)
+    taps *= up / taps.sum()
+    per_phase = -(-length // up)
+    padded = np.zeros(per_phase * up)
+    padded[:length] = taps
+    phases = padded.reshape(per_phase, up).T.astype(np.float32)
+    phases.setflags(write=False)
+    return phases
+
+
+class Resampler:
+    # Streaming rational resampler. Keeps the tail of the previous block and the
+    # fractional output position so blocks of any size join up seamlessly.
+    def __init__(self, src_rate, dst_rate, channels):
+        ratio = Fraction(int(dst_rate), int(src_rate))
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+        self.channels = channels
+        self.phases = polyphase_taps(self.up, self.down)
+        self.per_phase = self.phases.shape[1]
+        self.history = np.zeros((self.per_phase - 1, channels), dtype=np.float32)
+        self.position = 0
+        self.tap_offsets = np.arange(self.per_phase)
+
+    def process(self, block):
+        if self.up == self.down:
+            return block
+        frames = len(block)
+        extended = np.concatenate([self.history, block])
+        count = max(0, -(-(frames * self.up - self.position) // self.down))
+        positions = self.position + np.arange(count) * self.down
+        base = positions // self.up + (self.per_phase - 1)
+        phase = positions % self.up
+        gathered = extended[base[:, None] - self.tap_offsets[None, :]]
+        out = np.einsum("kt,ktc->kc", self.phases[phase], gathered)
+        self.position += count * self.down - frames * self.up
+        self.history = extended[len(extended) - (self.per_phase - 1):]
+        return out
+
+
+class FormatConverter:
+    def __init__(self, src_rate, src_channels, dst_rate, dst_channels, src_format="int16"):
+        self.src_channels = src_channels
+        self.dst_channels = dst_channels
+        self.src_format = src_format
+        # resample as few channels as possible
+        self.resampler = Resampler(src_rate, dst_rate, min(src_channels, dst_channels))
+
+    def process(self, data):
+        block = to_float(data, self.src_format, self.src_channels)
+        if self.dst_channels < self.src_channels:
+            block = remix(block, self.dst_channels)
+        block = self.resampler.process(block)
+        if self.dst_channels > self.src_channels:
+            block = remix(block, self.dst_channels)
+        return to_int16(block)
+
+
+class OutputAdapter:
+    # Feeds a device that runs at a different rate or channel count. Converted audio
+    # is queued so each callback can be handed exactly the frames it asks for.
+    def __init__(self, read_func, converter, chunk_frames, device_channels):
+        self.read_func = read_func
+        self.converter = converter
+        self.chunk_frames = chunk_frames
+        self.device_channels = device_channels
+        self.pending = np.zeros((0, device_channels), dtype=np.int16)
+
+    def read(self, frames):
+        blocks = [self.pending]
+        queued = len(self.pending)
+        while queued < frames:
+            data = self.read_func(self.chunk_frames)
+            if data is None:
+                break
+            block = self.converter.process(data)
+            blocks.append(block)
+            queued += len(block)
+        self.pending = np.concatenate(blocks) if len(blocks) > 1 else self.pending
+        if queued < frames:
+            return None
+        out = self.pending[:frames]
+        self.pending = self.pending[frames:]
+        return out.tobytes()
@@ -0,0 +1,450 @@
+import importlib.util
+import io
+import os
+import queue
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from threading import Lock
+import numpy as np
+from .convert import FormatConverter
+from .network_output import wav_stream_header
+
+# seconds add_encoder waits for the worker to report the encoder started
+START_TIMEOUT = 10.0
+
+
+class ShmRing:
+    # Byte FIFO in shared memory for one producer process and one consumer process.
+    # Header: int64 write_pos, read_pos, capacity, overruns followed by four float64 stats.
+    HEADER = 64
+
+    def __init__(self, capacity=0, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.HEADER + capacity)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.cursors = np.ndarray((4,), dtype=np.int64, buffer=self.shm.buf[:32])
+        self.stats = np.ndarray((4,), dtype=np.float64, buffer=self.shm.buf[32:self.HEADER])
+        if self.owner:
+            self.cursors[:] = (0, 0, capacity, 0)
+            self.stats[:] = 0
+        self.capacity = int(self.cursors[2])
+        self.data = np.ndarray((self.capacity,), dtype=np.uint8, buffer=self.shm.buf[self.HEADER:])
+
+    def available(self):
+        return int(self.cursors[0] - self.cursors[1])
+
+    def write(self, data):
+        block = np.frombuffer(data, dtype=np.uint8)
+        count = len(block)
+        write_pos = int(self.cursors[0])
+        if count > self.capacity - (write_pos - int(self.cursors[1])):
+            self.cursors[3] += 1
+            return False
+        start = write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        if first < count:
+            self.data[:count - first] = block[first:]
+        self.cursors[0] = write_pos + count
+        return True
+
+    def read(self, limit=None):
+        read_pos = int(self.cursors[1])
+        count = int(self.cursors[0]) - read_pos
+        if limit is not None:
+            count = min(count, limit)
+        if count <= 0:
+            return b""
+        start = read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        data = self.data[start:start + first].tobytes()
+        if first < count:
+            data += self.data[:count - first].tobytes()
+        self.cursors[1] = read_pos + count
+        return data
+
+    def close(self, unlink=None):
+        # unlink defaults to owning the segment; an owner can leave it to the other side
+        del self.cursors, self.stats, self.data
+        try:
+            self.shm.close()
+        except BufferError:
+            # another thread still holds a view, the mapping goes away with it
+            pass
+        if self.owner if unlink is None else unlink:
+            self.unlink_name(self.name)
+
+    @staticmethod
+    def unlink_name(name):
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+class WavEncoder:
+    # PCM passthrough. Each encoder's header is kept out of its output and sent by
+    # the source on every connect instead.
+    content_type = "audio/wav"
+    module = None
+    # only a stream format that allows it, chained Ogg, gets a new header mid-stream
+    chains = False
+
+    def __init__(self, rate, channels, bitrate):
+        self.header = wav_stream_header(rate, channels)
+
+    def encode(self, pcm):
+        return pcm.tobytes()
+
+
+class Mp3Encoder:
+    content_type = "audio/mpeg"
+    module = "lameenc"
+    chains = False
+    header = b""
+
+    def __init__(self, rate, channels, bitrate):
+        import lameenc
+        self.encoder = lameenc.Encoder()
+        self.encoder.set_bit_rate(bitrate)
+        self.encoder.set_in_sample_rate(rate)
+        self.encoder.set_channels(channels)
+        self.encoder.set_quality(2)
+
+    def encode(self, pcm):
+        return bytes(self.encoder.encode(pcm.tobytes()))
+
+
+class OggEncoder:
+    content_type = "audio/ogg"
+    module = "soundfile"
+    chains = True
+    subtype = "VORBIS"
+    # rates the codec takes, None for any; others are resampled to the highest
+    rates = None
+    # libsndfile only takes a compression level, mapped from (kbps per channel, level) pairs;
+    # for vorbis the level is 1 - quality and these are libvorbis' nominal rates, it stays VBR
+    levels = ((32, 1.0), (40, 0.9), (48, 0.8), (56, 0.7), (64, 0.6), (80, 0.5), (96, 0.4), (112, 0.3),
+              (128, 0.2), (160, 0.1), (250, 0.0))
+
+    def __init__(self, rate, channels, bitrate):
+        import soundfile
+        self.channels = channels
+        file_rate = rate if self.rates is None or rate in self.rates else max(self.rates)
+        self.converter = FormatConverter(rate, channels, file_rate, channels) if file_rate != rate else None
+        self.buffer = io.BytesIO()
+        self.file = soundfile.SoundFile(self.buffer, "w", file_rate, channels, self.subtype, format="OGG",
+                                        compression_level=self.compression_level(bitrate, channels))
+        # libsndfile writes the header pages with the first frames, one silent frame
+        # brings them out on their own
+        self.file.write(np.zeros((1, channels), dtype=np.int16))
+        self.header = self.drain()
+
+    @classmethod
+    def compression_level(cls, bitrate, channels):
+        # nearest level for the requested kbps, clamped to what the codec reaches
+        kbps, levels = zip(*cls.levels)
+        return float(np.interp(bitrate / channels, kbps, levels))
+
+    def encode(self, pcm):
+        if self.converter is not None:
+            pcm = self.converter.process(pcm)
+        self.file.write(pcm.reshape(-1, self.channels))
+        return self.drain()
+
+    def drain(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class OpusEncoder(OggEncoder):
+    # libsndfile only accepts opus at 8/12/16/24/48 kHz, the engine's 44.1 kHz goes out at 48
+    subtype = "OPUS"
+    rates = (8000, 12000, 16000, 24000, 48000)
+    # measured with libsndfile 1.2.2 at 48 kHz, close to its 6 + 250 * (1 - level) kbps per channel
+    levels = ((7.0, 1.0), (32.3, 0.9), (70.1, 0.75), (108.0, 0.6), (133.0, 0.5), (195.9, 0.25), (258.0, 0.0))
+
+
+ENCODERS = {"wav": WavEncoder, "mp3": Mp3Encoder, "vorbis": OggEncoder, "opus": OpusEncoder}
+
+
+def start_encoder(in_name, out_name, encoder_class, bitrate, rate, channels):
+    rings = []
+    try:
+        for name in (in_name, out_name):
+            rings.append(ShmRing(name=name))
+        return rings[0], rings[1], encoder_class(rate, channels, bitrate)
+    except Exception:
+        for ring in rings:
+            ring.close()
+        raise
+
+
+def stop_encoder(entry):
+    if entry is not None:
+        entry[0].close()
+        entry[1].close()
+
+
+def encoder_worker(commands, replies, wake, rate, channels):
+    # Replies ("started", enc_id, header), ("failed", enc_id, reason) or ("removed", enc_id).
+    # One encoder failing, to start or later, only takes that encoder out. An Ogg encoder
+    # added again after a restart starts its output with its new header, chaining it on;
+    # the others carry on headerless and the source sends their header when it reconnects.
+    encoders = {}
+    while True:
+        while True:
+            try:
+                cmd = commands.get_nowait()
+            except queue.Empty:
+                break
+            if cmd[0] == "add":
+                _, enc_id, in_name, out_name, encoder_class, bitrate, chained = cmd
+                try:
+                    entry = encoders[enc_id] = start_encoder(in_name, out_name, encoder_class, bitrate, rate,
+                                                             channels)
+                except Exception as e:
+                    print("encoder", enc_id, "failed to start -", e)
+                    replies.put(("failed", enc_id, str(e)))
+                    continue
+                if chained and entry[2].chains:
+                    entry[1].write(entry[2].header)
+                replies.put(("started", enc_id, entry[2].header))
+            elif cmd[0] == "remove":
+                _, enc_id, names = cmd
+                stop_encoder(encoders.pop(enc_id, None))
+                replies.put(("removed", enc_id))
+                # the pool leaves the segments to this worker, so they are never gone
+                # before an "add" still in the queue has attached them
+                for name in names:
+                    ShmRing.unlink_name(name)
+            elif cmd[0] == "stop":
+                for entry in encoders.values():
+                    stop_encoder(entry)
+                return
+        wake.wait(0.05)
+        wake.clear()
+        for enc_id, (in_ring, out_ring, encoder) in list(encoders.items()):
+            data = in_ring.read()
+            if not data:
+                continue
+            pcm = np.frombuffer(data, dtype=np.int16)
+            start = time.perf_counter()
+            try:
+                out = encoder.encode(pcm)
+            except Exception as e:
+                print("encoder", enc_id, "failed -", e)
+                replies.put(("failed", enc_id, str(e)))
+                stop_encoder(encoders.pop(enc_id))
+                continue
+            # stats: frames encoded, seconds spent encoding
+            out_ring.stats[0] += len(pcm) // channels
+            out_ring.stats[1] += time.perf_counter() - start
+            if out:
+                out_ring.write(out)
+
+
+class EncoderHandle:
+    def __init__(self, pool, enc_id, worker, codec, bitrate, in_ring, out_ring):
+        self.pool = pool
+        self.enc_id = enc_id
+        self.worker = worker
+        self.codec = codec
+        self.bitrate = bitrate
+        self.content_type = ENCODERS[codec].content_type
+        self.in_ring = in_ring
+        self.out_ring = out_ring
+        # starting, running or failed, as the worker last replied
+        self.state = "starting"
+        self.error = None
+        self.header = None
+
+    def write(self, pcm):
+        self.in_ring.write(pcm)
+        self.pool.wakes[self.worker].set()
+
+    def read(self):
+        return self.out_ring.read()
+
+    def stream_header(self):
+        # what a source sends after each handshake, newest encoder's after a restart
+        return self.header
+
+    def real_time_factor(self):
+        frames = self.out_ring.stats[0]
+        if frames == 0:
+            return 0.0
+        return float(self.out_ring.stats[1] / (frames / self.pool.rate))
+
+    def close(self):
+        self.pool.remove_encoder(self)
+
+
+class EncoderPool:
+    # Runs encoders in worker processes so compression never competes with
+    # capture, routing or Tk for the GIL. PCM goes in and encoded bytes come out
+    # through shared memory rings, only control messages and replies use the queues.
+    # A worker that exits is restarted with its encoders by supervise().
+    def __init__(self, workers=None, rate=44100, channels=2, buffer_seconds=4):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.rate = rate
+        self.channels = channels
+        self.ring_bytes = rate * channels * 2 * buffer_seconds
+        self.context = mp.get_context("spawn")
+        self.processes = []
+        self.commands = []
+        self.wakes = []
+        self.load = []
+        self.replies = None
+        self.handles = {}
+        # enc_id -> (worker, segment names) until the worker confirms the remove
+        self.removing = {}
+        self.next_id = 0
+        self.restarts = 0
+        self.stopped = False
+        self.lock = Lock()
+
+    def start(self):
+        self.replies = self.context.Queue()
+        self.processes = [None] * self.workers
+        self.commands = [None] * self.workers
+        self.wakes = [None] * self.workers
+        self.load = [0] * self.workers
+        for worker in range(self.workers):
+            self.start_worker(worker)
+
+    def start_worker(self, worker):
+        commands = self.context.Queue()
+        wake = self.context.Event()
+        process = self.context.Process(target=encoder_worker, name="encoder_worker", daemon=True,
+                                       args=(commands, self.replies, wake, self.rate, self.channels))
+        process.start()
+        self.processes[worker] = process
+        self.commands[worker] = commands
+        self.wakes[worker] = wake
+
+    def send_add(self, handle, chained=False):
+        self.commands[handle.worker].put(("add", handle.enc_id, handle.in_ring.name, handle.out_ring.name,
+                                          ENCODERS[handle.codec], handle.bitrate, chained))
+
+    @staticmethod
+    def available_codecs():
+        return [c for c, e in ENCODERS.items() if e.module is None or importlib.util.find_spec(e.module)]
+
+    def add_encoder(self, codec, bitrate=128):
+        if codec not in self.available_codecs():
+            raise ValueError(f"codec {codec} is not available")
+        bitrate = int(bitrate)
+        with self.lock:
+            if not self.processes:
+                self.start()
+            worker = self.load.index(min(self.load))
+            enc_id = self.next_id
+            self.next_id += 1
+            handle = EncoderHandle(self, enc_id, worker, codec, bitrate, ShmRing(self.ring_bytes),
+                                   ShmRing(self.ring_bytes))
+            self.handles[enc_id] = handle
+            self.load[worker] += 1
+            self.send_add(handle)
+        if not self.wait_started(handle):
+            self.remove_encoder(handle)
+            raise ValueError(f"{codec} encoder failed to start - {handle.error}")
+        return handle
+
+    def wait_started(self, handle):
+        deadline = time.monotonic() + START_TIMEOUT
+        while handle.state == "starting":
+            if time.monotonic() > deadline or not self.processes[handle.worker].is_alive():
+                handle.error = handle.error or "no reply from the encoder worker"
+                return False
+            time.sleep(0.01)
+            self.poll_replies()
+        return handle.state == "running"
+
+    def remove_encoder(self, handle):
+        with self.lock:
+            if self.handles.pop(handle.enc_id, None) is None:
+                return
+            names = (handle.in_ring.name, handle.out_ring.name)
+            self.removing[handle.enc_id] = (handle.worker, names)
+            self.commands[handle.worker].put(("remove", handle.enc_id, names))
+            self.load[handle.worker] -= 1
+        # only this side's mapping goes, the worker unlinks the segments once it has let go
+        handle.in_ring.close(unlink=False)
+        handle.out_ring.close(unlink=False)
+
+    def poll_replies(self):
+        with self.lock:
+            while self.replies is not None:
+                try:
+                    reply = self.replies.get_nowait()
+                except queue.Empty:
+                    return
+                if reply[0] == "removed":
+                    self.removing.pop(reply[1], None)
+                    continue
+                handle = self.handles.get(reply[1])
+                if handle is None:
+                    continue
+                if reply[0] == "started":
+                    handle.state = "running"
+                    handle.header = reply[2]
+                else:
+                    handle.state = "failed"
+                    handle.error = reply[2]
+
+    def supervise(self):
+        # called about once a second from conn_manage
+        self.poll_replies()
+        for worker, process in enumerate(self.processes):
+            if self.stopped or process is None or process.is_alive():
+                continue
+            print("encoder worker", worker, "exited with code", process.exitcode, "- restarting")
+            process.join(1)
+            self.restarts += 1
+            with self.lock:
+                # segments of removed encoders it did not get to unlink
+                for enc_id, (removed_from, names) in list(self.removing.items()):
+                    if removed_from == worker:
+                        del self.removing[enc_id]
+                        for name in names:
+                            ShmRing.unlink_name(name)
+                self.start_worker(worker)
+                for handle in self.handles.values():
+                    if handle.worker != worker or handle.state == "failed":
+                        continue
+                    if handle.state == "starting":
+                        # it went down starting this one, which would only take the new worker down too
+                        handle.state = "failed"
+                        handle.error = "encoder worker exited while it started"
+                        continue
+                    handle.state = "starting"
+                    self.send_add(handle, chained=True)
+
+    def real_time_factors(self):
+        return {h.enc_id: h.real_time_factor() for h in self.handles.values()}
+
+    def stop(self):
+        self.stopped = True
+        for commands in self.commands:
+            commands.put(("stop",))
+        for process in self.processes:
+            process.join(1)
+        with self.lock:
+            for handle in list(self.handles.values()):
+                handle.in_ring.close()
+                handle.out_ring.close()
+            self.handles = {}
+            for _, names in self.removing.values():
+                for name in names:
+                    ShmRing.unlink_name(name)
+            self.removing = {}
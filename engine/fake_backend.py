@@ -0,0 +1,278 @@
+import heapq
+import time
+from threading import Thread, Lock, Event
+import numpy as np
+
+RAMP_WRAP = 32768
+# frames at the start of a block searched for a readable ramp sample
+RAMP_SEARCH = 16
+# length of the loopback delay line, which bounds loopback_delay
+LOOP_SECONDS = 4
+
+
+class FakeStream:
+    def __init__(self, backend, device, rate, channels, frames_per_buffer, callback):
+        self.backend = backend
+        self.device = device
+        self.rate = rate
+        self.channels = channels
+        self.frames = frames_per_buffer
+        self.period = frames_per_buffer / rate
+        self.callback = callback
+        self.active = True
+        self.due = 0.0
+        self.position = 0
+
+    def is_active(self):
+        return self.active
+
+    def start_stream(self):
+        self.active = True
+
+    def stop_stream(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+        self.backend.remove_stream(self)
+
+
+class FakeSource:
+    # Virtual capture device. "ramp" writes the capture frame number into the audio,
+    # low 15 bits on the first channel and the next 15 on the second, so a sink can
+    # tell exactly which captured frame it is playing. "tone" is a plain sine and
+    # "silence" digital silence; signal can be changed while the stream runs.
+    def __init__(self, index, name, signal="ramp", frequency=440.0):
+        self.index = index
+        self.name = name
+        self.signal = signal
+        self.frequency = frequency
+
+    def generate(self, start, frames, rate, channels, loop=None):
+        if loop is not None:
+            # what the outputs played loop_delay ago; each frame is heard once
+            index = np.arange(start, start + frames) % len(loop)
+            out = loop[index]
+            loop[index] = 0
+            return out.tobytes()
+        if self.signal == "silence":
+            return bytes(frames * channels * 2)
+        n = start + np.arange(frames, dtype=np.int64)
+        if self.signal == "tone":
+            wave = (np.sin(2 * np.pi * self.frequency * n / rate) * 16384).astype(np.int16)
+            return np.repeat(wave[:, None], channels, axis=1).tobytes()
+        out = np.zeros((frames, channels), dtype=np.int16)
+        out[:, 0] = n % RAMP_WRAP
+        if channels > 1:
+            out[:, 1] = (n // RAMP_WRAP) % RAMP_WRAP
+        return out.tobytes()
+
+
+class FakeSink:
+    # Virtual playback device. Every block it is handed is timestamped on the virtual
+    # clock; blocks carrying a ramp are decoded back to the frame they were captured at.
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.blocks = 0
+        self.silent = 0
+        self.dropped = 0
+        self.reordered = 0
+        self.last_frame = None
+        self.last_time = None
+
+    def reset(self):
+        self.blocks = self.silent = self.dropped = self.reordered = 0
+        self.last_frame = None
+
+    @staticmethod
+    def decode(block):
+        # the second channel steps and the first wraps at the same frame, and any
+        # resampling smears that edge, so read from a sample clear of it
+        for k in range(min(RAMP_SEARCH, len(block))):
+            low = int(block[k, 0])
+            if 4 <= low < RAMP_WRAP - 4:
+                return int(block[k, 1]) * RAMP_WRAP + low - k
+        return None
+
+    def receive(self, data, frames, channels, now, rate):
+        # returns the end to end latency of the block in seconds, or None
+        self.blocks += 1
+        self.last_time = now
+        block = np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+        if channels < 2 or not block.any():
+            if channels >= 2:
+                self.silent += 1
+            return None
+        frame = self.decode(block)
+        if frame is None:
+            return None
+        if self.last_frame is not None:
+            # the jitter buffer may stretch a block by a fraction of a percent
+            if frame < self.last_frame:
+                self.reordered += 1
+            elif frame > self.last_frame + frames + frames // 8:
+                self.dropped += 1
+        self.last_frame = frame
+        return now - frame / rate
+
+
+class FakeBackend:
+    # Stands in for the pyaudio module. It offers the same calls AudioEngine makes,
+    # PyAudio() returning itself, and runs every stream's callback from one driver
+    # thread on a virtual clock, so runs are repeatable and need no sound card.
+    # speed > 1 runs the clock faster than real time; open_delay makes opening a
+    # stream take as long as it does on a slow driver. With loopback_delay every input
+    # hears what the outputs played that many seconds earlier, like a cable from line
+    # out to line in, instead of its own signal.
+    paInt16 = 8
+    paContinue = 0
+    paComplete = 1
+
+    def __init__(self, inputs=2, outputs=2, rate=44100, channels=2, speed=1.0, signal="ramp",
+                 histogram_bins=20000, bin_width=0.0005, open_delay=0.0, loopback_delay=None):
+        self.rate = rate
+        self.channels = channels
+        self.speed = float(speed)
+        self.open_delay = open_delay
+        self.sources = [FakeSource(i, f"Fake Input {i}", signal, 220.0 * (1 + i % 8)) for i in range(inputs)]
+        self.sinks = [FakeSink(inputs + i, f"Fake Output {i}") for i in range(outputs)]
+        self.streams = set()
+        self.queue = []
+        self.order = 0
+        self.lock = Lock()
+        self.wake = Event()
+        self.running = False
+        self.thread = None
+        self.epoch = time.monotonic()
+        self.loop = None
+        self.loop_frames = 0
+        if loopback_delay is not None:
+            self.loop = np.zeros((rate * LOOP_SECONDS, channels), dtype=np.int16)
+            self.loop_frames = round(loopback_delay * rate)
+        # end to end latency histogram over all sinks, fixed size so a long run does not grow
+        self.bin_width = bin_width
+        self.histogram = np.zeros(histogram_bins, dtype=np.int64)
+        self.late = 0
+        self.overhead = 0.0
+
+    # pyaudio.PyAudio() interface
+
+    def PyAudio(self):
+        return self
+
+    def get_host_api_count(self):
+        return 1
+
+    def get_host_api_info_by_index(self, _index):
+        return {"name": "Fake", "deviceCount": len(self.sources) + len(self.sinks)}
+
+    def get_device_info_by_host_api_device_index(self, _api, dev):
+        if dev < len(self.sources):
+            return {"name": self.sources[dev].name, "index": dev, "maxInputChannels": self.channels,
+                    "maxOutputChannels": 0, "defaultSampleRate": float(self.rate)}
+        return {"name": self.sinks[dev - len(self.sources)].name, "index": dev, "maxInputChannels": 0,
+                "maxOutputChannels": self.channels, "defaultSampleRate": float(self.rate)}
+
+    def open(self, format=None, channels=2, rate=44100, frames_per_buffer=1024, input=False, output=False,
+             input_device_index=None, output_device_index=None, stream_callback=None):
+        if self.open_delay:
+            time.sleep(self.open_delay)
+        if input:
+            device = self.sources[input_device_index]
+        else:
+            device = self.sinks[output_device_index - len(self.sources)]
+        stream = FakeStream(self, device, rate, channels, frames_per_buffer, stream_callback)
+        now = self.clock()
+        # sources first at equal due times, so a block can be captured and played in one tick
+        stream.due = now + stream.period
+        stream.position = round(now * rate)
+        with self.lock:
+            self.streams.add(stream)
+            heapq.heappush(self.queue, (stream.due, 0 if input else 1, self.order, stream))
+            self.order += 1
+            if not self.running:
+                self.running = True
+                self.thread = Thread(name="fake_audio_thread", target=self.driver_thread, daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return stream
+
+    def terminate(self):
+        self.running = False
+        self.wake.set()
+
+    # virtual clock and driver
+
+    def clock(self):
+        return (time.monotonic() - self.epoch) * self.speed
+
+    def remove_stream(self, stream):
+        with self.lock:
+            self.streams.discard(stream)
+
+    def run_stream(self, stream, now):
+        if isinstance(stream.device, FakeSource):
+            start = time.thread_time()
+            data = stream.device.generate(stream.position - self.loop_frames, stream.frames, stream.rate,
+                                          stream.channels, self.loop)
+            self.overhead += time.thread_time() - start
+            stream.callback(data, stream.frames, None, 0)
+            stream.position += stream.frames
+            return
+        data, _flag = stream.callback(None, stream.frames, None, 0)
+        start = time.thread_time()
+        if self.loop is not None:
+            # a block handed over at `now` starts playing at `now`
+            index = np.arange(round(now * stream.rate), round(now * stream.rate) + stream.frames) % len(self.loop)
+            self.loop[index] = np.frombuffer(data, dtype=np.int16).reshape(-1, stream.channels)
+        latency = stream.device.receive(data, stream.frames, stream.channels, now, stream.rate)
+        if latency is not None:
+            self.histogram[min(max(int(latency / self.bin_width), 0), len(self.histogram) - 1)] += 1
+        self.overhead += time.thread_time() - start
+
+    def driver_thread(self):
+        while self.running:
+            with self.lock:
+                due = self.queue[0][0] if self.queue else None
+            if due is None:
+                self.wake.wait(0.1)
+                self.wake.clear()
+                continue
+            delay = (due - self.clock()) / self.speed
+            if delay > 0:
+                self.wake.wait(delay)
+                self.wake.clear()
+                continue
+            if -delay > 0.05:
+                # a callback ran more than 50 ms of real time late
+                self.late += 1
+            with self.lock:
+                _due, kind, order, stream = heapq.heappop(self.queue)
+                if stream not in self.streams:
+                    continue
+                stream.due = due + stream.period
+                heapq.heappush(self.queue, (stream.due, kind, order, stream))
+            if stream.active and stream.callback is not None:
+                self.run_stream(stream, due)
+
+    # results
+
+    def reset_stats(self):
+        for sink in self.sinks:
+            sink.reset()
+        self.histogram[:] = 0
+        self.late = 0
+        self.overhead = 0.0
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)):
+        total = self.histogram.sum()
+        if total == 0:
+            return {p: None for p in percentiles}
+        cumulative = np.cumsum(self.histogram)
+        return {p: (int(np.searchsorted(cumulative, total * p / 100.0)) + 0.5) * self.bin_width
+                for p in percentiles}
+
+    def sink_totals(self):
+        return {key: sum(getattr(sink, key) for sink in self.sinks)
+                for key in ("blocks", "silent", "dropped", "reordered")}
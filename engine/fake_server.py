@@ -0,0 +1,195 @@
+import asyncio
+import base64
+import socket
+from threading import Thread
+
+SERVER = "Icecast 2.4.4"
+MAX_REQUEST = 8192
+# receive buffer per source, kept small so a paused server pushes back quickly
+RECEIVE_BUFFER = 16 * 1024
+
+
+class FakeSource:
+    # What one source connection sent: the handshake, then the stream bytes
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.mount = None
+        self.headers = {}
+        self.data = bytearray()
+        self.connected = True
+
+
+class SourceProtocol(asyncio.Protocol):
+    # One source connection. "icecast" takes a PUT or SOURCE request with Basic auth,
+    # "shoutcast" a password line followed by icy headers; after either it only reads.
+    def __init__(self, server, kind):
+        self.server = server
+        self.kind = kind
+        self.transport = None
+        self.request = b""
+        self.source = None
+        self.streaming = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.server.transports.add(transport)
+        if self.server.paused:
+            transport.pause_reading()
+
+    def data_received(self, data):
+        if self.streaming:
+            self.source.data += data
+            return
+        self.request += data
+        if len(self.request) > MAX_REQUEST:
+            self.transport.close()
+        elif self.kind == "icecast":
+            self.read_icecast()
+        else:
+            self.read_shoutcast()
+
+    def read_icecast(self):
+        if b"\r\n\r\n" not in self.request:
+            return
+        head, rest = self.request.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+        headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+        if len(parts) == 3 and parts[0] == "GET" and parts[1].startswith(("/admin/metadata", "/admin.cgi")):
+            self.server.metadata.append(parts[1])
+            self.respond(200, "OK", close=True)
+            return
+        if len(parts) != 3 or parts[0] not in ("PUT", "SOURCE"):
+            self.respond(400, "Bad Request", close=True)
+            return
+        if headers.get("authorization") != self.server.auth_header():
+            self.server.refused += 1
+            self.respond(401, "Unauthorized", close=True)
+            return
+        self.start(parts[1], headers, rest)
+        self.respond(200, "OK")
+
+    def read_shoutcast(self):
+        if self.source is None:
+            if b"\r\n" not in self.request:
+                return
+            line, self.request = self.request.split(b"\r\n", 1)
+            password, _, sid = line.decode("latin-1").partition(":#")
+            if password != self.server.password:
+                self.server.refused += 1
+                self.transport.write(b"invalid password\r\n")
+                self.transport.close()
+                return
+            self.source = FakeSource("shoutcast")
+            self.source.mount = sid or "1"
+            self.transport.write(b"OK2\r\nicy-caps:11\r\n\r\n")
+        if b"\r\n\r\n" not in self.request:
+            return
+        head, rest = self.request.split(b"\r\n\r\n", 1)
+        headers = dict(line.split(":", 1) for line in head.decode("latin-1").split("\r\n") if ":" in line)
+        self.start(self.source.mount, {k.strip().lower(): v.strip() for k, v in headers.items()}, rest)
+
+    def start(self, mount, headers, rest):
+        if self.source is None:
+            self.source = FakeSource(self.kind)
+        self.source.mount = mount
+        self.source.headers = headers
+        self.source.data += rest
+        self.streaming = True
+        self.server.sources.append(self.source)
+
+    def respond(self, status, reason, close=False):
+        self.transport.write(f"HTTP/1.0 {status} {reason}\r\nServer: {SERVER}\r\n\r\n".encode())
+        if close:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.server.transports.discard(self.transport)
+        if self.source is not None:
+            self.source.connected = False
+
+
+class FakeSourceServer:
+    # Icecast and Shoutcast stand-in for tests: takes source connections on `port`
+    # (icecast PUT/SOURCE and icecast or shoutcast metadata updates) and port + 1
+    # (shoutcast v1/v2 sources) and keeps everything each one sent. pause() stops reading so sources see backpressure,
+    # kick() drops every connected source so they have to reconnect.
+    def __init__(self, password="hackme", user="source"):
+        self.password = password
+        self.user = user
+        self.sources = []
+        self.metadata = []
+        self.refused = 0
+        self.paused = False
+        self.transports = set()
+        self.servers = []
+        self.port = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(name="fake_source_server_thread", target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def auth_header(self):
+        return "Basic " + base64.b64encode(f"{self.user}:{self.password}".encode()).decode()
+
+    def start(self, port=0, host="127.0.0.1"):
+        # with port 0 any free pair of ports will do
+        for _ in range(20):
+            try:
+                self.servers = self.call(self.listen(port, host))
+                break
+            except OSError:
+                if port:
+                    raise
+        else:
+            raise OSError("no free pair of ports for the fake source server")
+        self.port = self.servers[0].sockets[0].getsockname()[1]
+        return self.port
+
+    async def listen(self, port, host):
+        icecast = await self.loop.create_server(lambda: SourceProtocol(self, "icecast"), host, port)
+        port = icecast.sockets[0].getsockname()[1]
+        try:
+            shoutcast = await self.loop.create_server(lambda: SourceProtocol(self, "shoutcast"), host, port + 1)
+        except OSError:
+            icecast.close()
+            raise
+        return [icecast, shoutcast]
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+
+    def pause(self):
+        self.loop.call_soon_threadsafe(self.set_paused, True)
+
+    def resume(self):
+        self.loop.call_soon_threadsafe(self.set_paused, False)
+
+    def set_paused(self, paused):
+        self.paused = paused
+        for transport in self.transports:
+            if paused:
+                transport.pause_reading()
+            else:
+                transport.resume_reading()
+
+    def kick(self):
+        def close():
+            for transport in list(self.transports):
+                transport.abort()
+        self.loop.call_soon_threadsafe(close)
+
+    def connected(self):
+        return [source for source in self.sources if source.connected]
+
+    def stop(self):
+        def close():
+            for server in self.servers:
+                server.close()
+            for transport in list(self.transports):
+                transport.abort()
+        self.loop.call_soon_threadsafe(close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,109 @@
+import time
+import numpy as np
+from .ring_buffer import RingBuffer
+
+
+class JitterBuffer:
+    # Sits between a route and its output device. It holds the fill level near the
+    # target latency by reading slightly faster or slower than the device plays,
+    # resampling each block by the estimated clock ratio instead of dropping or
+    # inserting whole blocks when the capture and playback clocks drift apart.
+    def __init__(self, capacity, target_frames, rate=44100, channels=2, max_ppm=5000, smoothing=0.01,
+                 response_time=30.0, clock=time.monotonic):
+        self.ring = RingBuffer(capacity, channels)
+        self.frame_bytes = self.ring.frame_bytes
+        self.channels = channels
+        self.rate = rate
+        self.target = max(1, int(target_frames))
+        self.max_deviation = max_ppm / 1e6
+        self.smoothing = smoothing
+        # critically damped PI loop on the normalized fill error, settling in about response_time seconds
+        self.kp = self.target / (rate * response_time)
+        self.ki = self.target / (4 * rate * response_time ** 2)
+        self.clock = clock
+        self.last_write = clock()
+        self.last_write_frames = 0
+        self.fill = float(self.target)
+        self.integral = 0.0
+        self.ratio = 1.0
+        self.primed = False
+        self.tail = np.zeros((0, channels), dtype=np.float32)
+        self.position = 1.0
+        self.underruns = 0
+        # set while the route is suspended for silence and writes nothing but zeros
+        self.silent = False
+        self.zeros = b""
+
+    def write(self, data):
+        written = self.ring.write(data)
+        self.last_write = self.clock()
+        self.last_write_frames = written
+        return written
+
+    def available(self):
+        return self.ring.available()
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+    @property
+    def dropped_frames(self):
+        return self.ring.dropped_frames
+
+    def latency_frames(self):
+        return self.fill
+
+    def update_ratio(self, frames):
+        # The producer delivers whole blocks, so the raw fill is a sawtooth that aliases
+        # against the device period. Crediting the audio produced since the last write
+        # turns it back into a smooth level the loop can follow.
+        in_flight = min((self.clock() - self.last_write) * self.rate, self.last_write_frames)
+        self.fill += self.smoothing * (self.ring.available() + in_flight - self.fill)
+        error = (self.fill - self.target) / self.target
+        self.integral += self.ki * error * frames / self.rate
+        self.integral = min(max(self.integral, -self.max_deviation), self.max_deviation)
+        deviation = min(max(self.kp * error + self.integral, -self.max_deviation), self.max_deviation)
+        self.ratio = 1.0 + deviation
+
+    def read(self, frames):
+        if not self.primed:
+            if self.ring.available() < self.target:
+                return None
+            self.primed = True
+            self.tail = np.zeros((2, self.channels), dtype=np.float32)
+            self.position = 1.0
+        self.update_ratio(frames)
+        positions = self.position + np.arange(frames) * self.ratio
+        need = int(positions[-1]) + 3 - len(self.tail)
+        if self.ring.available() < need:
+            # start again from the target fill rather than play a run of tiny fragments
+            self.underruns += 1
+            self.primed = False
+            return None
+        if self.silent:
+            return self.read_silent(frames, need)
+        new = np.frombuffer(self.ring.read(need), dtype=np.int16).reshape(-1, self.channels)
+        work = np.concatenate([self.tail, new.astype(np.float32)])
+        index = positions.astype(np.int64)
+        t = (positions - index)[:, None].astype(np.float32)
+        y0, y1, y2, y3 = work[index - 1], work[index], work[index + 1], work[index + 2]
+        # Catmull-Rom cubic between y1 and y2
+        out = y1 + 0.5 * t * (y2 - y0 + t * (2 * y0 - 5 * y1 + 4 * y2 - y3 + t * (3 * (y1 - y2) + y3 - y0)))
+        next_position = self.position + frames * self.ratio
+        keep = int(next_position) - 1
+        self.tail = work[keep:]
+        self.position = next_position - keep
+        return np.clip(out, -32768, 32767).astype(np.int16).tobytes()
+
+    def read_silent(self, frames, need):
+        # Only zeros are queued: consume them at the same rate as read() would, so the
+        # fill and the drift loop carry on, but skip the interpolation.
+        self.ring.skip(need)
+        next_position = self.position + frames * self.ratio
+        keep = int(next_position) - 1
+        self.tail = np.zeros((len(self.tail) + need - keep, self.channels), dtype=np.float32)
+        self.position = next_position - keep
+        if len(self.zeros) != frames * self.frame_bytes:
+            self.zeros = bytes(frames * self.frame_bytes)
+        return self.zeros
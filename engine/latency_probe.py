@@ -0,0 +1,139 @@
+import argparse
+import json
+import statistics
+from threading import Event
+import numpy as np
+from .audio_engine import AudioEngine
+from .streams import StreamEngine, LATENCY_PROFILES, device_names
+
+PULSE_FRAMES = 32
+PULSE_LEVEL = 29000
+# a pulse not heard back within this many seconds counts as lost
+PULSE_TIMEOUT = 1.0
+
+
+class LoopbackProbe:
+    # Plays a short full scale pulse on an output and waits for it on an input that is
+    # cabled (or routed) back from it. Both ends are timed on the audio engine's clock:
+    # an output callback hands its block over "now" and an input callback receives
+    # audio that ended "now", so the difference is the round trip a route sees,
+    # device buffers, driver and format conversion included.
+    def __init__(self, audio_engine, block_frames=256, threshold=0.1, interval=0.5):
+        self.audio_engine = audio_engine
+        self.clock = audio_engine.clock
+        self.rate = audio_engine.rate
+        self.channels = audio_engine.channels
+        self.block_frames = block_frames
+        self.threshold = int(threshold * 32768)
+        self.interval = interval
+        self.sent = None
+        self.next_pulse = 0.0
+        self.wanted = 0
+        self.results = []
+        self.lost = 0
+        self.done = Event()
+
+    def pulse(self, frames):
+        block = np.zeros((frames, self.channels), dtype=np.int16)
+        block[:PULSE_FRAMES] = PULSE_LEVEL
+        return block.tobytes()
+
+    def read(self, frames):
+        # output callback: the pulse starts at the first frame of the block
+        now = self.clock()
+        if self.sent is None and not self.done.is_set() and now >= self.next_pulse:
+            self.sent = now
+            return self.pulse(frames)
+        return None
+
+    def on_data(self, in_data):
+        # input callback
+        now = self.clock()
+        sent = self.sent
+        if sent is None:
+            return
+        block = np.frombuffer(in_data, dtype=np.int16).reshape(-1, self.channels)
+        hits = np.flatnonzero(np.abs(block.astype(np.int32)).max(axis=1) >= self.threshold)
+        if len(hits):
+            arrived = now - (len(block) - hits[0]) / self.rate
+            self.results.append(arrived - sent)
+        elif now - sent > PULSE_TIMEOUT:
+            self.lost += 1
+        else:
+            return
+        self.sent = None
+        self.next_pulse = now + self.interval
+        if len(self.results) + self.lost >= self.wanted:
+            self.done.set()
+
+    def measure(self, output_dev, input_dev, repeats=5):
+        # returns the round trip of every pulse heard, in seconds
+        self.wanted = repeats
+        self.results = []
+        self.lost = 0
+        self.done.clear()
+        # the first pulse waits an interval so both streams have settled
+        self.next_pulse = self.clock() + self.interval
+        source = self.audio_engine.open_input(input_dev, self.on_data, block_frames=self.block_frames)
+        sink = self.audio_engine.open_output(output_dev, self.read, block_frames=self.block_frames)
+        try:
+            self.done.wait(repeats * (self.interval + PULSE_TIMEOUT) + 2 * self.interval)
+        finally:
+            self.audio_engine.close_stream(sink)
+            self.audio_engine.close_stream(source)
+        return list(self.results)
+
+
+def summary(results, lost):
+    if not results:
+        return {"pulses": 0, "lost": lost, "min": None, "median": None, "max": None}
+    return {"pulses": len(results), "lost": lost, "min": min(results), "median": statistics.median(results),
+            "max": max(results)}
+
+
+def format_summary(s):
+    if not s["pulses"]:
+        return f"no pulse came back ({s['lost']} lost) - check the cable or routing and the threshold"
+    return f"round trip {s['median'] * 1000:.1f} ms median, {s['min'] * 1000:.1f} to {s['max'] * 1000:.1f} ms " \
+           f"over {s['pulses']} pulses, {s['lost']} lost"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="measure output -> input round trip latency with a loopback")
+    parser.add_argument("output", nargs="?", help="playback device, by name or list position")
+    parser.add_argument("input", nargs="?", help="capture device, by name or list position")
+    parser.add_argument("--profile", default="low", choices=sorted(LATENCY_PROFILES), help="block size profile")
+    parser.add_argument("--block-frames", type=int, help="block size, default from the profile")
+    parser.add_argument("--repeats", type=int, default=10, help="pulses to send")
+    parser.add_argument("--threshold", type=float, default=0.1, help="level that counts as the pulse (0..1)")
+    parser.add_argument("--fake-delay", type=float, help="measure a fake loopback with this delay (s) instead")
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args(argv)
+    backend = None
+    if args.fake_delay is not None:
+        from .fake_backend import FakeBackend
+        backend = FakeBackend(inputs=1, outputs=1, loopback_delay=args.fake_delay)
+        args.output = args.input = "0"
+    elif args.output is None or args.input is None:
+        parser.error("name an output and an input, see main.py --list-devices")
+    block_frames = args.block_frames or LATENCY_PROFILES[args.profile][0]
+    audio_engine = AudioEngine(block_frames, backend=backend)
+    devices = []
+    for d_type, name in (("playback", args.output), ("capture", args.input)):
+        dev_list = audio_engine.get_device_list(d_type)
+        list_index = StreamEngine.find_device(dev_list, int(name) if name.isdigit() else name)
+        if list_index is None:
+            parser.error(f"{d_type} device not found - {name}")
+        devices.append(dev_list[list_index][2])
+        print(d_type, "-", device_names(dev_list)[list_index])
+    probe = LoopbackProbe(audio_engine, block_frames, args.threshold)
+    try:
+        results = probe.measure(devices[0], devices[1], args.repeats)
+    finally:
+        audio_engine.terminate()
+    s = summary(results, probe.lost)
+    print(json.dumps(s, indent=2) if args.json else format_summary(s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import struct
+import time
+import urllib.parse
+from .listener_server import raise_open_file_limit
+
+# receive buffer of a stalled listener, kept small so the server sees it stall quickly
+STALLED_RCVBUF = 4096
+
+
+class ListenerStats:
+    __slots__ = ("connected", "failed", "cut_off", "first_byte", "received", "byte_rate", "stalled", "dropped")
+
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.cut_off = 0
+        self.first_byte = []
+        self.received = []
+        self.byte_rate = None
+        self.stalled = 0
+        self.dropped = 0
+
+
+def wav_byte_rate(data):
+    # the byte rate field of the fmt chunk, wherever the header landed in the first read
+    index = data.find(b"WAVEfmt ")
+    if index < 0 or len(data) < index + 24:
+        return None
+    return struct.unpack("<I", data[index + 20:index + 24])[0]
+
+
+async def open_listener(url, http10):
+    parts = urllib.parse.urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    version = "HTTP/1.0" if http10 else "HTTP/1.1"
+    writer.write(f"GET {parts.path or '/'} {version}\r\nHost: {parts.netloc}\r\n\r\n".encode())
+    status = await reader.readline()
+    fields = status.split()
+    if len(fields) < 2 or fields[1] != b"200":
+        writer.close()
+        raise ConnectionError(status.decode(errors="replace").strip() or "no response")
+    while (await reader.readline()).strip():
+        pass
+    return reader, writer
+
+
+async def listen(url, seconds, stats, http10):
+    # reads until `seconds` after connecting and counts what arrived, chunk framing included
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(open_listener(url, http10), 10)
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        stats.failed += 1
+        return
+    stats.connected += 1
+    deadline = started + seconds
+    received = 0
+    first = None
+    try:
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            data = await asyncio.wait_for(reader.read(65536), left)
+            if not data:
+                stats.cut_off += 1
+                break
+            if first is None:
+                first = time.monotonic()
+                stats.first_byte.append(first - started)
+                stats.byte_rate = stats.byte_rate or wav_byte_rate(data)
+            else:
+                received += len(data)
+    except asyncio.TimeoutError:
+        pass
+    except OSError:
+        stats.cut_off += 1
+    finally:
+        writer.close()
+    if first is not None and time.monotonic() > first:
+        # bytes per second after the first read, which carried the header
+        stats.received.append(received / (time.monotonic() - first))
+
+
+async def stall(url, seconds, stats, http10):
+    # connects and never reads, the server should drop it rather than queue for it
+    try:
+        reader, writer = await asyncio.wait_for(open_listener(url, http10), 10)
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        stats.failed += 1
+        return
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, STALLED_RCVBUF)
+    stats.stalled += 1
+    await asyncio.sleep(seconds)
+    # whatever the socket still holds comes first, then the end of stream if it was dropped;
+    # a listener the server kept feeding is still getting audio when the time is up
+    deadline = time.monotonic() + 2.0
+    try:
+        while time.monotonic() < deadline:
+            if not await asyncio.wait_for(reader.read(65536), 1.0):
+                stats.dropped += 1
+                break
+    except asyncio.TimeoutError:
+        pass
+    except OSError:
+        stats.dropped += 1
+    finally:
+        writer.close()
+
+
+async def run_load(urls, clients, seconds, stalled=0, http10=False, ramp=1.0):
+    # clients connect spread over `ramp` seconds and round robin over the urls
+    stats = ListenerStats()
+    tasks = []
+    for i in range(clients + stalled):
+        url = urls[i % len(urls)]
+        if i < clients:
+            tasks.append(asyncio.ensure_future(listen(url, seconds, stats, http10)))
+        else:
+            tasks.append(asyncio.ensure_future(stall(url, seconds, stats, http10)))
+        if ramp:
+            await asyncio.sleep(ramp / (clients + stalled))
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def summary(stats):
+    rates = sorted(stats.received)
+    real_time = [r / stats.byte_rate for r in rates] if stats.byte_rate else []
+    return {"connected": stats.connected, "failed": stats.failed,
+            "cut_off": stats.cut_off,
+            "real_time_min": real_time[0] if real_time else None,
+            "real_time_median": statistics.median(real_time) if real_time else None,
+            "first_byte_p50": statistics.median(stats.first_byte) if stats.first_byte else None,
+            "first_byte_max": max(stats.first_byte) if stats.first_byte else None,
+            "stalled": stats.stalled, "stalled_dropped": stats.dropped}
+
+
+def format_summary(s):
+    if s["real_time_min"] is None:
+        return f"no audio received, {s['connected']} connected, {s['failed']} failed to connect"
+    text = f"{s['connected']} listeners, {s['failed']} failed, {s['cut_off']} cut off; " \
+           f"received {s['real_time_median'] * 100:.1f}% of real time median, {s['real_time_min'] * 100:.1f}% min; " \
+           f"first byte {s['first_byte_p50'] * 1000:.0f} ms median, {s['first_byte_max'] * 1000:.0f} ms max"
+    if s["stalled"]:
+        text += f"; {s['stalled_dropped']} of {s['stalled']} stalled listeners dropped"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="connect many listeners to the listener server and measure them")
+    parser.add_argument("urls", nargs="+", help="mount urls, e.g. http://127.0.0.1:8080/s0.wav, used round robin")
+    parser.add_argument("--clients", type=int, default=100, help="listeners that read")
+    parser.add_argument("--stalled", type=int, default=0, help="extra listeners that connect and never read")
+    parser.add_argument("--seconds", type=float, default=10.0, help="time each listener stays connected")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which the listeners connect")
+    parser.add_argument("--http10", action="store_true", help="ask for HTTP/1.0 streams instead of chunked ones")
+    parser.add_argument("--json", action="store_true", help="print the result as json")
+    args = parser.parse_args(argv)
+    raise_open_file_limit()
+    stats = asyncio.run(run_load(args.urls, args.clients, args.seconds, args.stalled, args.http10, args.ramp))
+    s = summary(stats)
+    print(json.dumps(s, indent=2) if args.json else format_summary(s))
+
+
+if __name__ == "__main__":
+    main()
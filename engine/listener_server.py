@@ -0,0 +1,315 @@
+import asyncio
+import json
+import re
+import socket
+import struct
+from threading import Thread, Lock
+import numpy as np
+from .network_output import wav_stream_header, USER_AGENT
+
+# seconds of audio a mount keeps for its listeners
+MOUNT_SECONDS = 8.0
+# a listener this far behind is moved to the live edge once its socket drains
+SKIP_SECONDS = 2.0
+# a listener whose socket has not drained this far behind is dropped; has to stay well
+# under MOUNT_SECONDS so nothing a socket still holds is overwritten while it is queued
+DROP_SECONDS = 5.0
+# bytes a listener's transport may hold before it gets no more until it drains,
+# also the most one listener is handed at a time while catching up
+HIGH_WATER = 32 * 1024
+# kernel send buffer per listener, fixed so the kernel does not grow it to megabytes
+# for a stalled listener and hide it from the checks above
+SEND_BUFFER = 128 * 1024
+MAX_REQUEST = 8192
+MOUNT_PATH = re.compile(r"^/s?(\d+)(?:\.wav)?$")
+
+
+def raise_open_file_limit():
+    # every listener is a socket, lift the soft limit as far as the hard one allows
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ImportError, ValueError, OSError):
+        return None
+
+
+class Listener:
+    __slots__ = ("transport", "cursor", "chunked", "paused")
+
+    def __init__(self, transport, cursor, chunked):
+        self.transport = transport
+        self.cursor = cursor
+        self.chunked = chunked
+        self.paused = False
+
+
+class Mount:
+    # One route for every listener. The stream thread copies each block once into a
+    # shared byte ring; each listener only keeps a cursor into it and is sent
+    # memoryviews of the ring (chunked listeners one framed copy per block, shared by
+    # all of them), so fanning a block out copies nothing per listener unless the
+    # socket cannot take it all at once. Only the stream thread writes, everything
+    # else runs on the server's loop.
+    def __init__(self, server, s_id, rate, channels):
+        self.server = server
+        self.s_id = s_id
+        self.path = f"/s{s_id}.wav"
+        self.content_type = "audio/wav"
+        self.header = wav_stream_header(rate, channels)
+        # skips and catch up move in whole frames
+        self.align = channels * 2
+        self.capacity = int(MOUNT_SECONDS * rate) * self.align
+        self.skip_bytes = int(SKIP_SECONDS * rate) * self.align
+        self.drop_bytes = int(DROP_SECONDS * rate) * self.align
+        self.max_send = max(self.align, HIGH_WATER // self.align * self.align)
+        # allocated for the first listener, a route nobody listens to costs nothing
+        self.data = None
+        self.view = None
+        self.write_pos = 0
+        self.listeners = set()
+        self.scheduled = False
+        self.sent = 0
+        self.skips = 0
+        self.dropped = 0
+
+    def write(self, block):
+        # stream thread
+        if not self.listeners:
+            return
+        data = np.frombuffer(block, dtype=np.uint8)
+        count = len(data)
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        if first < count:
+            self.data[:count - first] = data[first:]
+        self.write_pos += count
+        if not self.scheduled:
+            self.scheduled = True
+            self.server.loop.call_soon_threadsafe(self.pump)
+
+    def add_listener(self, transport, chunked):
+        if self.data is None:
+            self.data = np.zeros(self.capacity, dtype=np.uint8)
+            self.view = memoryview(self.data)
+        # a new listener starts at the live edge
+        listener = Listener(transport, self.write_pos, chunked)
+        self.send(listener, self.header)
+        self.listeners.add(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        self.listeners.discard(listener)
+
+    def pump(self):
+        self.scheduled = False
+        end = self.write_pos
+        # listeners at the live edge all get the same bytes, they are framed once per pump
+        shared = {}
+        for listener in list(self.listeners):
+            self.feed(listener, end, shared)
+
+    def parts(self, cursor, count, chunked):
+        start = cursor % self.capacity
+        first = min(count, self.capacity - start)
+        views = [self.view[start:start + first]]
+        if first < count:
+            views.append(self.view[:count - first])
+        if chunked:
+            # one send per listener instead of three for the size line, data and end
+            return [b"".join([b"%x\r\n" % count, *views, b"\r\n"])]
+        return views
+
+    def feed(self, listener, end, shared=None):
+        behind = end - listener.cursor
+        if listener.paused:
+            if behind > self.drop_bytes:
+                self.drop(listener)
+            return
+        if behind > self.skip_bytes:
+            # it drained but fell too far behind to catch up, lose the gap instead
+            listener.cursor = end - min(self.max_send, behind)
+            behind = end - listener.cursor
+            self.skips += 1
+        if behind <= 0:
+            return
+        count = min(behind, self.max_send)
+        key = (listener.cursor, count, listener.chunked)
+        parts = shared.get(key) if shared is not None else None
+        if parts is None:
+            parts = self.parts(listener.cursor, count, listener.chunked)
+            if shared is not None:
+                shared[key] = parts
+        for part in parts:
+            listener.transport.write(part)
+        listener.cursor += count
+        self.sent += count
+
+    def drop(self, listener):
+        # reset rather than close, or the kernel keeps the unsent audio and the connection
+        # around for as long as the listener does not read
+        self.dropped += 1
+        self.listeners.discard(listener)
+        sock = listener.transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        listener.transport.abort()
+
+    def send(self, listener, data):
+        if listener.chunked:
+            listener.transport.write(b"%x\r\n%b\r\n" % (len(data), data))
+        else:
+            listener.transport.write(data)
+
+    def close(self):
+        for listener in list(self.listeners):
+            listener.transport.close()
+        self.listeners.clear()
+
+
+class ListenerProtocol(asyncio.Protocol):
+    # One HTTP connection: reads the request, then only writes
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.request = b""
+        self.mount = None
+        self.listener = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=HIGH_WATER)
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+
+    def data_received(self, data):
+        if self.listener is not None:
+            return
+        self.request += data
+        if b"\r\n\r\n" not in self.request:
+            if len(self.request) > MAX_REQUEST:
+                self.transport.close()
+            return
+        self.server.handle_request(self, self.request.split(b"\r\n\r\n", 1)[0])
+
+    def pause_writing(self):
+        if self.listener is not None:
+            self.listener.paused = True
+
+    def resume_writing(self):
+        if self.listener is not None:
+            self.listener.paused = False
+            # catch up now rather than at the next block
+            self.mount.feed(self.listener, self.mount.write_pos)
+
+    def connection_lost(self, exc):
+        if self.listener is not None:
+            self.mount.remove_listener(self.listener)
+            self.listener = None
+
+
+class ListenerServer:
+    # Serves every route straight to listeners over HTTP, WAV for now: /s<s_id>.wav
+    # for the audio and / for a json list of mounts. A single event loop thread
+    # drives every connection. HTTP/1.1 listeners get a chunked response, HTTP/1.0
+    # ones a stream that ends when the connection does.
+    def __init__(self, rate=44100, channels=2, max_listeners=10000):
+        self.rate = rate
+        self.channels = channels
+        self.max_listeners = max_listeners
+        self.mounts = {}
+        self.lock = Lock()
+        self.server = None
+        self.host = None
+        self.port = None
+        self.refused = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(name="listener_server_thread", target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def start(self, port=8080, host="0.0.0.0"):
+        raise_open_file_limit()
+        coro = self.loop.create_server(lambda: ListenerProtocol(self), host, port, backlog=1024)
+        self.server = asyncio.run_coroutine_threadsafe(coro, self.loop).result(10)
+        self.host = host
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"listeners on http://{host}:{self.port}/s<s_id>.wav")
+        return self.port
+
+    def mount(self, s_id):
+        with self.lock:
+            mount = self.mounts.get(s_id)
+            if mount is None:
+                mount = self.mounts[s_id] = Mount(self, s_id, self.rate, self.channels)
+        return mount
+
+    def remove_mount(self, s_id):
+        with self.lock:
+            mount = self.mounts.pop(s_id, None)
+        if mount is not None:
+            self.loop.call_soon_threadsafe(mount.close)
+
+    def listener_count(self):
+        return sum(len(mount.listeners) for mount in list(self.mounts.values()))
+
+    def handle_request(self, protocol, request):
+        lines = request.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or parts[0] not in ("GET", "HEAD"):
+            self.respond(protocol, 400, "Bad Request")
+            return
+        method, target, version = parts
+        path = target.split("?")[0]
+        if path == "/":
+            body = json.dumps({m.path: len(m.listeners) for m in list(self.mounts.values())}).encode()
+            self.respond(protocol, 200, "OK", body, "application/json", method == "HEAD")
+            return
+        match = MOUNT_PATH.match(path)
+        mount = self.mounts.get(int(match.group(1))) if match else None
+        if mount is None:
+            self.respond(protocol, 404, "Not Found")
+            return
+        if self.listener_count() >= self.max_listeners:
+            self.refused += 1
+            self.respond(protocol, 503, "Service Unavailable")
+            return
+        chunked = version == "HTTP/1.1"
+        head = f"{version} 200 OK\r\nServer: {USER_AGENT}\r\nContent-Type: {mount.content_type}\r\n" \
+               f"Cache-Control: no-cache, no-store\r\nConnection: close\r\n"
+        if chunked:
+            head += "Transfer-Encoding: chunked\r\n"
+        protocol.transport.write((head + "\r\n").encode())
+        if method == "HEAD":
+            protocol.transport.close()
+            return
+        protocol.mount = mount
+        protocol.listener = mount.add_listener(protocol.transport, chunked)
+
+    @staticmethod
+    def respond(protocol, status, reason, body=None, content_type="text/plain", head_only=False):
+        if body is None:
+            body = f"{status} {reason}\n".encode()
+        head = f"HTTP/1.0 {status} {reason}\r\nServer: {USER_AGENT}\r\nContent-Type: {content_type}\r\n" \
+               f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        protocol.transport.write(head.encode() + (b"" if head_only else body))
+        protocol.transport.close()
+
+    async def shutdown(self):
+        if self.server is not None:
+            self.server.close()
+        with self.lock:
+            mounts = list(self.mounts.values())
+            self.mounts.clear()
+        for mount in mounts:
+            mount.close()
+
+    def stop(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(5)
+        except (RuntimeError, TimeoutError, asyncio.TimeoutError):
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
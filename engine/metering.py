@@ -0,0 +1,129 @@
+from threading import Thread, Lock
+import time
+import numpy as np
+
+FULL_SCALE = 32768.0
+
+
+class MeterBank:
+    # Levels for every metered source live in one float32 array, one row per slot:
+    # per channel peak, rms and decaying peak hold (0..1 of full scale) then a clip count.
+    # Audio callbacks only hand over their latest block; update() meters all of them
+    # in a single vectorized pass so the cost per tick stays flat as sources grow.
+    def __init__(self, capacity=16, channels=2, hold_decay=0.9, clip_level=32767):
+        self.channels = channels
+        self.hold_decay = hold_decay
+        self.clip_level = clip_level
+        self.peak = slice(0, channels)
+        self.rms = slice(channels, 2 * channels)
+        self.hold = slice(2 * channels, 3 * channels)
+        self.clips = 3 * channels
+        self.levels = np.zeros((capacity, 3 * channels + 1), dtype=np.float32)
+        self.latest = [None] * capacity
+        self.in_use = np.zeros(capacity, dtype=bool)
+        self.lock = Lock()
+        self.running = False
+
+    def allocate(self):
+        with self.lock:
+            free = np.flatnonzero(~self.in_use)
+            if len(free) == 0:
+                capacity = len(self.in_use)
+                self.levels = np.concatenate([self.levels, np.zeros_like(self.levels)])
+                self.latest = self.latest + [None] * capacity
+                self.in_use = np.concatenate([self.in_use, np.zeros(capacity, dtype=bool)])
+                free = [capacity]
+            slot = int(free[0])
+            self.in_use[slot] = True
+            self.levels[slot] = 0
+            return slot
+
+    def release(self, slot):
+        with self.lock:
+            self.in_use[slot] = False
+            self.latest[slot] = None
+            self.levels[slot] = 0
+
+    def submit(self, slot, block):
+        self.latest[slot] = block
+
+    def measure(self, blocks):
+        # blocks: int16 array shaped (sources, frames, channels)
+        peak = np.maximum(blocks.max(axis=1), -blocks.min(axis=1).astype(np.int32)) / FULL_SCALE
+        x = blocks.astype(np.float32)
+        rms = np.sqrt(np.einsum("nfc,nfc->nc", x, x) / blocks.shape[1]) / FULL_SCALE
+        clips = np.count_nonzero(np.abs(x) >= self.clip_level, axis=(1, 2))
+        return peak, rms, clips
+
+    def update(self):
+        with self.lock:
+            levels = self.levels
+            pending = {}
+            for slot, block in enumerate(self.latest):
+                if block is not None:
+                    self.latest[slot] = None
+                    pending.setdefault(len(block), []).append((slot, block))
+            levels[:, self.hold] *= self.hold_decay
+            for group in pending.values():
+                slots = [s for s, _ in group]
+                blocks = np.stack([b for _, b in group]).reshape(len(group), -1, self.channels)
+                peak, rms, clips = self.measure(blocks)
+                levels[slots, self.peak] = peak
+                levels[slots, self.rms] = rms
+                levels[slots, self.clips] += clips
+                levels[slots, self.hold] = np.maximum(levels[slots, self.hold], peak)
+
+    def get_peak(self, slot):
+        return float(self.levels[slot, self.peak].max())
+
+    def start(self, interval=0.05):
+        self.running = True
+        Thread(name="meter_thread", target=self.meter_thread_func, args=[interval], daemon=True).start()
+
+    def meter_thread_func(self, interval):
+        while self.running:
+            time.sleep(interval)
+            self.update()
+
+    def stop(self):
+        self.running = False
+
+
+def block_peak(block):
+    # peak of one int16 block, 0..1 of full scale
+    samples = np.frombuffer(block, dtype=np.int16)
+    if len(samples) == 0:
+        return 0.0
+    return max(int(samples.max()), -int(samples.min())) / FULL_SCALE
+
+
+class SilenceDetector:
+    # Decides when a route's input has gone quiet from the peaks MeterBank already
+    # measures. Silence starts once the peak has stayed below the threshold for `hold`
+    # seconds and ends on the first peak above threshold + hysteresis, so a level
+    # hovering around the threshold does not flap between the two.
+    __slots__ = ("threshold", "resume", "hold", "below_since", "silent")
+
+    def __init__(self, threshold_db=-50.0, hold=10.0, hysteresis_db=6.0):
+        self.threshold = 10 ** (threshold_db / 20)
+        self.resume = 10 ** ((threshold_db + hysteresis_db) / 20)
+        self.hold = hold
+        self.below_since = None
+        self.silent = False
+
+    def update(self, peak, now):
+        # returns True when the input went silent, False when signal came back, else None
+        if self.silent:
+            if peak >= self.resume:
+                self.silent = False
+                self.below_since = None
+                return False
+            return None
+        if peak >= self.threshold:
+            self.below_since = None
+        elif self.below_since is None:
+            self.below_since = now
+        elif now - self.below_since >= self.hold:
+            self.silent = True
+            return True
+        return None
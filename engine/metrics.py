@@ -0,0 +1,170 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+# name: (type, help). Every exported sample has to be listed here.
+METRICS = {
+    "lion_stream_buffer_depth_frames": ("gauge", "Frames queued between capture and output"),
+    "lion_stream_overruns_total": ("counter", "Buffer overruns, by buffer"),
+    "lion_stream_underruns_total": ("counter", "Buffer underruns, by buffer"),
+    "lion_stream_dropped_frames_total": ("counter", "Frames lost to overruns, by buffer"),
+    "lion_stream_blocks_total": ("counter", "Blocks moved by the stream thread"),
+    "lion_stream_loop_seconds_total": ("counter", "Time the stream thread spent moving blocks"),
+    "lion_stream_loop_seconds_max": ("gauge", "Longest single block the stream thread has moved"),
+    "lion_stream_latency_seconds": ("gauge", "Audio queued between capture and output, in seconds"),
+    "lion_stream_drift_ppm": ("gauge", "Audio clock against wall clock since the first block"),
+    "lion_stream_clock_ratio_ppm": ("gauge", "Resampling ratio the jitter buffer uses to follow the output device"),
+    "lion_stream_active": ("gauge", "1 while the stream thread is running"),
+    "lion_stream_suspended": ("gauge", "1 while the stream is suspended because its input is silent"),
+    "lion_network_connected": ("gauge", "1 while the network output is connected"),
+    "lion_network_reconnects_total": ("counter", "Network output reconnect attempts"),
+    "lion_network_dropped_blocks_total": ("counter", "Encoded blocks dropped because the connection was behind"),
+    "lion_network_sent_bytes_total": ("counter", "Bytes sent to the server"),
+    "lion_listeners": ("gauge", "Listeners connected to the route's mount on the listener server"),
+    "lion_listener_sent_bytes_total": ("counter", "Audio bytes sent to listeners, counted once per listener"),
+    "lion_listener_skips_total": ("counter", "Times a listener that fell behind was moved to the live edge"),
+    "lion_listener_dropped_total": ("counter", "Listeners disconnected because their connection stalled"),
+    "lion_encoder_real_time_factor": ("gauge", "Encoder CPU time per second of audio"),
+    "lion_encoder_failed": ("gauge", "1 once the route's encoder failed to start or to encode"),
+    "lion_encoder_restarts_total": ("counter", "Encoder worker processes restarted after exiting"),
+    "lion_recording_written_bytes_total": ("counter", "Audio bytes written to recording segments"),
+    "lion_recording_segments_total": ("counter", "Recording segments started"),
+    "lion_recording_errors_total": ("counter", "Recording batches lost to write errors"),
+    "lion_device_xruns_total": ("counter", "Callbacks PortAudio flagged with an overflow or underflow"),
+    "lion_mixer_underruns_total": ("counter", "Mixer inputs that had no block ready"),
+    "lion_shard_restarts_total": ("counter", "Shard worker processes restarted after exiting or hanging"),
+}
+
+
+class StreamMetrics:
+    # Hot path counters for one stream. Only the stream's own thread writes them, so
+    # updates are plain attribute stores with no lock; readers may see a value one
+    # block old, which is fine for monitoring.
+    __slots__ = ("blocks", "frames", "loop_time", "loop_max", "first_block", "last_block")
+
+    def __init__(self):
+        self.blocks = 0
+        self.frames = 0
+        self.loop_time = 0.0
+        self.loop_max = 0.0
+        self.first_block = None
+        self.last_block = None
+
+    def restart(self):
+        # a new stream thread measures drift from its own first block
+        self.frames = 0
+        self.first_block = None
+
+    def block_done(self, frames, started):
+        now = time.perf_counter()
+        elapsed = now - started
+        if self.first_block is None:
+            self.first_block = now
+        else:
+            # the first block only starts the clock the drift is measured against
+            self.frames += frames
+            self.last_block = now
+        self.blocks += 1
+        self.loop_time += elapsed
+        if elapsed > self.loop_max:
+            self.loop_max = elapsed
+
+    def drift_ppm(self, rate):
+        if self.first_block is None or self.frames == 0:
+            return None
+        wall = self.last_block - self.first_block
+        return (self.frames / rate / wall - 1.0) * 1e6
+
+
+class MetricsRegistry:
+    # Collectors run only when the metrics are read, pulling counters the buffers
+    # and outputs keep anyway, so exporting adds nothing to the audio path.
+    def __init__(self):
+        self.streams = {}
+        self.collectors = []
+        self.server = None
+
+    def stream(self, s_id):
+        metrics = self.streams.get(s_id)
+        if metrics is None:
+            metrics = self.streams[s_id] = StreamMetrics()
+        return metrics
+
+    def add_collector(self, collector):
+        # collector() yields (name, labels, value)
+        self.collectors.append(collector)
+
+    def collect(self):
+        samples = []
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                if value is not None:
+                    samples.append((name, labels, value))
+        return samples
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        parts = []
+        for key, value in labels.items():
+            value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            parts.append(f'{key}="{value}"')
+        return "{" + ",".join(parts) + "}"
+
+    def render_prometheus(self):
+        grouped = {}
+        for name, labels, value in self.collect():
+            grouped.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, samples in grouped.items():
+            kind, help_text = METRICS[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{self.format_labels(labels)} {float(value):.9g}")
+        return "\n".join(lines) + "\n"
+
+    def render_json(self):
+        grouped = {}
+        for name, labels, value in self.collect():
+            grouped.setdefault(name, []).append({"labels": labels, "value": value})
+        return json.dumps(grouped)
+
+    def start_server(self, port=9101, host="127.0.0.1"):
+        # /metrics for Prometheus, /metrics.json for everything else
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = registry.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = registry.render_json().encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        Thread(name="metrics_server", target=self.server.serve_forever, daemon=True).start()
+        print(f"metrics on http://{host}:{self.server.server_port}/metrics")
+        return self.server
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,132 @@
+from threading import Thread, Lock
+import numpy as np
+from .ring_buffer import BroadcastRing
+
+
+class MixBus:
+    # Output side of a bus. It looks like a CaptureDevice to the rest of the engine:
+    # streams read it through ring readers and the VU meter uses its meter slot.
+    def __init__(self, bus_id, name, capacity, meters):
+        self.bus_id = bus_id
+        self.name = name
+        self.ring = BroadcastRing(capacity)
+        self.meters = meters
+        self.meter_slot = meters.allocate()
+        self.inputs = {}
+
+    def close(self):
+        self.meters.release(self.meter_slot)
+
+
+class Mixer:
+    # Sums capture devices into buses with per-input gain, mute and balance.
+    # All buses are mixed together each block with one matrix product in float32,
+    # then saturated back to int16.
+    def __init__(self, capture_hub, chunk_frames, buffer_chunks=50, channels=2, timeout=0.5):
+        self.capture_hub = capture_hub
+        self.chunk_frames = chunk_frames
+        self.capacity = chunk_frames * buffer_chunks
+        self.channels = channels
+        self.timeout = timeout
+        self.buses = {}
+        self.readers = {}
+        self.lock = Lock()
+        self.plan = None
+        self.running = False
+        self.thread = None
+        self.underruns = 0
+
+    def add_bus(self, bus_id, name=None):
+        with self.lock:
+            if bus_id not in self.buses:
+                self.buses[bus_id] = MixBus(bus_id, name or f"Bus {bus_id}", self.capacity, self.capture_hub.meters)
+            bus = self.buses[bus_id]
+        self.rebuild()
+        return bus
+
+    def remove_bus(self, bus_id):
+        with self.lock:
+            bus = self.buses.pop(bus_id, None)
+        if bus is None:
+            return
+        for dev_index in list(bus.inputs):
+            self.remove_input(bus_id, dev_index)
+        bus.close()
+        self.rebuild()
+
+    def set_input(self, bus_id, dev_index, gain=1.0, mute=False, pan=0.0):
+        with self.lock:
+            bus = self.buses[bus_id]
+            if dev_index not in self.readers:
+                self.readers[dev_index] = self.capture_hub.subscribe(dev_index)
+            bus.inputs[dev_index] = {"gain": float(gain), "mute": bool(mute), "pan": float(pan)}
+        self.rebuild()
+
+    def remove_input(self, bus_id, dev_index):
+        with self.lock:
+            bus = self.buses.get(bus_id)
+            if bus is None or bus.inputs.pop(dev_index, None) is None:
+                return
+            if not any(dev_index in b.inputs for b in self.buses.values()):
+                self.capture_hub.unsubscribe(dev_index, self.readers.pop(dev_index))
+        self.rebuild()
+
+    def rebuild(self):
+        # The mix thread picks up a new plan on its next block, so settings can change
+        # while it runs without taking a lock per block.
+        with self.lock:
+            dev_indexes = list(self.readers)
+            buses = list(self.buses.values())
+            gains = np.zeros((len(buses), len(dev_indexes), self.channels), dtype=np.float32)
+            for b, bus in enumerate(buses):
+                for i, dev_index in enumerate(dev_indexes):
+                    settings = bus.inputs.get(dev_index)
+                    if settings is None or settings["mute"]:
+                        continue
+                    pan = min(max(settings["pan"], -1.0), 1.0)
+                    gains[b, i] = settings["gain"] * np.array([min(1.0, 1.0 - pan), min(1.0, 1.0 + pan)])
+            readers = [self.readers[d] for d in dev_indexes]
+            self.plan = {"readers": readers, "buses": buses, "gains": gains,
+                         "inputs": np.zeros((len(readers), self.chunk_frames, self.channels), dtype=np.float32),
+                         "mix": np.zeros((len(buses), self.chunk_frames, self.channels), dtype=np.float32),
+                         "out": np.zeros((len(buses), self.chunk_frames, self.channels), dtype=np.int16)}
+            if buses and readers and not self.running:
+                self.running = True
+                self.thread = Thread(name="mixer_thread", target=self.mix_thread_func, daemon=True)
+                self.thread.start()
+
+    @staticmethod
+    def mix(gains, inputs, mix, out):
+        # gains (buses, inputs, channels), inputs (inputs, frames, channels) -> out (buses, frames, channels)
+        np.einsum("bic,ifc->bfc", gains, inputs, out=mix)
+        np.clip(mix, -32768, 32767, out=mix)
+        np.copyto(out, mix, casting="unsafe")
+        return out
+
+    def mix_thread_func(self):
+        print("mixer thread started")
+        while self.running:
+            plan = self.plan
+            readers = plan["readers"]
+            if not readers or not plan["buses"]:
+                self.running = False
+                break
+            # the first input paces the mixer, the others contribute whatever they have ready
+            if not readers[0].wait_for(self.chunk_frames, self.timeout):
+                continue
+            inputs = plan["inputs"]
+            for i, reader in enumerate(readers):
+                block = reader.read(self.chunk_frames)
+                if block is None:
+                    self.underruns += 1
+                    inputs[i] = 0
+                else:
+                    inputs[i] = np.frombuffer(block, dtype=np.int16).reshape(-1, self.channels)
+            out = self.mix(plan["gains"], inputs, plan["mix"], plan["out"])
+            for b, bus in enumerate(plan["buses"]):
+                bus.ring.write(out[b])
+                bus.meters.submit(bus.meter_slot, out[b].reshape(-1))
+        print("mixer thread ended")
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,229 @@
+import asyncio
+import base64
+import random
+import struct
+import urllib.parse
+from threading import Thread
+
+USER_AGENT = "LionMultiStreamer/0.8a"
+
+
+def wav_stream_header(rate=44100, channels=2, bits=16):
+    # WAV header with open ended sizes so raw PCM can be streamed after it
+    block_align = channels * bits // 8
+    return b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVEfmt " + \
+        struct.pack("<IHHIIHH", 16, 1, channels, rate, rate * block_align, block_align, bits) + \
+        b"data" + struct.pack("<I", 0xFFFFFFFF)
+
+
+def create_mount_config(protocol="icecast_put", host="localhost", port=8000, mount="/stream", password="",
+                        user="source", sid=1, name="Lion Multi Streamer", content_type="audio/wav", header=b""):
+    # header is sent after every handshake, either bytes or a function returning them
+    return {"protocol": protocol, "host": host, "port": int(port), "mount": mount, "password": password,
+            "user": user, "sid": int(sid), "name": name, "content_type": content_type, "header": header}
+
+
+class SourceClient:
+    # One source connection to an Icecast or Shoutcast server. All coroutines run on
+    # the NetworkOutput loop; send() and set_metadata() may be called from any thread.
+    def __init__(self, manager, config, queue_size=64, base_delay=1.0, max_delay=60.0):
+        self.manager = manager
+        self.config = config
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue(queue_size)
+        self.task = None
+        self.running = True
+        self.connected = False
+        self.attempts = 0
+        self.reconnects = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        # the latest title, sent again after every connect
+        self.song = None
+
+    def send(self, data):
+        if self.running:
+            self.manager.loop.call_soon_threadsafe(self.enqueue, data)
+
+    def enqueue(self, data):
+        if self.queue.full():
+            # drop the oldest block rather than grow without bound while the server is slow or away
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+
+    def set_metadata(self, song):
+        # servers only take metadata for a connected mount, otherwise it waits for the connect
+        self.song = song
+        if self.connected:
+            self.manager.submit(self.update_metadata(song))
+
+    def backoff_delay(self):
+        delay = min(self.max_delay, self.base_delay * (2 ** self.attempts))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def run(self):
+        while self.running:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(self.connect(), 10)
+                self.connected = True
+                self.attempts = 0
+                print("connected to", self.config["host"], self.config["port"], self.config["mount"])
+                if self.song:
+                    self.manager.track(asyncio.ensure_future(self.update_metadata(self.song)))
+                await self.pump(writer)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                print("source connection failed for", self.config["host"], self.config["mount"], "-", e)
+            finally:
+                self.connected = False
+                if writer is not None:
+                    writer.close()
+            if not self.running:
+                break
+            delay = self.backoff_delay()
+            self.attempts += 1
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+
+    async def connect(self):
+        c = self.config
+        if c["protocol"].startswith("icecast"):
+            reader, writer = await asyncio.open_connection(c["host"], c["port"])
+            await self.handshake_icecast(reader, writer)
+        else:
+            # shoutcast sources connect to the port after the listener port
+            reader, writer = await asyncio.open_connection(c["host"], c["port"] + 1)
+            await self.handshake_shoutcast(reader, writer)
+        header = c["header"]() if callable(c["header"]) else c["header"]
+        if header:
+            writer.write(header)
+        return reader, writer
+
+    def auth_header(self):
+        token = base64.b64encode(f"{self.config['user']}:{self.config['password']}".encode()).decode()
+        return "Authorization: Basic " + token + "\r\n"
+
+    async def handshake_icecast(self, reader, writer):
+        c = self.config
+        if c["protocol"] == "icecast_source":
+            request = f"SOURCE {c['mount']} HTTP/1.0\r\n"
+        else:
+            request = f"PUT {c['mount']} HTTP/1.1\r\nHost: {c['host']}:{c['port']}\r\n"
+        request += self.auth_header()
+        request += f"User-Agent: {USER_AGENT}\r\nContent-Type: {c['content_type']}\r\n" \
+                   f"Ice-Name: {c['name']}\r\nIce-Public: 0\r\n\r\n"
+        writer.write(request.encode())
+        await writer.drain()
+        status = await reader.readline()
+        parts = status.decode(errors="replace").split()
+        if len(parts) < 2 or parts[1] != "200":
+            raise ConnectionError("icecast refused source: " + status.decode(errors="replace").strip())
+        while (await reader.readline()).strip():
+            pass
+
+    async def handshake_shoutcast(self, reader, writer):
+        c = self.config
+        password = c["password"]
+        if c["protocol"] == "shoutcast_v2":
+            password += f":#{c['sid']}"
+        writer.write((password + "\r\n").encode())
+        await writer.drain()
+        status = await reader.readline()
+        if not status.startswith(b"OK"):
+            raise ConnectionError("shoutcast refused source: " + status.decode(errors="replace").strip())
+        while (await reader.readline()).strip():
+            pass
+        writer.write(f"icy-name:{c['name']}\r\nicy-pub:0\r\ncontent-type:{c['content_type']}\r\n\r\n".encode())
+        await writer.drain()
+
+    async def pump(self, writer):
+        while self.running:
+            data = await self.queue.get()
+            writer.write(data)
+            # drain only waits once the transport buffer is over its high water mark
+            await writer.drain()
+            self.bytes_sent += len(data)
+
+    async def update_metadata(self, song):
+        c = self.config
+        song = urllib.parse.quote(song)
+        if c["protocol"].startswith("icecast"):
+            mount = urllib.parse.quote(c["mount"])
+            request = f"GET /admin/metadata?mode=updinfo&mount={mount}&song={song} HTTP/1.0\r\n" + \
+                      self.auth_header()
+        else:
+            password = urllib.parse.quote(c["password"])
+            sid = f"&sid={c['sid']}" if c["protocol"] == "shoutcast_v2" else ""
+            request = f"GET /admin.cgi?pass={password}&mode=updinfo{sid}&song={song} HTTP/1.0\r\n"
+        request += f"User-Agent: {USER_AGENT}\r\n\r\n"
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(c["host"], c["port"]), 10)
+            writer.write(request.encode())
+            await writer.drain()
+            status = await asyncio.wait_for(reader.readline(), 10)
+            writer.close()
+            print("metadata update for", c["mount"], "-", status.decode(errors="replace").strip())
+        except (OSError, asyncio.TimeoutError) as e:
+            print("metadata update failed for", c["mount"], "-", e)
+
+    def stop(self):
+        self.running = False
+        if self.task is not None:
+            self.manager.loop.call_soon_threadsafe(self.task.cancel)
+
+
+class NetworkOutput:
+    # A single event loop thread drives every mount
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.clients = []
+        # every source and metadata task until it has finished, removed mounts included
+        self.tasks = set()
+        self.thread = Thread(name="network_output_thread", target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        async def run():
+            self.track(asyncio.current_task())
+            return await coro
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def track(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def add_mount(self, config, **kwargs):
+        client = SourceClient(self, config, **kwargs)
+
+        def start():
+            client.task = self.loop.create_task(client.run())
+            self.track(client.task)
+        self.loop.call_soon_threadsafe(start)
+        self.clients.append(client)
+        return client
+
+    def remove_mount(self, client):
+        client.stop()
+        if client in self.clients:
+            self.clients.remove(client)
+
+    async def shutdown(self):
+        # the sources have to see their cancellation through before the loop stops
+        for client in self.clients:
+            client.running = False
+        self.clients = []
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(5)
+        except (RuntimeError, TimeoutError, asyncio.TimeoutError):
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
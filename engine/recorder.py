@@ -0,0 +1,245 @@
+import importlib.util
+import os
+import struct
+import time
+from threading import Thread, Lock, Event
+import numpy as np
+from .ring_buffer import RingBuffer
+
+# RIFF sizes are 32 bit, keep 16 bit stereo segments well under 4 GiB
+WAV_MAX_SECONDS = 6 * 3600
+
+
+def wav_header(data_bytes, rate=44100, channels=2, bits=16):
+    block_align = channels * bits // 8
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_bytes, b"WAVE", b"fmt ", 16, 1, channels, rate,
+                       rate * block_align, block_align, bits, b"data", data_bytes)
+
+
+def preallocate(f, size):
+    # reserve the segment's space up front so the file does not fragment as it grows
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
+
+
+class WavSegment:
+    # The header always describes the data already on disk: it is patched after every
+    # batch, so a file cut short by a crash still opens and plays to the last batch.
+    # Closing patches it one last time and trims the preallocated tail.
+    extension = "wav"
+    module = None
+
+    def __init__(self, path, rate, channels, expected_frames):
+        self.rate = rate
+        self.channels = channels
+        self.data_bytes = 0
+        self.file = open(path, "wb", buffering=0)
+        preallocate(self.file, 44 + expected_frames * channels * 2)
+        self.file.write(wav_header(0, rate, channels))
+
+    def write(self, block):
+        self.file.seek(44 + self.data_bytes)
+        self.file.write(block)
+        self.data_bytes += block.nbytes
+        self.patch_header()
+
+    def patch_header(self):
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", 36 + self.data_bytes))
+        self.file.seek(40)
+        self.file.write(struct.pack("<I", self.data_bytes))
+
+    def close(self):
+        self.patch_header()
+        self.file.truncate(44 + self.data_bytes)
+        self.file.close()
+
+
+class FlacSegment:
+    # libsndfile writes the stream info on close; until then the frames already
+    # written still decode, so a crash loses at most the last batch
+    extension = "flac"
+    module = "soundfile"
+
+    def __init__(self, path, rate, channels, expected_frames):
+        import soundfile
+        self.file = soundfile.SoundFile(path, "w", rate, channels, "PCM_16", format="FLAC")
+
+    def write(self, block):
+        self.file.write(block)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+SEGMENTS = {"wav": WavSegment, "flac": FlacSegment}
+
+
+class Recording:
+    # One archived route. The stream thread only copies blocks into the ring; the
+    # recorder thread drains it in large batches and does all of the file work.
+    def __init__(self, directory, prefix, file_format="wav", segment_seconds=3600, rate=44100, channels=2,
+                 buffer_seconds=5.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_class = SEGMENTS[file_format]
+        if file_format == "wav":
+            segment_seconds = min(segment_seconds, WAV_MAX_SECONDS)
+        self.segment_seconds = segment_seconds
+        self.rate = rate
+        self.channels = channels
+        self.ring = RingBuffer(int(rate * buffer_seconds), channels)
+        self.segment = None
+        self.path = None
+        self.frames_left = 0
+        self.segment_frames = max(1, round(segment_seconds * rate))
+        self.start_time = None
+        self.start_offset = 0
+        # wall clock time of the boundary at or before start_time
+        self.origin = 0.0
+        self.frames_total = 0
+        self.segments = 0
+        self.bytes_written = 0
+        self.errors = 0
+
+    def write(self, data):
+        return self.ring.write(data)
+
+    def open_segment(self):
+        # Segments are cut by counting frames on a timeline anchored to the wall clock
+        # when recording began, so they fall on multiples of segment_seconds (on the hour
+        # for 3600) and every file holds exactly the audio between two boundaries.
+        if self.start_time is None:
+            self.start_time = time.time()
+            self.start_offset = round(self.start_time % self.segment_seconds * self.rate)
+            self.origin = self.start_time - self.start_time % self.segment_seconds
+        position = self.start_offset + self.frames_total
+        self.frames_left = self.segment_frames - position % self.segment_frames
+        if self.frames_total == 0:
+            begins = self.start_time
+        else:
+            # named after the boundary itself: frame counts divided back into seconds land
+            # a hair before it, and strftime truncates that to the second before
+            begins = round(self.origin + position // self.segment_frames * self.segment_seconds)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(begins))
+        extension = self.segment_class.extension
+        self.path = os.path.join(self.directory, f"{self.prefix}-{stamp}.{extension}")
+        if os.path.exists(self.path):
+            self.path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self.segments}.{extension}")
+        self.segment = self.segment_class(self.path, self.rate, self.channels, self.frames_left)
+        self.segments += 1
+        print("recording to", self.path)
+
+    def close_segment(self):
+        if self.segment is not None:
+            segment = self.segment
+            self.segment = None
+            segment.close()
+
+    def write_frames(self, block):
+        # split exactly on the segment boundary so consecutive files join without a gap
+        while len(block):
+            if self.segment is None:
+                self.open_segment()
+            count = min(len(block), self.frames_left)
+            self.segment.write(block[:count])
+            self.bytes_written += count * self.channels * 2
+            self.frames_left -= count
+            self.frames_total += count
+            block = block[count:]
+            if self.frames_left == 0:
+                self.close_segment()
+
+    def drain(self):
+        frames = self.ring.available()
+        if frames == 0:
+            return
+        block = np.frombuffer(self.ring.read(frames), dtype=np.int16).reshape(-1, self.channels)
+        try:
+            self.write_frames(block)
+        except OSError as e:
+            # disk full or gone: drop this batch and start a new segment next time
+            self.errors += 1
+            print("recording", self.prefix, "write failed -", e)
+            try:
+                self.close_segment()
+            except OSError:
+                self.segment = None
+        self.ring.release()
+
+    def close(self):
+        try:
+            self.drain()
+            self.close_segment()
+        except OSError as e:
+            print("recording", self.prefix, "close failed -", e)
+
+
+class Recorder:
+    # A single writer thread serves every recording, waking every `interval` seconds
+    # so each file gets one large write per batch instead of one per block.
+    def __init__(self, interval=0.5, rate=44100, channels=2):
+        self.interval = interval
+        self.rate = rate
+        self.channels = channels
+        self.recordings = []
+        self.closing = []
+        self.lock = Lock()
+        self.wake = Event()
+        self.running = True
+        self.thread = Thread(name="recorder_thread", target=self.writer_thread, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def available_formats():
+        return [f for f, s in SEGMENTS.items() if s.module is None or importlib.util.find_spec(s.module)]
+
+    def add_recording(self, directory, prefix, file_format="wav", segment_seconds=3600):
+        if file_format not in self.available_formats():
+            raise ValueError(f"format {file_format} is not available")
+        segment_seconds = float(segment_seconds)
+        if segment_seconds <= 0:
+            raise ValueError("segment length must be positive")
+        os.makedirs(directory, exist_ok=True)
+        recording = Recording(directory, prefix, file_format, segment_seconds, self.rate, self.channels)
+        with self.lock:
+            self.recordings.append(recording)
+        return recording
+
+    def remove_recording(self, recording):
+        # the writer thread drains and closes it, so no file is touched from two threads
+        with self.lock:
+            if recording in self.recordings:
+                self.recordings.remove(recording)
+                self.closing.append(recording)
+        self.wake.set()
+
+    def writer_thread(self):
+        print("recorder thread started")
+        while self.running:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            with self.lock:
+                recordings = list(self.recordings)
+                closing = self.closing
+                self.closing = []
+            for recording in recordings:
+                recording.drain()
+            for recording in closing:
+                recording.close()
+        with self.lock:
+            recordings = self.recordings + self.closing
+            self.recordings = []
+            self.closing = []
+        for recording in recordings:
+            recording.close()
+        print("recorder thread ended")
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join(5)
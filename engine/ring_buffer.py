@@ -0,0 +1,201 @@
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    # Fixed capacity FIFO of int16 frames. Safe for one producer thread and one
+    # consumer thread: the producer only moves write_pos, the consumer only moves
+    # read_pos, and both cursors count frames monotonically so no lock is needed.
+    def __init__(self, capacity, channels=2, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = self.dtype.itemsize * channels
+        self.data = np.zeros((self.capacity, channels), dtype=self.dtype)
+        self.scratch = np.zeros((self.capacity, channels), dtype=self.dtype)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.held = 0
+        self.overruns = 0
+        self.underruns = 0
+        self.dropped_frames = 0
+        self.data_ready = threading.Condition()
+        self.waiting = False
+
+    def available(self):
+        return self.write_pos - self.read_pos - self.held
+
+    def free(self):
+        return self.capacity - (self.write_pos - self.read_pos)
+
+    def as_frames(self, data):
+        if isinstance(data, np.ndarray):
+            return data.reshape(-1, self.channels)
+        return np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
+
+    def write(self, data):
+        frames = self.as_frames(data)
+        count = len(frames)
+        if count > self.free():
+            # never block the producer, the whole chunk is dropped to keep order intact
+            self.overruns += 1
+            self.dropped_frames += count
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        if first < count:
+            self.data[:count - first] = frames[first:]
+        self.write_pos += count
+        if self.waiting:
+            with self.data_ready:
+                self.data_ready.notify()
+        return count
+
+    def wait_for(self, frames, timeout=None):
+        # consumer side: block until `frames` frames can be read or timeout passes
+        if self.available() >= frames:
+            return True
+        with self.data_ready:
+            self.waiting = True
+            try:
+                return self.data_ready.wait_for(lambda: self.available() >= frames, timeout)
+            finally:
+                self.waiting = False
+
+    def read(self, frames):
+        # Returns a read-only memoryview of exactly `frames` frames, or None on underrun.
+        # The view stays valid until the next read() or release() by the consumer.
+        self.release()
+        if self.available() < frames:
+            self.underruns += 1
+            return None
+        start = self.read_pos % self.capacity
+        if start + frames <= self.capacity:
+            block = self.data[start:start + frames]
+        else:
+            first = self.capacity - start
+            block = self.scratch[:frames]
+            block[:first] = self.data[start:]
+            block[first:] = self.data[:frames - first]
+        self.held = frames
+        return memoryview(block).cast("B").toreadonly()
+
+    def release(self):
+        if self.held:
+            self.read_pos += self.held
+            self.held = 0
+
+    def skip(self, frames):
+        # consumer side: drops `frames` frames without copying them out
+        self.release()
+        if self.available() < frames:
+            self.underruns += 1
+            return 0
+        self.read_pos += frames
+        return frames
+
+    def clear(self):
+        # consumer side only
+        self.held = 0
+        self.read_pos = self.write_pos
+
+
+class BroadcastRing:
+    # One producer, any number of readers. The producer never waits on readers;
+    # each RingReader keeps its own cursor into the shared data and skips ahead
+    # (counting an overrun) if the producer laps it.
+    def __init__(self, capacity, channels=2, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = self.dtype.itemsize * channels
+        self.data = np.zeros((self.capacity, channels), dtype=self.dtype)
+        self.write_pos = 0
+        self.data_ready = threading.Condition()
+        self.waiting = 0
+
+    def write(self, data):
+        if isinstance(data, np.ndarray):
+            frames = data.reshape(-1, self.channels)
+        else:
+            frames = np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
+        count = len(frames)
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        if first < count:
+            self.data[:count - first] = frames[first:]
+        self.write_pos += count
+        if self.waiting:
+            with self.data_ready:
+                self.data_ready.notify_all()
+        return count
+
+    def reader(self):
+        return RingReader(self)
+
+
+class RingReader:
+    # Consumer side of a BroadcastRing with the same read API as RingBuffer.
+    # Views handed out by read() alias the shared data, so a reader has to finish
+    # with a block before the producer wraps around onto it.
+    def __init__(self, ring):
+        self.ring = ring
+        self.frame_bytes = ring.frame_bytes
+        self.read_pos = ring.write_pos
+        self.scratch = None
+        self.overruns = 0
+        self.underruns = 0
+        self.dropped_frames = 0
+
+    def available(self):
+        return self.ring.write_pos - self.read_pos
+
+    def catch_up(self):
+        behind = self.ring.write_pos - self.read_pos
+        if behind > self.ring.capacity:
+            self.overruns += 1
+            self.dropped_frames += behind - self.ring.capacity
+            self.read_pos = self.ring.write_pos - self.ring.capacity
+
+    def wait_for(self, frames, timeout=None):
+        if self.available() >= frames:
+            return True
+        ring = self.ring
+        with ring.data_ready:
+            ring.waiting += 1
+            try:
+                return ring.data_ready.wait_for(lambda: self.available() >= frames, timeout)
+            finally:
+                ring.waiting -= 1
+
+    def read(self, frames):
+        self.catch_up()
+        if self.available() < frames:
+            self.underruns += 1
+            return None
+        ring = self.ring
+        start = self.read_pos % ring.capacity
+        if start + frames <= ring.capacity:
+            block = ring.data[start:start + frames]
+        else:
+            if self.scratch is None or len(self.scratch) < frames:
+                self.scratch = np.zeros((frames, ring.channels), dtype=ring.dtype)
+            first = ring.capacity - start
+            block = self.scratch[:frames]
+            block[:first] = ring.data[start:]
+            block[first:] = ring.data[:frames - first]
+        self.read_pos += frames
+        return memoryview(block).cast("B").toreadonly()
+
+    def release(self):
+        pass
+
+    def keep_latest(self, frames):
+        # drops all but the newest `frames` frames
+        if self.available() > frames:
+            self.read_pos = self.ring.write_pos - frames
+
+    def clear(self):
+        self.read_pos = self.ring.write_pos
@@ -0,0 +1,365 @@
+import atexit
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from .encoder import ShmRing
+from .streams import STATE_STOPPED, STATE_STREAMING, STATE_NO_DEVICE, STATE_SUSPENDED
+
+MAX_ROUTES = 4096
+# per route row, written by the worker that runs the route
+ROUTE_FIELDS = ("state", "start_time", "level", "blocks", "overruns", "underruns")
+STATE, START_TIME, LEVEL, BLOCKS, OVERRUNS, UNDERRUNS = range(len(ROUTE_FIELDS))
+# per worker row: heartbeat (time.time()), pid, routes
+WORKER_FIELDS = ("heartbeat", "pid", "routes")
+HEARTBEAT_TIMEOUT = 10.0
+STATUS_INTERVAL = 0.05
+
+
+class SharedTable:
+    # float64 rows in shared memory. The supervisor owns it; each worker writes only
+    # the rows of its own routes, so no row has two writers.
+    def __init__(self, rows=0, columns=0, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(8, rows * columns * 8))
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            rows, columns = self.shm.size // 8 // columns, columns
+        self.name = self.shm.name
+        self.rows = np.ndarray((rows, columns), dtype=np.float64, buffer=self.shm.buf[:rows * columns * 8])
+        if self.owner:
+            self.rows[:] = 0
+
+    def close(self):
+        del self.rows
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+
+def route_state(engine, s_id):
+    info = engine.configured_streams[s_id]
+    if s_id in engine.deferred:
+        return STATE_NO_DEVICE
+    if info.state == "suspended":
+        return STATE_SUSPENDED
+    return STATE_STREAMING if info.state == "streaming" else STATE_STOPPED
+
+
+def write_status(engine, table, rows):
+    for s_id, row in rows.items():
+        info = engine.configured_streams.get(s_id)
+        if info is None:
+            continue
+        values = table.rows[row]
+        values[STATE] = route_state(engine, s_id)
+        values[START_TIME] = info.start_time
+        source = info.input_source
+        values[LEVEL] = source.meters.get_peak(source.meter_slot) if source is not None else 0.0
+        metrics = engine.metrics.streams.get(s_id)
+        values[BLOCKS] = metrics.blocks if metrics is not None else 0
+        overruns = underruns = 0
+        for buffer in (info.input_buffer, info.output_buffer):
+            if buffer is not None:
+                overruns += buffer.overruns
+                underruns += buffer.underruns
+        values[OVERRUNS] = overruns
+        values[UNDERRUNS] = underruns
+
+
+def apply_shard_config(engine, applied, buses, entries):
+    # Brings the worker's engine to the routes it was sent. Only entries that changed
+    # are touched, and a change of just active or keep does not reopen anything.
+    for bus_id, entry in buses.items():
+        if bus_id not in engine.mixer.buses:
+            engine.restore_bus(entry)
+    for s_id in list(applied):
+        if s_id not in entries:
+            engine.remove_stream(s_id)
+            del applied[s_id]
+    for s_id, entry in entries.items():
+        previous = applied.get(s_id)
+        if previous == entry:
+            continue
+        settings = {k: v for k, v in entry.items() if k not in ("active", "keep")}
+        if previous is not None and settings == {k: v for k, v in previous.items() if k not in ("active", "keep")}:
+            engine.set_active(s_id, entry.get("active", False))
+        else:
+            error = engine.restore_stream(entry)
+            if error is not None:
+                print("S_ID", s_id, "could not be started -", error)
+        applied[s_id] = entry
+
+
+def shard_worker(shard, commands, routes_name, workers_name, preview_name, backend_factory, quiet):
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    from .streams import StreamEngine
+    engine = StreamEngine(backend=backend_factory() if backend_factory is not None else None)
+    # one encoder process per shard, the shards already spread the load over the cores
+    engine.encoder_workers = 1
+    engine.start()
+    routes = SharedTable(columns=len(ROUTE_FIELDS), name=routes_name)
+    workers = SharedTable(columns=len(WORKER_FIELDS), name=workers_name)
+    preview_ring = ShmRing(name=preview_name)
+    parent = mp.parent_process()
+    applied = {}
+    rows = {}
+    print("shard", shard, "started, pid", os.getpid())
+    running = True
+    while running and (parent is None or parent.is_alive()):
+        try:
+            cmd = commands.get(timeout=STATUS_INTERVAL)
+        except queue.Empty:
+            cmd = None
+        if cmd is not None:
+            if cmd[0] == "config":
+                _, buses, entries, rows = cmd
+                apply_shard_config(engine, applied, buses, entries)
+            elif cmd[0] == "preview":
+                engine.set_preview_source(-1 if cmd[1] is None else cmd[1])
+            elif cmd[0] == "metadata":
+                engine.set_metadata(cmd[1], cmd[2])
+            elif cmd[0] == "stop":
+                running = False
+        reader = engine.preview_reader
+        block_frames = engine.preview_block_frames
+        while reader is not None and reader.available() >= block_frames:
+            preview_ring.write(reader.read(block_frames))
+        write_status(engine, routes, rows)
+        workers.rows[shard] = (time.time(), os.getpid(), len(rows))
+    engine.stop()
+    routes.close()
+    workers.close()
+    preview_ring.close()
+    print("shard", shard, "stopped")
+
+
+class ShardSupervisor:
+    # Spreads routes over worker processes, each running its own StreamEngine, so
+    # routes stop competing for one interpreter's GIL. Routes that share a device or
+    # a bus are kept in the same worker since a device can only be opened once.
+    # Control goes through queues; status, levels and preview audio come back through
+    # shared memory. Workers that die or stop answering are restarted with their routes.
+    def __init__(self, shards=None, backend_factory=None, rate=44100, channels=2):
+        self.shards = shards or max(1, (os.cpu_count() or 2) - 1)
+        self.backend_factory = backend_factory
+        self.frame_bytes = channels * 2
+        self.context = mp.get_context("spawn")
+        self.quiet = False
+        self.routes = SharedTable(MAX_ROUTES, len(ROUTE_FIELDS))
+        self.workers = SharedTable(self.shards, len(WORKER_FIELDS))
+        self.preview_rings = [ShmRing(rate * channels * 2) for _ in range(self.shards)]
+        self.processes = [None] * self.shards
+        self.commands = [None] * self.shards
+        # when each worker was started, the deadline for its first heartbeat
+        self.started = [0.0] * self.shards
+        self.buses = {}
+        self.entries = {}
+        self.placement = {}
+        self.slots = {}
+        self.free_slots = list(range(MAX_ROUTES - 1, -1, -1))
+        self.dirty = set()
+        self.preview_s_id = None
+        self.preview_shard = None
+        self.restarts = 0
+        self.stopped = False
+        # workers are not daemons, so without this an exception in the main thread would
+        # leave interpreter exit waiting on workers that wait on it
+        atexit.register(self.stop)
+
+    def start_worker(self, shard):
+        commands = self.context.Queue()
+        self.workers.rows[shard] = 0
+        # not a daemon: a shard starts its own encoder processes
+        process = self.context.Process(target=shard_worker, name=f"shard_{shard}",
+                                       args=(shard, commands, self.routes.name, self.workers.name,
+                                             self.preview_rings[shard].name, self.backend_factory, self.quiet))
+        process.start()
+        self.started[shard] = time.time()
+        self.processes[shard] = process
+        self.commands[shard] = commands
+        self.dirty.add(shard)
+
+    def set_config(self, buses, entries):
+        self.buses = dict(buses)
+        self.entries = {}
+        for s_id, entry in entries.items():
+            self.set_entry(s_id, entry)
+
+    def set_entry(self, s_id, entry):
+        if s_id not in self.slots:
+            if not self.free_slots:
+                raise ValueError(f"more than {MAX_ROUTES} routes")
+            self.slots[s_id] = self.free_slots.pop()
+            self.routes.rows[self.slots[s_id]] = 0
+        self.entries[s_id] = dict(entry)
+        self.dirty.add(self.placement.get(s_id))
+
+    def remove_entry(self, s_id):
+        if self.entries.pop(s_id, None) is None:
+            return
+        self.dirty.add(self.placement.pop(s_id, None))
+        self.free_slots.append(self.slots.pop(s_id))
+
+    def groups(self):
+        # union-find over routes, buses and the devices they use
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def union(a, b):
+            parent[find(a)] = find(b)
+
+        for bus_id, bus in self.buses.items():
+            for source in bus.get("inputs", []):
+                union(("bus", bus_id), ("input", source["input"]))
+        for s_id, entry in self.entries.items():
+            route = ("route", s_id)
+            find(route)
+            if entry.get("input_bus") is not None:
+                union(route, ("bus", entry["input_bus"]))
+            elif entry.get("input") is not None:
+                union(route, ("input", entry["input"]))
+            if entry.get("output_type", "hardware") == "hardware" and entry.get("output") is not None:
+                union(route, ("output", entry["output"]))
+        groups = {}
+        for s_id in self.entries:
+            groups.setdefault(find(("route", s_id)), []).append(s_id)
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def place(self):
+        # Groups stay on the shard they already run on so edits do not move working
+        # routes; new groups go to the least loaded shard, merged groups to the shard
+        # most of their routes were on.
+        load = [0] * self.shards
+        placement = {}
+        for group in self.groups():
+            current = [self.placement[s_id] for s_id in group if s_id in self.placement]
+            if current:
+                shard = max(set(current), key=current.count)
+            else:
+                shard = load.index(min(load))
+            load[shard] += len(group)
+            for s_id in group:
+                placement[s_id] = shard
+        for s_id, shard in placement.items():
+            old = self.placement.get(s_id)
+            if old != shard:
+                self.dirty.update((old, shard))
+        self.placement = placement
+        # the previewed route may only now be placed, or have moved; push() sends it to its shard
+        if self.preview_s_id is not None and placement.get(self.preview_s_id) != self.preview_shard:
+            if self.preview_shard is not None and self.commands[self.preview_shard] is not None:
+                self.commands[self.preview_shard].put(("preview", None))
+            self.preview_shard = placement.get(self.preview_s_id)
+            if self.preview_shard is not None:
+                self.preview_rings[self.preview_shard].read()
+                self.dirty.add(self.preview_shard)
+
+    def push(self, shard):
+        if self.processes[shard] is None:
+            self.start_worker(shard)
+        entries = {s_id: e for s_id, e in self.entries.items() if self.placement.get(s_id) == shard}
+        used = {e.get("input_bus") for e in entries.values()}
+        buses = {bus_id: b for bus_id, b in self.buses.items() if bus_id in used}
+        rows = {s_id: self.slots[s_id] for s_id in entries}
+        self.commands[shard].put(("config", buses, entries, rows))
+        if self.preview_shard == shard:
+            self.commands[shard].put(("preview", self.preview_s_id))
+
+    def supervise(self):
+        # called about once a second from conn_manage
+        now = time.time()
+        for shard, process in enumerate(self.processes):
+            if process is None:
+                continue
+            # a worker that hangs before its first heartbeat is timed from its start
+            heartbeat = self.workers.rows[shard, 0] or self.started[shard]
+            if process.is_alive() and now - heartbeat < HEARTBEAT_TIMEOUT:
+                continue
+            print("shard", shard, "exited" if not process.is_alive() else "stopped responding", "- restarting")
+            if process.is_alive():
+                process.kill()
+            process.join(1)
+            self.restarts += 1
+            self.start_worker(shard)
+        if self.dirty:
+            self.place()
+            dirty = self.dirty
+            self.dirty = set()
+            for shard in dirty:
+                if shard is not None:
+                    self.push(shard)
+
+    def status(self, s_id):
+        slot = self.slots.get(s_id)
+        if slot is None:
+            return None
+        return dict(zip(ROUTE_FIELDS, self.routes.rows[slot].tolist()))
+
+    def set_preview(self, s_id):
+        shard = self.placement.get(s_id) if s_id is not None else None
+        if self.preview_shard is not None and self.preview_shard != shard \
+                and self.commands[self.preview_shard] is not None:
+            self.commands[self.preview_shard].put(("preview", None))
+        self.preview_s_id = s_id
+        self.preview_shard = shard
+        if shard is not None and self.commands[shard] is not None:
+            ring = self.preview_rings[shard]
+            ring.read()
+            self.commands[shard].put(("preview", s_id))
+
+    def set_metadata(self, s_id, song):
+        shard = self.placement.get(s_id)
+        if shard is None or self.commands[shard] is None:
+            return False
+        self.commands[shard].put(("metadata", s_id, song))
+        return True
+
+    def preview_read(self, frames):
+        if self.preview_shard is None:
+            return None
+        ring = self.preview_rings[self.preview_shard]
+        count = frames * self.frame_bytes
+        backlog = ring.available() - count
+        if backlog > 3 * count:
+            # the preview plays the newest audio, not everything that queued up
+            ring.read(backlog)
+        if ring.available() < count:
+            return None
+        return ring.read(count)
+
+    def worker_pids(self):
+        return [p.pid for p in self.processes if p is not None and p.is_alive()]
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        atexit.unregister(self.stop)
+        for commands in self.commands:
+            if commands is not None:
+                commands.put(("stop",))
+        for process in self.processes:
+            if process is not None:
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+        self.routes.close()
+        self.workers.close()
+        for ring in self.preview_rings:
+            ring.close()
@@ -0,0 +1,1017 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+import itertools
+import json
+import os
+import time
+from .capture_hub import CaptureHub
+from .audio_engine import AudioEngine
+from .mixer import Mixer
+from .jitter import JitterBuffer
+from .metering import SilenceDetector, block_peak
+from .metrics import MetricsRegistry
+
+CHUNK_FRAMES = 2048
+BUFFER_CHUNKS = 50
+WAIT_TIMEOUT = 0.5
+TARGET_LATENCY = 0.2
+# (block frames, target latency in seconds) per profile; "low" is for live monitoring
+LATENCY_PROFILES = {"normal": (CHUNK_FRAMES, TARGET_LATENCY), "low": (256, 0.03)}
+PREVIEW_PROFILE = "low"
+# the preview plays the newest audio, older backlog past this many blocks is dropped
+PREVIEW_BACKLOG_BLOCKS = 4
+CONFIG_VERSION = 1
+DEFAULT_CONFIG = "streams.json"
+# streams restored at once on start; the audio engine opens their devices one at a time
+RESTORE_WORKERS = 16
+DEVICE_RETRY_INTERVAL = 10
+# silence detection defaults, used once a route sets silence_threshold (dBFS)
+SILENCE_HOLD = 10.0
+SILENCE_HYSTERESIS = 6.0
+# route events queued for the GUI status line, the oldest go first if nobody reads them
+EVENT_HISTORY = 100
+# stream thread states, see StreamState
+IDLE = "idle"
+STARTING = "starting"
+STREAMING = "streaming"
+STOPPING = "stopping"
+SUSPENDED = "suspended"
+# route states as shard workers report them in shared memory, see engine.shards
+STATE_STOPPED, STATE_STREAMING, STATE_NO_DEVICE, STATE_SUSPENDED = 0, 1, 2, 3
+
+
+class StreamState:
+    # One configured route. The stream thread reads it once per block, so the fields
+    # are slots rather than dict keys. state only moves idle -> starting (conn_manage
+    # starts the thread) -> streaming (the thread runs) -> stopping (conn_manage ends
+    # it) -> idle (the thread has exited); note says why an idle route is not running.
+    # The thread moves a streaming route to suspended and back as its input goes silent.
+    __slots__ = ("s_id", "input_name", "input_list_index", "input_source", "input_buffer", "input_dev_index",
+                 "input_bus", "output_name", "output_list_index", "output_source", "output_buffer",
+                 "output_dev_index", "output_type", "host", "port", "mount", "password", "protocol", "sid", "codec",
+                 "bitrate", "encoder", "latency", "block_frames", "directory", "record_format", "segment_seconds",
+                 "silence_threshold", "silence_hold", "silence_hysteresis", "silent_since",
+                 "keep", "active", "state", "note", "preview", "start_time")
+
+    def __init__(self, s_id):
+        self.s_id = s_id
+        self.input_name = None
+        self.input_list_index = None
+        self.input_source = None
+        self.input_buffer = None
+        self.input_dev_index = None
+        self.input_bus = None
+        self.output_name = None
+        self.output_list_index = None
+        self.output_source = None
+        self.output_buffer = None
+        self.output_dev_index = None
+        self.output_type = "hardware"
+        self.host = ""
+        self.port = ""
+        self.mount = ""
+        self.password = ""
+        self.protocol = ""
+        self.sid = ""
+        self.codec = "wav"
+        self.bitrate = "128"
+        self.encoder = None
+        self.latency = TARGET_LATENCY
+        self.block_frames = CHUNK_FRAMES
+        self.directory = ""
+        self.record_format = "wav"
+        self.segment_seconds = 3600
+        self.silence_threshold = None
+        self.silence_hold = SILENCE_HOLD
+        self.silence_hysteresis = SILENCE_HYSTERESIS
+        self.silent_since = 0
+        self.keep = False
+        self.active = False
+        self.state = IDLE
+        self.note = ""
+        self.preview = False
+        self.start_time = 0
+
+    def update(self, values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+
+def create_s_id_info(s_id):
+    print("creating new s_id", s_id)
+    return StreamState(s_id)
+
+
+def device_names(dev_list):
+    return [str(dev[0]) + ": " + str(dev[1]) for dev in dev_list]
+
+
+class StreamEngine:
+    # Everything that moves audio: devices, streams, routing and outputs.
+    # It has no GUI dependencies so it can run headless or behind the tkinter client.
+    # With shards > 0 the routes run in worker processes (engine.shards) and this engine
+    # only keeps their settings, the device lists and the preview output.
+    # backend_factory() makes the audio backend in each worker and here.
+    def __init__(self, backend=None, shards=0, backend_factory=None):
+        if backend is None and backend_factory is not None:
+            backend = backend_factory()
+        self.configured_streams = {}
+        # s_id -> run number of its stream thread; a thread runs while its number is here
+        self.active_streams = {}
+        self.runs = itertools.count(1)
+        # s_ids whose active flag changed, for conn_manage to start or stop
+        self.pending = set()
+        self.audio_engine = AudioEngine(CHUNK_FRAMES, backend=backend)
+        self.capture_hub = CaptureHub(self.audio_engine, BUFFER_CHUNKS)
+        self.mixer = Mixer(self.capture_hub, CHUNK_FRAMES, BUFFER_CHUNKS)
+        self.network_output = None
+        self.encoder_pool = None
+        self.encoder_workers = None
+        self.recorder = None
+        self.listener_server = None
+        self.preview_device = {}
+        self.preview_reader = None
+        self.preview_dev_index = None
+        self.preview_block_frames = LATENCY_PROFILES[PREVIEW_PROFILE][0]
+        self.sid_to_preview = -1
+        self.p_dev_list = self.audio_engine.get_device_list("playback")
+        self.c_dev_list = self.audio_engine.get_device_list("capture")
+        self.conn_manage_thread = None
+        self.running = False
+        self.lock = Lock()
+        # s_id -> the parts of its saved config whose devices were missing
+        self.deferred = {}
+        self.metrics = MetricsRegistry()
+        # (time, s_id, text) of silence and resume events, newest last, until the GUI takes them
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.metrics.add_collector(self.collect_metrics)
+        self.supervisor = None
+        # sharded mode: s_id -> route settings and bus_id -> bus settings, as in the config file
+        self.shard_entries = {}
+        self.shard_buses = {}
+        if shards:
+            from .shards import ShardSupervisor
+            self.supervisor = ShardSupervisor(shards, backend_factory, self.audio_engine.rate,
+                                              self.audio_engine.channels)
+
+    def start(self):
+        self.running = True
+        self.conn_manage_thread = Thread(name="conn_manage_thread", target=self.conn_manage, daemon=True)
+        self.conn_manage_thread.start()
+
+    def stop(self):
+        self.running = False
+        self.metrics.stop_server()
+        self.active_streams.clear()
+        self.mixer.stop()
+        self.capture_hub.meters.stop()
+        if self.network_output is not None:
+            self.network_output.stop()
+        if self.encoder_pool is not None:
+            self.encoder_pool.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.listener_server is not None:
+            self.listener_server.stop()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        self.audio_engine.terminate()
+
+    def get_network_output(self):
+        with self.lock:
+            if self.network_output is None:
+                from .network_output import NetworkOutput
+                self.network_output = NetworkOutput()
+        return self.network_output
+
+    def get_encoder_pool(self):
+        with self.lock:
+            if self.encoder_pool is None:
+                from .encoder import EncoderPool
+                self.encoder_pool = EncoderPool(workers=self.encoder_workers)
+        return self.encoder_pool
+
+    def get_recorder(self):
+        with self.lock:
+            if self.recorder is None:
+                from .recorder import Recorder
+                self.recorder = Recorder(rate=self.audio_engine.rate, channels=self.audio_engine.channels)
+        return self.recorder
+
+    def start_listener_server(self, port=8080, host="0.0.0.0", max_listeners=10000):
+        # serves every route in this process to listeners over http, see engine.listener_server
+        if self.supervisor is not None:
+            print("listener server is not available with shards, the audio stays in the workers")
+            return None
+        with self.lock:
+            if self.listener_server is None:
+                from .listener_server import ListenerServer
+                server = ListenerServer(self.audio_engine.rate, self.audio_engine.channels, max_listeners)
+                try:
+                    server.start(port, host)
+                except OSError:
+                    server.stop()
+                    raise
+                self.listener_server = server
+        return self.listener_server
+
+    @staticmethod
+    def available_record_formats():
+        from .recorder import Recorder
+        return Recorder.available_formats()
+
+    @staticmethod
+    def available_codecs():
+        from .encoder import EncoderPool
+        return EncoderPool.available_codecs()
+
+    def get_stream(self, s_id):
+        if s_id not in self.configured_streams:
+            self.configured_streams[s_id] = create_s_id_info(s_id)
+        return self.configured_streams[s_id]
+
+    def input_names(self):
+        # capture devices first, then mix buses, in the order set_input_device() indexes them
+        return device_names(self.c_dev_list) + [bus.name for bus in self.mixer.buses.values()]
+
+    def set_input_device(self, s_id, list_index):
+        info = self.get_stream(s_id)
+        if info.input_list_index == list_index:
+            print("this input already running")
+            return
+        if self.supervisor is not None:
+            name = self.input_names()[list_index]
+            if list_index >= len(self.c_dev_list):
+                changes = {"input_bus": list(self.mixer.buses)[list_index - len(self.c_dev_list)], "input": None}
+            else:
+                changes = {"input": name, "input_bus": None}
+            self.update_shard_entry(s_id, changes, input_list_index=list_index, input_name=name)
+            return
+        if list_index >= len(self.c_dev_list):
+            bus = list(self.mixer.buses.values())[list_index - len(self.c_dev_list)]
+            self.release_input(info)
+            info.input_bus = bus.bus_id
+            info.input_source = bus
+            info.input_buffer = bus.ring.reader()
+            dev_name = bus.name
+        else:
+            dev_index = self.c_dev_list[list_index][2]
+            reader = self.capture_hub.subscribe(dev_index, info.block_frames)
+            self.release_input(info)
+            info.input_dev_index = dev_index
+            info.input_source = self.capture_hub.get_device(dev_index)
+            info.input_buffer = reader
+            dev_name = f"{self.c_dev_list[list_index][0]} {self.c_dev_list[list_index][1]}"
+        info.input_list_index = list_index
+        info.input_name = dev_name
+        self.clear_deferred(s_id, "input")
+        print(f"SID {s_id} Input Device - {dev_name}")
+        if self.sid_to_preview == s_id:
+            self.set_preview_source(s_id)
+
+    def release_input(self, info):
+        if info.input_dev_index is not None:
+            self.capture_hub.unsubscribe(info.input_dev_index, info.input_buffer)
+        info.input_dev_index = None
+        info.input_bus = None
+
+    def close_output(self, info):
+        if info.output_source is None:
+            return
+        if info.output_type == "hardware":
+            self.audio_engine.close_stream(info.output_source)
+        elif info.output_type == "recording":
+            self.recorder.remove_recording(info.output_source)
+        else:
+            self.network_output.remove_mount(info.output_source)
+            encoder = info.encoder
+            info.encoder = None
+            if encoder is not None:
+                encoder.close()
+        info.output_source = None
+        info.output_buffer = None
+        info.output_dev_index = None
+
+    def set_hardware_output(self, s_id, list_index):
+        info = self.get_stream(s_id)
+        if info.output_type == "hardware" and info.output_list_index == list_index:
+            print("this output already running")
+            return
+        if self.supervisor is not None:
+            name = device_names(self.p_dev_list)[list_index]
+            self.update_shard_entry(s_id, {"output_type": "hardware", "output": name}, output_type="hardware",
+                                    output_list_index=list_index, output_name=name)
+            return
+        dev_index = self.p_dev_list[list_index][2]
+        self.close_output(info)
+        info.output_type = "hardware"
+        out_buffer = JitterBuffer(CHUNK_FRAMES * BUFFER_CHUNKS, info.latency * self.audio_engine.rate,
+                                  self.audio_engine.rate, clock=self.audio_engine.clock)
+        info.output_list_index = list_index
+        info.output_dev_index = dev_index
+        info.output_buffer = out_buffer
+        info.output_source = self.audio_engine.open_output(dev_index, out_buffer.read, block_frames=info.block_frames)
+        dev_name = f"{self.p_dev_list[list_index][0]} {self.p_dev_list[list_index][1]}"
+        info.output_name = dev_name
+        self.clear_deferred(s_id, "output", "output_type")
+        print(f"SID {s_id} Output Device - {dev_name}")
+
+    def set_latency_profile(self, s_id, profile):
+        self.set_block_size(s_id, *LATENCY_PROFILES[profile])
+
+    def set_block_size(self, s_id, block_frames, latency):
+        # Block size and target latency of one route. An open hardware output is reopened
+        # at the new size and the input device moves to smaller blocks if it needs to.
+        info = self.get_stream(s_id)
+        block_frames = int(block_frames)
+        latency = float(latency)
+        if block_frames < 16 or latency <= 0:
+            raise ValueError(f"block of {block_frames} frames at {latency} s latency")
+        if (info.block_frames, info.latency) == (block_frames, latency):
+            return
+        info.block_frames = block_frames
+        info.latency = latency
+        if self.supervisor is not None:
+            self.update_shard_entry(s_id, {"block_frames": block_frames, "latency": latency})
+            return
+        if info.input_dev_index is not None:
+            self.capture_hub.set_block_frames(info.input_dev_index, info.input_buffer, block_frames)
+        if info.output_type == "hardware" and info.output_list_index is not None:
+            list_index = info.output_list_index
+            info.output_list_index = None
+            self.set_hardware_output(s_id, list_index)
+        print(f"SID {s_id} blocks of {block_frames} frames, {latency * 1000:g} ms target latency")
+
+    def set_network_output(self, s_id, output_type, settings):
+        # settings holds protocol, host, port, password, mount, sid, codec and bitrate;
+        # returns False when they are rejected or the encoder does not start
+        from .network_output import create_mount_config
+        from .encoder import ENCODERS
+        info = self.get_stream(s_id)
+        # the route keeps its settings and its output until the new ones are known to work
+        previous = {key: getattr(info, key) for key in settings}
+        info.update(settings)
+        encoder = None
+        try:
+            if info.codec not in self.available_codecs():
+                raise ValueError(f"codec {info.codec} is not available")
+            config = create_mount_config(info.protocol, info.host, info.port, info.mount or "/stream",
+                                         info.password, sid=info.sid or 1,
+                                         content_type=ENCODERS[info.codec].content_type)
+            int(info.bitrate)
+            if self.supervisor is None:
+                # the shard starts its own, here the encoder has to start before the old output goes
+                encoder = self.get_encoder_pool().add_encoder(info.codec, info.bitrate)
+        except (KeyError, ValueError) as e:
+            info.update(previous)
+            print("invalid output settings for S_ID", s_id, "-", e)
+            return False
+        if self.supervisor is not None:
+            changes = dict(settings, output_type=output_type)
+            self.update_shard_entry(s_id, changes, output_type=output_type, output_list_index=None,
+                                    output_name=f"{output_type} {info.host}:{info.port}{info.mount}")
+            return True
+        self.close_output(info)
+        info.encoder = encoder
+        # wav and ogg streams need their header again on every reconnect
+        config["header"] = encoder.stream_header
+        info.output_type = output_type
+        info.output_source = self.get_network_output().add_mount(config)
+        info.output_list_index = None
+        self.clear_deferred(s_id, "output", "output_type")
+        dev_name = f"{output_type} {info.host}:{info.port}{config['mount']}"
+        info.output_name = dev_name
+        print(f"SID {s_id} Output - {dev_name}")
+        return True
+
+    def set_metadata(self, s_id, song):
+        # now playing title for a network output, resent whenever the source reconnects
+        if self.supervisor is not None:
+            return self.supervisor.set_metadata(s_id, song)
+        info = self.configured_streams.get(s_id)
+        if info is None or info.output_type not in ("icecast", "shoutcast") or info.output_source is None:
+            return False
+        info.output_source.set_metadata(song)
+        return True
+
+    def set_recording_output(self, s_id, settings):
+        # settings holds directory, record_format and segment_seconds
+        info = self.get_stream(s_id)
+        info.update(settings)
+        directory = info.directory or "recordings"
+        if self.supervisor is not None:
+            changes = dict(settings, output_type="recording")
+            self.update_shard_entry(s_id, changes, output_type="recording", output_list_index=None,
+                                    output_name=f"recording {info.record_format} {directory}")
+            return
+        try:
+            recording = self.get_recorder().add_recording(directory, f"s{s_id}", info.record_format,
+                                                          info.segment_seconds)
+        except (ValueError, OSError) as e:
+            print("invalid recording settings for S_ID", s_id, "-", e)
+            return
+        self.close_output(info)
+        info.output_type = "recording"
+        info.output_source = recording
+        info.output_buffer = recording.ring
+        info.output_list_index = None
+        self.clear_deferred(s_id, "output", "output_type")
+        dev_name = f"recording {info.record_format} {directory}"
+        info.output_name = dev_name
+        print(f"SID {s_id} Output - {dev_name}")
+
+    def clear_deferred(self, s_id, *keys):
+        # a device or output was set in place of a missing one; once nothing is missing
+        # an active route is queued to start
+        missing = self.deferred.get(s_id)
+        if missing is None:
+            return
+        for key in keys:
+            missing.pop(key, None)
+        if not missing:
+            del self.deferred[s_id]
+            self.device_found(s_id)
+
+    def device_found(self, s_id):
+        info = self.configured_streams.get(s_id)
+        if info is None:
+            return
+        if info.note == "no device":
+            info.note = ""
+        if info.active:
+            with self.lock:
+                self.pending.add(s_id)
+
+    def set_active(self, s_id, active):
+        if s_id in self.configured_streams:
+            self.configured_streams[s_id].active = active
+            if self.supervisor is not None:
+                self.update_shard_entry(s_id, {"active": active})
+            else:
+                with self.lock:
+                    self.pending.add(s_id)
+
+    def toggle_keep(self, s_id):
+        info = self.get_stream(s_id)
+        info.keep = not info.keep
+        if self.supervisor is not None:
+            self.update_shard_entry(s_id, {"keep": info.keep})
+        return info.keep
+
+    def remove_stream(self, s_id):
+        # stops the route and forgets it, releasing its devices and output
+        info = self.configured_streams.get(s_id)
+        if info is None:
+            return
+        info.active = False
+        if self.supervisor is not None:
+            if self.sid_to_preview == s_id:
+                self.toggle_preview(s_id)
+            self.shard_entries.pop(s_id, None)
+            self.supervisor.remove_entry(s_id)
+            del self.configured_streams[s_id]
+            return
+        self.active_streams.pop(s_id, None)
+        if self.sid_to_preview == s_id:
+            self.toggle_preview(s_id)
+        if self.listener_server is not None:
+            self.listener_server.remove_mount(s_id)
+        self.close_output(info)
+        self.release_input(info)
+        self.deferred.pop(s_id, None)
+        del self.configured_streams[s_id]
+
+    def set_preview_device(self, list_index):
+        dev_index = self.p_dev_list[list_index][2]
+        if self.preview_device and dev_index == self.preview_device["dev_index"]:
+            return
+        if self.preview_device:
+            self.audio_engine.close_stream(self.preview_device["source"])
+            print("preview ended for dev", self.preview_device["dev_index"])
+        p_out = self.audio_engine.open_output(dev_index, self.preview_read, block_frames=self.preview_block_frames)
+        self.preview_device["dev_index"] = dev_index
+        self.preview_device["source"] = p_out
+        print("new preview device -", dev_index, self.p_dev_list[list_index][0], self.p_dev_list[list_index][1])
+
+    def preview_read(self, frames):
+        if self.supervisor is not None:
+            if self.sid_to_preview >= 0:
+                return self.supervisor.preview_read(frames)
+            return None
+        reader = self.preview_reader
+        if reader is not None and self.sid_to_preview >= 0 \
+                and self.configured_streams[self.sid_to_preview].preview is True:
+            if reader.available() > PREVIEW_BACKLOG_BLOCKS * frames:
+                reader.keep_latest(frames)
+            return reader.read(frames)
+        return None
+
+    def toggle_preview(self, s_id):
+        if s_id not in self.configured_streams:
+            return False
+        if self.sid_to_preview == s_id:
+            self.sid_to_preview = -1
+            self.configured_streams[s_id].preview = False
+            self.set_preview_source(-1)
+            return False
+        if self.sid_to_preview in self.configured_streams:
+            self.configured_streams[self.sid_to_preview].preview = False
+        self.sid_to_preview = s_id
+        self.configured_streams[s_id].preview = True
+        self.set_preview_source(s_id)
+        return True
+
+    def set_preview_source(self, s_id):
+        if self.supervisor is not None:
+            self.supervisor.set_preview(s_id if s_id in self.configured_streams else None)
+            return
+        if self.preview_dev_index is not None:
+            # the device goes back to the block size its routes asked for
+            self.capture_hub.unsubscribe(self.preview_dev_index, self.preview_reader)
+            self.preview_reader = None
+            self.preview_dev_index = None
+        stream = self.configured_streams.get(s_id)
+        if stream is not None and stream.input_dev_index is not None:
+            self.preview_dev_index = stream.input_dev_index
+            self.preview_reader = self.capture_hub.subscribe(self.preview_dev_index, self.preview_block_frames)
+        elif stream is not None and stream.input_bus is not None:
+            self.preview_reader = stream.input_source.ring.reader()
+
+    @staticmethod
+    def find_device(dev_list, name):
+        # config files name devices the way the GUI lists them, "api: device"
+        if isinstance(name, int):
+            return name if 0 <= name < len(dev_list) else None
+        names = device_names(dev_list)
+        if name in names:
+            return names.index(name)
+        for i, dev in enumerate(dev_list):
+            if dev[1] == name:
+                return i
+        return None
+
+    @staticmethod
+    def device_name(dev_list, dev_index):
+        for name, dev in zip(device_names(dev_list), dev_list):
+            if dev[2] == dev_index:
+                return name
+        return None
+
+    def load_config(self, path):
+        with open(path) as f:
+            config = json.load(f)
+        version = config.get("version", CONFIG_VERSION)
+        if version > CONFIG_VERSION:
+            print("config", path, "is version", version, "- only version", CONFIG_VERSION, "is understood")
+        if self.supervisor is not None:
+            self.load_shard_config(config)
+            return
+        for entry in config.get("buses", []):
+            self.restore_bus(entry)
+        # streams only share devices through the capture hub, so they are restored in
+        # parallel: config parsing, device lookup, buffers and outputs overlap, while
+        # AudioEngine.open_stream() keeps the PortAudio opens themselves serialized
+        entries = config.get("streams", [])
+        with ThreadPoolExecutor(max_workers=RESTORE_WORKERS, thread_name_prefix="restore") as pool:
+            for entry, error in zip(entries, pool.map(self.restore_stream, entries)):
+                if error is not None:
+                    print("S_ID", entry.get("s_id"), "could not be restored -", error)
+
+    def restore_bus(self, entry):
+        self.mixer.add_bus(int(entry["bus_id"]), entry.get("name"))
+        for source in entry.get("inputs", []):
+            list_index = self.find_device(self.c_dev_list, source["input"])
+            if list_index is None:
+                print("bus", entry["bus_id"], "input device not found -", source["input"])
+                continue
+            self.mixer.set_input(int(entry["bus_id"]), self.c_dev_list[list_index][2], source.get("gain", 1.0),
+                                 source.get("mute", False), source.get("pan", 0.0))
+
+    def restore_stream(self, entry):
+        try:
+            s_id = int(entry["s_id"])
+            info = self.get_stream(s_id)
+            info.keep = entry.get("keep", True)
+            block_frames, latency = LATENCY_PROFILES[entry.get("profile", "normal")]
+            info.block_frames = int(entry.get("block_frames", block_frames))
+            info.latency = float(entry.get("latency", latency))
+            if entry.get("silence_threshold") is not None:
+                info.silence_threshold = float(entry["silence_threshold"])
+                info.silence_hold = float(entry.get("silence_hold", SILENCE_HOLD))
+                info.silence_hysteresis = float(entry.get("silence_hysteresis", SILENCE_HYSTERESIS))
+            output_type = entry.get("output_type", "hardware")
+            if output_type in ("icecast", "shoutcast"):
+                keys = ("protocol", "host", "port", "password", "mount", "sid", "codec", "bitrate")
+                self.set_network_output(s_id, output_type, {k: entry[k] for k in keys if k in entry})
+            elif output_type == "recording":
+                keys = ("directory", "record_format", "segment_seconds")
+                self.set_recording_output(s_id, {k: entry[k] for k in keys if k in entry})
+            self.restore_devices(s_id, entry)
+            self.set_active(s_id, entry.get("active", False))
+        except (KeyError, ValueError, OSError) as e:
+            return e
+        return None
+
+    def restore_devices(self, s_id, entry):
+        # Opens whatever devices the entry names. A device that is not there is not an
+        # error: the stream keeps its saved name and is retried when the devices change.
+        info = self.get_stream(s_id)
+        missing = {}
+        if entry.get("input_bus") is not None:
+            bus_ids = list(self.mixer.buses)
+            if entry["input_bus"] in bus_ids:
+                self.set_input_device(s_id, len(self.c_dev_list) + bus_ids.index(entry["input_bus"]))
+            else:
+                print("S_ID", s_id, "bus not found -", entry["input_bus"])
+        elif entry.get("input") is not None:
+            list_index = self.find_device(self.c_dev_list, entry["input"])
+            if list_index is None:
+                print("S_ID", s_id, "input device not found -", entry["input"])
+                missing["input"] = entry["input"]
+            else:
+                self.set_input_device(s_id, list_index)
+        if entry.get("output_type", "hardware") == "hardware" and entry.get("output") is not None:
+            list_index = self.find_device(self.p_dev_list, entry["output"])
+            if list_index is None:
+                print("S_ID", s_id, "output device not found -", entry["output"])
+                missing["output"] = entry["output"]
+                missing["output_type"] = "hardware"
+            else:
+                self.set_hardware_output(s_id, list_index)
+        if missing:
+            self.deferred[s_id] = missing
+            info.note = "no device"
+        elif self.deferred.pop(s_id, None) is not None or info.note == "no device":
+            self.device_found(s_id)
+
+    def refresh_devices(self):
+        # Rereads the device table, moves open streams to their devices' new list
+        # positions and retries streams that were waiting for a device.
+        self.audio_engine.refresh_devices()
+        self.c_dev_list = self.audio_engine.get_device_list("capture")
+        self.p_dev_list = self.audio_engine.get_device_list("playback")
+        c_indexes = {dev[2]: i for i, dev in enumerate(self.c_dev_list)}
+        p_indexes = {dev[2]: i for i, dev in enumerate(self.p_dev_list)}
+        for info in self.configured_streams.values():
+            if info.input_dev_index is not None:
+                info.input_list_index = c_indexes.get(info.input_dev_index)
+            elif info.input_bus is not None:
+                info.input_list_index = len(self.c_dev_list) + list(self.mixer.buses).index(info.input_bus)
+            if info.output_dev_index is not None:
+                info.output_list_index = p_indexes.get(info.output_dev_index)
+        for s_id, missing in list(self.deferred.items()):
+            self.restore_devices(s_id, missing)
+
+    def save_config(self, path):
+        # Writes the kept streams and all buses in the format load_config() reads.
+        # Devices are saved by name, list positions change between machines and boots.
+        if self.supervisor is not None:
+            streams = [dict(e, keep=True) for s_id, e in sorted(self.shard_entries.items())
+                       if self.configured_streams[s_id].keep]
+            return self.write_config(path, list(self.shard_buses.values()), streams)
+        buses = []
+        for bus in self.mixer.buses.values():
+            inputs = []
+            for dev_index, settings in bus.inputs.items():
+                name = self.device_name(self.c_dev_list, dev_index)
+                if name is not None:
+                    inputs.append({"input": name, "gain": settings["gain"], "mute": settings["mute"],
+                                   "pan": settings["pan"]})
+            buses.append({"bus_id": bus.bus_id, "name": bus.name, "inputs": inputs})
+        streams = []
+        for s_id, info in sorted(self.configured_streams.items()):
+            if not info.keep:
+                continue
+            missing = self.deferred.get(s_id, {})
+            entry = {"s_id": s_id, "keep": True, "latency": info.latency, "block_frames": info.block_frames,
+                     "active": info.active, "output_type": info.output_type}
+            if info.silence_threshold is not None:
+                entry.update(silence_threshold=info.silence_threshold, silence_hold=info.silence_hold,
+                             silence_hysteresis=info.silence_hysteresis)
+            if info.input_bus is not None:
+                entry["input_bus"] = info.input_bus
+            elif info.input_dev_index is not None:
+                entry["input"] = self.device_name(self.c_dev_list, info.input_dev_index)
+            elif "input" in missing:
+                entry["input"] = missing["input"]
+            if info.output_type == "hardware":
+                if info.output_dev_index is not None:
+                    entry["output"] = self.device_name(self.p_dev_list, info.output_dev_index)
+                elif "output" in missing:
+                    entry["output"] = missing["output"]
+            elif info.output_type == "recording":
+                for key in ("directory", "record_format", "segment_seconds"):
+                    entry[key] = getattr(info, key)
+            else:
+                for key in ("protocol", "host", "port", "password", "mount", "sid", "codec", "bitrate"):
+                    entry[key] = getattr(info, key)
+            streams.append(entry)
+        return self.write_config(path, buses, streams)
+
+    @staticmethod
+    def write_config(path, buses, streams):
+        config = {"version": CONFIG_VERSION, "buses": buses, "streams": streams}
+        # write then rename, so a crash while saving never leaves half a config behind
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(temp_path, path)
+        print("saved", len(streams), "streams to", path)
+        return len(streams)
+
+    def conn_manage(self):
+        last_retry = time.monotonic()
+        while self.running:
+            time.sleep(1)
+            if self.supervisor is not None:
+                # the routes run in the shard workers, this loop only supervises them
+                self.supervisor.supervise()
+                self.update_shard_status()
+                continue
+            if self.encoder_pool is not None:
+                self.encoder_pool.supervise()
+            if self.deferred and time.monotonic() - last_retry > DEVICE_RETRY_INTERVAL:
+                last_retry = time.monotonic()
+                self.refresh_devices()
+            # only routes whose active flag changed are looked at, not every configured one
+            with self.lock:
+                pending = self.pending
+                self.pending = set()
+            for s_id in pending:
+                info = self.configured_streams.get(s_id)
+                if info is None:
+                    continue
+                if info.active and info.state == IDLE:
+                    if s_id in self.deferred:
+                        # stays idle as "no device", device_found() queues it again
+                        continue
+                    print("connecting", info.input_name, "and", info.output_name, "for S_ID", s_id)
+                    run = next(self.runs)
+                    info.state = STARTING
+                    self.active_streams[s_id] = run
+                    stream_thread = Thread(name=str(s_id) + "_stream",
+                                           target=self.stream_thread, args=[s_id, run], daemon=True)
+                    stream_thread.start()
+                elif not info.active and info.state in (STARTING, STREAMING, SUSPENDED):
+                    print("disconnecting", info.input_name, "and", info.output_name, "for S_ID", s_id)
+                    # stopping before the run is withdrawn, so the exiting thread's idle comes last
+                    info.state = STOPPING
+                    self.active_streams.pop(s_id, None)
+                elif info.active and info.state == STOPPING:
+                    # switched back on before the old thread exited, start it once it has
+                    with self.lock:
+                        self.pending.add(s_id)
+
+    def update_shard_entry(self, s_id, changes, **display):
+        # sharded mode: the route's settings go to the supervisor, display holds what
+        # the GUI shows for it here
+        info = self.get_stream(s_id)
+        entry = self.shard_entries.setdefault(s_id, {"s_id": s_id, "latency": info.latency,
+                                                     "block_frames": info.block_frames, "keep": info.keep,
+                                                     "active": info.active})
+        entry.update(changes)
+        info.update(display)
+        self.supervisor.set_entry(s_id, entry)
+
+    def load_shard_config(self, config):
+        for entry in config.get("buses", []):
+            bus_id = int(entry["bus_id"])
+            self.shard_buses[bus_id] = self.canonical_bus(entry)
+            # the bus only exists here to be listed as an input
+            self.mixer.add_bus(bus_id, entry.get("name"))
+        for entry in config.get("streams", []):
+            s_id = int(entry["s_id"])
+            info = self.get_stream(s_id)
+            info.keep = entry.get("keep", True)
+            info.active = entry.get("active", False)
+            block_frames, latency = LATENCY_PROFILES[entry.get("profile", "normal")]
+            info.block_frames = int(entry.get("block_frames", block_frames))
+            info.latency = float(entry.get("latency", latency))
+            entry = dict(entry, s_id=s_id, keep=info.keep)
+            display = {}
+            if entry.get("input_bus") is not None and entry["input_bus"] in self.mixer.buses:
+                display["input_list_index"] = len(self.c_dev_list) + list(self.mixer.buses).index(entry["input_bus"])
+                display["input_name"] = self.mixer.buses[entry["input_bus"]].name
+            elif entry.get("input") is not None:
+                list_index = self.find_device(self.c_dev_list, entry["input"])
+                if list_index is not None:
+                    # one spelling per device, so routes on the same device end up in the same shard
+                    entry["input"] = display["input_name"] = device_names(self.c_dev_list)[list_index]
+                    display["input_list_index"] = list_index
+            output_type = entry.get("output_type", "hardware")
+            display["output_type"] = output_type
+            if output_type == "hardware" and entry.get("output") is not None:
+                list_index = self.find_device(self.p_dev_list, entry["output"])
+                if list_index is not None:
+                    entry["output"] = display["output_name"] = device_names(self.p_dev_list)[list_index]
+                    display["output_list_index"] = list_index
+            elif output_type in ("icecast", "shoutcast"):
+                display["output_name"] = f"{output_type} {entry.get('host', '')}:{entry.get('port', '')}" \
+                                         f"{entry.get('mount', '')}"
+            elif output_type == "recording":
+                display["output_name"] = f"recording {entry.get('record_format', 'wav')} " \
+                                         f"{entry.get('directory') or 'recordings'}"
+            self.shard_entries[s_id] = entry
+            info.update(display)
+        self.supervisor.set_config(self.shard_buses, self.shard_entries)
+
+    def canonical_bus(self, entry):
+        entry = dict(entry, bus_id=int(entry["bus_id"]))
+        inputs = []
+        for source in entry.get("inputs", []):
+            list_index = self.find_device(self.c_dev_list, source["input"])
+            if list_index is not None:
+                source = dict(source, input=device_names(self.c_dev_list)[list_index])
+            inputs.append(source)
+        entry["inputs"] = inputs
+        return entry
+
+    def update_shard_status(self):
+        for s_id, info in list(self.configured_streams.items()):
+            status = self.supervisor.status(s_id)
+            if status is None:
+                continue
+            state = status["state"]
+            if state == STATE_SUSPENDED and info.state != SUSPENDED:
+                # the worker logged it, the event is repeated here for the GUI
+                info.silent_since = time.time()
+                self.events.append((info.silent_since, s_id, f"S_ID {s_id} silent"))
+                info.state = SUSPENDED
+            elif state == STATE_STREAMING:
+                if info.state == SUSPENDED:
+                    self.events.append((time.time(), s_id, f"S_ID {s_id} resumed"))
+                info.state = STREAMING
+                info.note = ""
+                info.start_time = status["start_time"]
+            elif state == STATE_NO_DEVICE:
+                info.state = IDLE
+                info.note = "no device"
+            elif info.state in (STREAMING, SUSPENDED):
+                info.state = IDLE
+                info.note = "stopped"
+
+    def input_level(self, s_id):
+        # peak level 0..1 of the stream's input for the VU meter
+        if self.supervisor is not None:
+            status = self.supervisor.status(s_id)
+            return status["level"] if status is not None else 0.0
+        info = self.configured_streams.get(s_id)
+        source = info.input_source if info is not None else None
+        if source is None:
+            return 0.0
+        return source.meters.get_peak(source.meter_slot)
+
+    def collect_metrics(self):
+        # called from the metrics server thread; only reads counters the audio path keeps
+        if self.supervisor is not None:
+            yield from self.collect_shard_metrics()
+            return
+        rate = self.audio_engine.rate
+        for s_id, info in list(self.configured_streams.items()):
+            labels = {"s_id": s_id}
+            depth = 0
+            queued = 0.0
+            buffers = (("input", info.input_buffer),
+                       ("output", info.output_buffer if info.output_type in ("hardware", "recording") else None))
+            for name, buffer in buffers:
+                if buffer is None:
+                    continue
+                depth += buffer.available()
+                buffer_labels = {"s_id": s_id, "buffer": name}
+                yield "lion_stream_overruns_total", buffer_labels, buffer.overruns
+                yield "lion_stream_underruns_total", buffer_labels, buffer.underruns
+                yield "lion_stream_dropped_frames_total", buffer_labels, buffer.dropped_frames
+            if info.input_buffer is not None:
+                queued += info.input_buffer.available()
+            if info.output_type == "hardware" and info.output_buffer is not None:
+                queued += info.output_buffer.latency_frames()
+                yield "lion_stream_clock_ratio_ppm", labels, (info.output_buffer.ratio - 1.0) * 1e6
+            yield "lion_stream_buffer_depth_frames", labels, depth
+            yield "lion_stream_latency_seconds", labels, queued / rate
+            yield "lion_stream_active", labels, 1 if info.state in (STREAMING, SUSPENDED) else 0
+            yield "lion_stream_suspended", labels, 1 if info.state == SUSPENDED else 0
+            metrics = self.metrics.streams.get(s_id)
+            if metrics is not None:
+                yield "lion_stream_blocks_total", labels, metrics.blocks
+                yield "lion_stream_loop_seconds_total", labels, metrics.loop_time
+                yield "lion_stream_loop_seconds_max", labels, metrics.loop_max
+                yield "lion_stream_drift_ppm", labels, metrics.drift_ppm(rate)
+            if info.output_type in ("icecast", "shoutcast") and info.output_source is not None:
+                client = info.output_source
+                yield "lion_network_connected", labels, 1 if client.connected else 0
+                yield "lion_network_reconnects_total", labels, client.reconnects
+                yield "lion_network_dropped_blocks_total", labels, client.dropped
+                yield "lion_network_sent_bytes_total", labels, client.bytes_sent
+                if info.encoder is not None:
+                    yield "lion_encoder_real_time_factor", labels, info.encoder.real_time_factor()
+                    yield "lion_encoder_failed", labels, 1 if info.encoder.state == "failed" else 0
+            if info.output_type == "recording" and info.output_source is not None:
+                recording = info.output_source
+                yield "lion_recording_written_bytes_total", labels, recording.bytes_written
+                yield "lion_recording_segments_total", labels, recording.segments
+                yield "lion_recording_errors_total", labels, recording.errors
+            mount = self.listener_server.mounts.get(s_id) if self.listener_server is not None else None
+            if mount is not None:
+                yield "lion_listeners", labels, len(mount.listeners)
+                yield "lion_listener_sent_bytes_total", labels, mount.sent
+                yield "lion_listener_skips_total", labels, mount.skips
+                yield "lion_listener_dropped_total", labels, mount.dropped
+        for dev_index, count in list(self.audio_engine.xruns.items()):
+            yield "lion_device_xruns_total", {"device": dev_index}, count
+        yield "lion_mixer_underruns_total", {}, self.mixer.underruns
+        if self.encoder_pool is not None:
+            yield "lion_encoder_restarts_total", {}, self.encoder_pool.restarts
+
+    def collect_shard_metrics(self):
+        for s_id in list(self.shard_entries):
+            status = self.supervisor.status(s_id)
+            if status is None:
+                continue
+            labels = {"s_id": s_id, "shard": self.supervisor.placement.get(s_id, -1)}
+            yield "lion_stream_active", labels, 1 if status["state"] in (STATE_STREAMING, STATE_SUSPENDED) else 0
+            yield "lion_stream_suspended", labels, 1 if status["state"] == STATE_SUSPENDED else 0
+            yield "lion_stream_blocks_total", labels, status["blocks"]
+            yield "lion_stream_overruns_total", labels, status["overruns"]
+            yield "lion_stream_underruns_total", labels, status["underruns"]
+        yield "lion_shard_restarts_total", {}, self.supervisor.restarts
+
+    def silence_event(self, stream, silent):
+        now = time.time()
+        if silent:
+            stream.state = SUSPENDED
+            stream.silent_since = now
+            text = f"S_ID {stream.s_id} silent"
+            print("S_ID", stream.s_id, "silent for", stream.silence_hold, "s - suspended")
+        else:
+            stream.state = STREAMING
+            text = f"S_ID {stream.s_id} resumed"
+            print("S_ID", stream.s_id, "signal back after", round(now - stream.silent_since), "s - resumed")
+        if stream.output_type == "hardware" and stream.output_buffer is not None:
+            stream.output_buffer.silent = silent
+        self.events.append((now, stream.s_id, text))
+
+    def stream_thread(self, s_id, run):
+        print("play thread created for S_ID", s_id, "run", run)
+
+        stream = self.configured_streams[s_id]
+        metrics = self.metrics.stream(s_id)
+        metrics.restart()
+        stream.start_time = time.time()
+        stream.state = STREAMING
+        active_streams = self.active_streams
+        detector = None
+        if stream.silence_threshold is not None:
+            detector = SilenceDetector(stream.silence_threshold, stream.silence_hold, stream.silence_hysteresis)
+        # sent in place of the input while the route is suspended for silence
+        silence = b""
+        # the route's listener mount, once the listener server is running
+        mount = self.listener_server.mount(s_id) if self.listener_server is not None else None
+        if stream.input_buffer is not None:
+            # start from live audio, not whatever queued up since the input was picked
+            stream.input_buffer.clear()
+        while active_streams.get(s_id) == run:
+            in_buffer = stream.input_buffer
+            if in_buffer is None:
+                time.sleep(WAIT_TIMEOUT)
+                continue
+            # read every block, set_block_size() can change it while the route runs
+            block_frames = stream.block_frames
+            if not in_buffer.wait_for(block_frames, WAIT_TIMEOUT):
+                continue
+            started = time.perf_counter()
+            in_data = in_buffer.read(block_frames)
+            source = stream.input_source
+            if detector is not None and source is not None:
+                # the meter thread already measured this input, only its peak is looked at here;
+                # while suspended the block at hand is checked too, since the meter can be a
+                # tick behind and the first block with signal should not be replaced
+                peak = source.meters.get_peak(source.meter_slot)
+                if detector.silent:
+                    peak = max(peak, block_peak(in_data))
+                event = detector.update(peak, started)
+                if event is not None:
+                    self.silence_event(stream, event)
+                if detector.silent:
+                    if len(silence) != len(in_data):
+                        silence = bytes(len(in_data))
+                    in_data = silence
+            if stream.output_type == "hardware" and stream.output_buffer is not None:
+                stream.output_buffer.write(in_data)
+            elif stream.output_type == "recording" and stream.output_source is not None:
+                stream.output_source.write(in_data)
+            elif stream.output_type in ("icecast", "shoutcast") and stream.encoder is not None:
+                stream.encoder.write(in_data)
+                out_data = stream.encoder.read()
+                if out_data:
+                    stream.output_source.send(out_data)
+            if mount is None and self.listener_server is not None:
+                mount = self.listener_server.mount(s_id)
+            if mount is not None:
+                mount.write(in_data)
+            metrics.block_done(block_frames, started)
+        if stream.output_type == "hardware" and stream.output_buffer is not None:
+            stream.output_buffer.silent = False
+        stream.state = IDLE
+        stream.note = "stopped"
+        print("closing play_thread for S_ID", s_id)
@@ -0,0 +1,461 @@
+import tkinter as tk
+from tkinter import ttk
+import os
+import time
+from engine import StreamEngine, device_names, DEFAULT_CONFIG, LATENCY_PROFILES, IDLE, STREAMING, SUSPENDED
+
+
+class MainWindow(tk.Tk):
+    def __init__(self, win_per_page=5, config_path=None, metrics_port=None, shards=0, listen_port=None,
+                 listen_host="0.0.0.0"):
+        super(MainWindow, self).__init__()
+        self.title("Lion Multi Streamer v0.8a")
+        self.engine = StreamEngine(shards=shards)
+        # the Save button writes back to the file the streams came from
+        self.config_path = config_path or DEFAULT_CONFIG
+        if config_path is not None or os.path.exists(self.config_path):
+            self.engine.load_config(self.config_path)
+        if metrics_port is not None:
+            self.engine.metrics.start_server(metrics_port)
+        if listen_port is not None:
+            self.engine.start_listener_server(listen_port, listen_host)
+        self.canvas = tk.Canvas(self, width=800, height=515, bg="#555555")
+        self.canvas.pack()
+        self.resizable(width=False, height=False)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.control_window = ControlWindow(self)
+        self.control_window.frame.place(x=10, y=10)
+        self.win_per_page = win_per_page
+        self.update_delay = 0.25
+        self.stream_windows = []
+        # s_id -> the window showing it on the current page
+        self.window_index = {}
+        y_offset = 70
+        y_inc = 90
+        for i in range(win_per_page):
+            s_win = StreamerWindow(self, i)
+            s_win.frame.place(x=10, y=y_offset)
+            self.stream_windows.append(s_win)
+            y_offset += y_inc
+        self.control_window.show_page(0)
+        self.engine.start()
+        self.after(int(self.update_delay * 1000), self.render)
+
+    def render(self):
+        # Runs on the Tk thread. Only the windows of the current page exist, so the
+        # cost depends on win_per_page and not on how many streams are configured.
+        now = time.time()
+        for w in self.stream_windows:
+            w.render(now)
+        events = self.engine.events
+        text = None
+        while events:
+            # the status line shows the latest silence or resume event
+            _when, _s_id, text = events.popleft()
+        if text is not None:
+            self.control_window.status_label_var.set(text)
+        self.after(int(self.update_delay * 1000), self.render)
+
+    def close(self):
+        self.engine.stop()
+        self.destroy()
+
+
+class ControlWindow:
+    def __init__(self, root):
+        self.width = 780
+        self.height = 50
+        self.root = root
+        self.font = ("helvetica", 10)
+        self.status = " -W.L-"
+        self.current_page = 0
+        self.engine = root.engine
+
+        # Background Frame
+        self.frame = tk.Frame(root, width=self.width, height=self.height, bd=10, relief="ridge")
+
+        # Prev Page Button
+        self.prev_page_button = tk.Button(self.frame, font=self.font, text="<",
+                                          command=lambda: self.show_page(self.current_page - 1))
+        self.prev_page_button.place(anchor="center", x=10, rely=0.5, width=20, height=20)
+
+        # Next Page Button
+        self.next_page_button = tk.Button(self.frame, font=self.font, text=">",
+                                          command=lambda: self.show_page(self.current_page + 1))
+        self.next_page_button.place(anchor="center", x=30, rely=0.5, width=20, height=20)
+
+        # Status Label
+        self.status_label_var = tk.StringVar()
+        self.status_label_var.set(self.status)
+        self.status_label = tk.Label(self.frame, font=self.font, bg="#000000", fg="#FFFFFF",
+                                     textvariable=self.status_label_var)
+        self.status_label.place(anchor="w", x=50, rely=0.5, width=100, height=20)
+
+        self.preview_label = tk.Label(self.frame, font=self.font, text="Preview Device")
+        self.preview_label.place(anchor="w", x=160, rely=0.5, width=100, height=20)
+
+        self.preview_box = ttk.Combobox(self.frame, values=device_names(self.engine.p_dev_list), state="readonly",
+                                        font=self.font)
+        self.preview_box.place(anchor="w", x=270, rely=0.5, width=400, height=20)
+        self.preview_box.bind("<<ComboboxSelected>>", self.set_preview_device)
+
+        # Save Button
+        self.save_button = tk.Button(self.frame, font=self.font, text="Save",
+                                     command=lambda: self.save_to_file())
+        self.save_button.place(anchor="w", x=700, rely=0.5, width=40, height=20)
+
+    def set_preview_device(self, _event):
+        self.engine.set_preview_device(self.preview_box.current())
+
+    def save_to_file(self):
+        try:
+            self.engine.save_config(self.root.config_path)
+        except OSError as e:
+            print("saving config failed -", e)
+            self.status_label_var.set("Save Failed")
+            return
+        self.status_label_var.set("File Saved")
+
+    def show_page(self, new_page):
+        new_page = 0 if new_page < 0 else new_page
+        i = 0
+        streams = self.engine.configured_streams
+        self.root.window_index = {}
+        for w in self.root.stream_windows:
+            w.s_id = i + (new_page * self.root.win_per_page)
+            self.root.window_index[w.s_id] = w
+            w.sid_label_var.set(w.s_id)
+            if w.s_id in streams.keys():
+                if streams[w.s_id].input_list_index is None:
+                    w.input_box.set("")
+                else:
+                    w.input_box.current(streams[w.s_id].input_list_index)
+                w.output_label_var.set(streams[w.s_id].output_name or "")
+                if streams[w.s_id].keep:
+                    w.keep_button.configure(bg="#00FF00")
+                else:
+                    w.keep_button.configure(bg="#FF0000")
+            else:
+                w.input_box.set("")
+                w.keep_button.configure(bg="#FF0000")
+            w.rendered = {}
+            w.render(time.time())
+            i += 1
+        self.current_page = new_page
+        self.status_label_var.set("Page " + str(self.current_page))
+
+
+class StreamerWindow:
+    def __init__(self, root, s_id):
+        self.width = 780
+        self.height = 80
+        self.root = root
+        self.font = ("helvetica", 10)
+        self.s_id = s_id
+        self.status = str(s_id)
+        self.vu_size = 25
+        self.vu_level = 0
+        self.rendered = {}
+
+        # Background Frame
+        self.frame = tk.Frame(root, width=self.width, height=self.height, bd=10, relief="ridge")
+
+        # input combobox
+        self.input_box = ttk.Combobox(self.frame, values=self.root.engine.input_names(), state="readonly",
+                                      font=self.font)
+        self.input_box.place(anchor="w", x=10, y=15, width=400, height=20)
+        self.input_box.bind("<<ComboboxSelected>>", self.set_input_device)
+
+        # preview button
+        self.preview_button = tk.Button(self.frame, font=self.font, text="Preview",
+                                        command=lambda: self.preview_button_func(self.s_id))
+        self.preview_button.place(anchor="w", x=420, y=15, width=50, height=20)
+
+        # output Label
+        self.output_label_var = tk.StringVar()
+        self.output_label_var.set("output string")
+        self.output_label = tk.Label(self.frame, font=self.font, bg="#000000", fg="#FFFFFF",
+                                     textvariable=self.output_label_var)
+        self.output_label.place(anchor="w", x=10, y=35, width=400, height=15)
+
+        # output config button
+        self.output_config_button = tk.Button(self.frame, font=self.font, text="Config",
+                                              command=lambda: self.output_config_button_func(self.s_id))
+        self.output_config_button.place(anchor="w", x=420, y=35, width=50, height=20)
+
+        # Output VU Meter
+        self.vu_canvas = tk.Canvas(self.frame, bg="#000000", highlightthickness=0)
+        self.vu_canvas.place(x=750, y=0, width=10, height=60)
+        self.vu_bar = self.vu_canvas.create_rectangle(0, 60, 10, 60, fill="#00FF00", width=0)
+
+        # Stream ID Label
+        self.sid_label_var = tk.StringVar()
+        self.sid_label_var.set(str(s_id))
+        self.sid_label = tk.Label(self.frame, font=self.font, bg="#000000", fg="#FFFFFF",
+                                  textvariable=self.sid_label_var)
+        self.sid_label.place(anchor="w", x=10, y=55, width=20, height=15)
+
+        # Status Label
+        self.status_label_var = tk.StringVar()
+        self.status_label_var.set(str(s_id))
+        self.status_label = tk.Label(self.frame, font=self.font, bg="#000000", fg="#FFFFFF",
+                                     textvariable=self.status_label_var)
+        self.status_label.place(anchor="w", x=640, y=50, width=100, height=15)
+
+        # Keep Button
+        if self.s_id in self.root.engine.configured_streams.keys():
+            bg_color = "#00FF00"
+        else:
+            bg_color = "#FF0000"
+        self.keep_button = tk.Button(self.frame, font=self.font, text="Keep", bg=bg_color,
+                                     command=lambda: self.toggle_keep())
+        self.keep_button.place(anchor="w", x=700, y=10, width=40, height=20)
+
+        # Active Button
+        self.active_button = tk.Button(self.frame, font=self.font, text="Active", bg=bg_color,
+                                       command=lambda: self.toggle_active())
+        self.active_button.place(anchor="w", x=700, y=30, width=40, height=20)
+
+    def set_input_device(self, _event):
+        self.root.engine.set_input_device(self.s_id, self.input_box.current())
+
+    def preview_button_func(self, s_id):
+        if self.root.engine.toggle_preview(s_id):
+            self.root.control_window.status_label_var.set(f"Preview ID {s_id}")
+        else:
+            self.root.control_window.status_label_var.set("Preview off")
+
+    def output_config_button_func(self, s_id):
+        _config_window = ConfigWindow(self.root, s_id)
+
+    def toggle_keep(self):
+        if self.root.engine.toggle_keep(self.s_id):
+            self.keep_button.configure(bg="#00FF00")
+        else:
+            self.keep_button.configure(bg="#FF0000")
+
+    def toggle_active(self):
+        streams = self.root.engine.configured_streams
+        if self.s_id not in streams.keys():
+            return
+        self.root.engine.set_active(self.s_id, not streams[self.s_id].active)
+        self.render(time.time())
+
+    def set_if_changed(self, key, value, apply):
+        if self.rendered.get(key) != value:
+            self.rendered[key] = value
+            apply(value)
+
+    def render(self, now):
+        stream = self.root.engine.configured_streams.get(self.s_id)
+        vu_level = 0
+        if stream is None:
+            status = " - "
+            active_color = "#FF0000"
+        else:
+            vu_level = min(int(self.root.engine.input_level(self.s_id) * self.vu_size), self.vu_size - 1)
+            if stream.active and stream.state == STREAMING:
+                status = "Up - " + str(round(now - stream.start_time)) + " secs"
+                active_color = "#00FF00"
+            elif stream.active and stream.state == SUSPENDED:
+                status = "Silent - " + str(round(now - stream.silent_since)) + " secs"
+                active_color = "#00A0FF"
+            elif stream.state == IDLE and stream.note == "no device":
+                # active or not, a route waiting for its device is not starting
+                status = stream.note
+                active_color = "#FF0000"
+            elif stream.active:
+                status = "Powering Up..."
+                active_color = "#FFFF00"
+            elif stream.state != IDLE:
+                status = "Powering Down..."
+                active_color = "#FF0000"
+            else:
+                status = stream.note or " - "
+                active_color = "#FF0000"
+        self.set_if_changed("status", status, self.status_label_var.set)
+        self.set_if_changed("active", active_color, lambda c: self.active_button.configure(bg=c))
+        if vu_level != self.vu_level:
+            self.vu_level = vu_level
+            bar_top = 60 - int(60 * vu_level / self.vu_size)
+            self.vu_canvas.coords(self.vu_bar, 0, bar_top, 10, 60)
+
+
+class ConfigWindow:
+    def __init__(self, root, s_id):
+        self.width = 500
+        self.height = 500
+        self.root = root
+        self.font = ("helvetica", 10)
+        self.s_id = s_id
+        self.output_type = 0
+        self.elements = []
+        self.frame = tk.Frame(self.root, width=self.width, height=self.height, bd=10, relief="ridge")
+        self.frame.place(anchor="center", relx=0.5, rely=0.5)
+        self.output_type_var = tk.IntVar()
+        self.output_type_var.set(0)
+        hw_radio_button = tk.Radiobutton(self.frame, text="hardware",
+                                         variable=self.output_type_var, value=0, command=self.set_output_type)
+        hw_radio_button.place(x=20, y=10)
+        rec_radio_button = tk.Radiobutton(self.frame, text="recording",
+                                          variable=self.output_type_var, value=3, command=self.set_output_type)
+        rec_radio_button.place(x=130, y=10)
+        ice_radio_button = tk.Radiobutton(self.frame, text="icecast",
+                                          variable=self.output_type_var, value=1, command=self.set_output_type)
+        ice_radio_button.place(x=240, y=10)
+        shout_radio_button = tk.Radiobutton(self.frame, text="shoutcast",
+                                            variable=self.output_type_var, value=2, command=self.set_output_type)
+        shout_radio_button.place(x=350, y=10)
+
+        ok_button = tk.Button(self.frame, text="Ok", command=self.ok_func)
+        ok_button.place(x=140, y=460, width=50, height=20)
+
+        cancel_button = tk.Button(self.frame, text="Cancel", command=self.cancel_func)
+        cancel_button.place(x=310, y=460, width=50, height=20)
+
+        self.prepare_config_hardware()
+
+    def set_output_type(self):
+        if self.output_type == self.output_type_var.get():
+            return
+        self.output_type = self.output_type_var.get()
+        print("output type", self.output_type)
+        if self.output_type == 0:
+            self.prepare_config_hardware()
+        elif self.output_type == 1:
+            self.prepare_config_icecast()
+        elif self.output_type == 2:
+            self.prepare_config_shoutcast()
+        elif self.output_type == 3:
+            self.prepare_config_recording()
+
+    def clear_elements(self):
+        for e in self.elements:
+            e.destroy()
+        self.elements = []
+
+    def ok_func(self):
+        if self.output_type == 0:
+            list_index = self.elements[0].current()
+            if list_index < 0:
+                return
+            self.root.engine.set_hardware_output(self.s_id, list_index)
+            profile = self.elements[2].get()
+            if profile in LATENCY_PROFILES:
+                self.root.engine.set_latency_profile(self.s_id, profile)
+        elif self.output_type in (1, 2):
+            if not self.set_network_output():
+                # left open to correct the settings, the reason is printed
+                return
+        elif self.output_type == 3:
+            self.set_recording_output()
+        stream = self.root.engine.configured_streams.get(self.s_id)
+        window = self.root.window_index.get(self.s_id)
+        if window is not None and stream is not None:
+            window.output_label_var.set(stream.output_name or "")
+        self.frame.destroy()
+
+    def set_network_output(self):
+        values = [e.get() for e in self.elements if isinstance(e, (tk.Entry, ttk.Combobox))]
+        protocol, host, port, password, last, codec, bitrate, song = values[:8]
+        settings = {"host": host, "port": port, "password": password, "codec": codec, "bitrate": bitrate}
+        if self.output_type == 1:
+            output_type = "icecast"
+            settings["mount"] = last
+            settings["protocol"] = "icecast_source" if protocol == "SOURCE" else "icecast_put"
+        else:
+            output_type = "shoutcast"
+            settings["sid"] = last
+            settings["protocol"] = "shoutcast_v2" if protocol == "v2" else "shoutcast_v1"
+        if not self.root.engine.set_network_output(self.s_id, output_type, settings):
+            return False
+        if song:
+            self.root.engine.set_metadata(self.s_id, song)
+        return True
+
+    def set_recording_output(self):
+        directory, record_format, minutes = [e.get() for e in self.elements if isinstance(e, (tk.Entry, ttk.Combobox))]
+        try:
+            segment_seconds = float(minutes) * 60
+        except ValueError:
+            print("segment length is not a number -", minutes)
+            return
+        self.root.engine.set_recording_output(self.s_id, {"directory": directory, "record_format": record_format,
+                                                          "segment_seconds": segment_seconds})
+
+    def cancel_func(self):
+        self.frame.destroy()
+
+    def prepare_config_hardware(self):
+        self.clear_elements()
+        output_box = ttk.Combobox(self.frame, values=device_names(self.root.engine.p_dev_list), state="readonly",
+                                  font=self.font)
+        output_box.place(anchor="center", relx=0.5, rely=0.2, width=400, height=20)
+        output_box.bind("<<ComboboxSelected>>", self.set_device_output)
+        self.elements.append(output_box)
+        info = self.root.engine.configured_streams.get(self.s_id)
+        profiles = list(LATENCY_PROFILES)
+        current = (info.block_frames, info.latency) if info is not None else LATENCY_PROFILES["normal"]
+        if current not in LATENCY_PROFILES.values():
+            # set in the config file, kept unless another profile is picked
+            profiles.append("custom")
+        profile_box = ttk.Combobox(self.frame, values=profiles, state="readonly", font=self.font)
+        profile_box.current(next((i for i, p in enumerate(profiles) if LATENCY_PROFILES.get(p, current) == current)))
+        self.add_config_row("Latency", profile_box, 0.3)
+
+    def set_device_output(self, _event):
+        pass
+
+    def add_config_row(self, label, widget, rely):
+        row_label = tk.Label(self.frame, font=self.font, text=label)
+        row_label.place(anchor="e", relx=0.3, rely=rely, width=100, height=20)
+        widget.place(anchor="w", relx=0.32, rely=rely, width=250, height=20)
+        self.elements.append(row_label)
+        self.elements.append(widget)
+
+    def add_network_rows(self, protocols, last_label, last_key, default_port):
+        info = self.root.engine.configured_streams.get(self.s_id)
+        protocol_box = ttk.Combobox(self.frame, values=protocols, state="readonly", font=self.font)
+        protocol_box.current(0)
+        self.add_config_row("Protocol", protocol_box, 0.15)
+        rows = [("Host", "host", "localhost"), ("Port", "port", default_port), ("Password", "password", ""),
+                (last_label, last_key, "")]
+        rely = 0.25
+        for label, key, default in rows:
+            entry = tk.Entry(self.frame, font=self.font, show="*" if key == "password" else "")
+            entry.insert(0, str(getattr(info, key)) if info is not None and getattr(info, key) else default)
+            self.add_config_row(label, entry, rely)
+            rely += 0.1
+        codecs = self.root.engine.available_codecs()
+        codec_box = ttk.Combobox(self.frame, values=codecs, state="readonly", font=self.font)
+        codec_box.current(codecs.index(info.codec) if info is not None and info.codec in codecs else 0)
+        self.add_config_row("Codec", codec_box, rely)
+        bitrate_entry = tk.Entry(self.frame, font=self.font)
+        bitrate_entry.insert(0, info.bitrate if info is not None else "128")
+        self.add_config_row("Bitrate (kbps)", bitrate_entry, rely + 0.1)
+        song_entry = tk.Entry(self.frame, font=self.font)
+        self.add_config_row("Now playing", song_entry, rely + 0.2)
+
+    def prepare_config_recording(self):
+        self.clear_elements()
+        info = self.root.engine.configured_streams.get(self.s_id)
+        directory_entry = tk.Entry(self.frame, font=self.font)
+        directory_entry.insert(0, info.directory if info is not None and info.directory else "recordings")
+        self.add_config_row("Directory", directory_entry, 0.15)
+        formats = self.root.engine.available_record_formats()
+        format_box = ttk.Combobox(self.frame, values=formats, state="readonly", font=self.font)
+        format_box.current(formats.index(info.record_format)
+                           if info is not None and info.record_format in formats else 0)
+        self.add_config_row("Format", format_box, 0.25)
+        minutes_entry = tk.Entry(self.frame, font=self.font)
+        minutes_entry.insert(0, f"{info.segment_seconds / 60:g}" if info is not None else "60")
+        self.add_config_row("Segment (min)", minutes_entry, 0.35)
+
+    def prepare_config_icecast(self):
+        self.clear_elements()
+        self.add_network_rows(["PUT", "SOURCE"], "Mount", "mount", "8000")
+
+    def prepare_config_shoutcast(self):
+        self.clear_elements()
+        self.add_network_rows(["v1", "v2"], "Stream ID", "sid", "8000")
+
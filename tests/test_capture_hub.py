@@ -0,0 +1,62 @@
+import unittest
+from engine.audio_engine import AudioEngine
+from engine.capture_hub import CaptureHub
+from engine.fake_backend import FakeBackend
+from engine.streams import StreamEngine
+
+
+class CaptureHubTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = AudioEngine(chunk_frames=2048, backend=FakeBackend(inputs=1, outputs=0))
+        self.engine.get_device_list("capture")
+        self.hub = CaptureHub(self.engine)
+
+    def tearDown(self):
+        self.hub.meters.stop()
+
+    def test_runs_at_smallest_block_asked_for(self):
+        first = self.hub.subscribe(0, 1024)
+        device = self.hub.get_device(0)
+        self.assertEqual(device.block_frames, 1024)
+        second = self.hub.subscribe(0, 256)
+        self.assertEqual(device.block_frames, 256)
+        # a larger block does not reopen it
+        third = self.hub.subscribe(0)
+        self.assertEqual(device.block_frames, 256)
+        self.hub.unsubscribe(0, second)
+        self.assertEqual(device.block_frames, 1024)
+        self.hub.unsubscribe(0, first)
+        self.assertEqual(device.block_frames, 2048)
+        self.hub.unsubscribe(0, third)
+        self.assertIsNone(self.hub.get_device(0))
+
+    def test_subscriber_changing_its_block(self):
+        first = self.hub.subscribe(0, 1024)
+        second = self.hub.subscribe(0, 1024)
+        device = self.hub.get_device(0)
+        self.hub.set_block_frames(0, first, 256)
+        self.assertEqual(device.block_frames, 256)
+        self.hub.set_block_frames(0, first, 4096)
+        self.assertEqual(device.block_frames, 1024)
+        self.hub.unsubscribe(0, first)
+        self.hub.unsubscribe(0, second)
+
+
+class PreviewBlockTest(unittest.TestCase):
+    def test_preview_leaves_the_device_at_the_route_block(self):
+        engine = StreamEngine(backend=FakeBackend(inputs=1, outputs=1))
+        try:
+            engine.set_block_size(0, 2048, 0.2)
+            engine.set_input_device(0, 0)
+            device = engine.capture_hub.get_device(engine.configured_streams[0].input_dev_index)
+            self.assertEqual(device.block_frames, 2048)
+            engine.toggle_preview(0)
+            self.assertEqual(device.block_frames, engine.preview_block_frames)
+            engine.toggle_preview(0)
+            self.assertEqual(device.block_frames, 2048)
+        finally:
+            engine.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
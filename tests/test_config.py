@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+import unittest
+from engine.fake_backend import FakeBackend
+from engine.streams import StreamEngine, device_names
+
+
+class ConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "streams.json")
+        self.engines = []
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.stop()
+        self.directory.cleanup()
+
+    def engine(self, **kwargs):
+        engine = StreamEngine(backend=FakeBackend(**kwargs))
+        self.engines.append(engine)
+        return engine
+
+    def saved(self, engine):
+        engine.save_config(self.path)
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_round_trip(self):
+        engine = self.engine()
+        names = device_names(engine.c_dev_list)
+        config = {"version": 1, "buses": [{"bus_id": 3, "name": "Studio mix", "inputs": [
+            {"input": names[0], "gain": 0.8, "mute": False, "pan": -0.2},
+            {"input": names[1], "gain": 1.0, "mute": True, "pan": 0.0}]}],
+            "streams": [
+                {"s_id": 0, "keep": True, "input": names[1], "output_type": "hardware",
+                 "output": device_names(engine.p_dev_list)[0], "latency": 0.5, "block_frames": 1024,
+                 "silence_threshold": -50.0, "silence_hold": 5.0, "silence_hysteresis": 4.0, "active": False},
+                {"s_id": 1, "keep": True, "input_bus": 3, "output_type": "recording",
+                 "directory": self.directory.name, "record_format": "wav", "segment_seconds": 600, "active": False},
+                {"s_id": 2, "keep": True, "input": names[0], "output_type": "icecast", "protocol": "icecast_put",
+                 "host": "localhost", "port": 8000, "password": "hackme", "mount": "/live", "codec": "wav",
+                 "bitrate": 128, "active": False}]}
+        with open(self.path, "w") as f:
+            json.dump(config, f)
+        engine.load_config(self.path)
+        first = self.saved(engine)
+        other = self.engine()
+        other.load_config(self.path)
+        self.assertEqual(self.saved(other), first)
+        self.assertEqual(first["buses"], config["buses"])
+        by_id = {entry["s_id"]: entry for entry in first["streams"]}
+        for entry in config["streams"]:
+            for key, value in entry.items():
+                with self.subTest(s_id=entry["s_id"], key=key):
+                    self.assertEqual(by_id[entry["s_id"]].get(key), value)
+
+    def test_missing_device_keeps_its_name(self):
+        with open(self.path, "w") as f:
+            json.dump({"streams": [{"s_id": 0, "input": "ALSA: Gone", "output_type": "hardware",
+                                    "output": "ALSA: Also gone", "active": True}]}, f)
+        engine = self.engine()
+        engine.load_config(self.path)
+        self.assertEqual(engine.configured_streams[0].note, "no device")
+        entry = self.saved(engine)["streams"][0]
+        self.assertEqual((entry["input"], entry["output"], entry["active"]), ("ALSA: Gone", "ALSA: Also gone", True))
+
+    def test_unkept_streams_are_not_saved(self):
+        engine = self.engine()
+        engine.get_stream(0).keep = False
+        engine.get_stream(1).keep = True
+        self.assertEqual([entry["s_id"] for entry in self.saved(engine)["streams"]], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from engine.audio_engine import AudioEngine
+from engine.convert import FormatConverter, OutputAdapter, Resampler, remix, to_float, to_int16
+from engine.fake_backend import FakeBackend
+
+
+def sine(frequency, rate, frames, channels=2, start=0):
+    wave = np.sin(2 * np.pi * frequency * np.arange(start, start + frames) / rate).astype(np.float32) * 0.5
+    return np.repeat(wave[:, None], channels, axis=1)
+
+
+def dominant_frequency(signal, rate):
+    spectrum = np.abs(np.fft.rfft(signal * np.hanning(len(signal))))
+    return np.argmax(spectrum) * rate / len(signal)
+
+
+class ResamplerTest(unittest.TestCase):
+    def test_same_rate_passes_through(self):
+        block = sine(440, 44100, 100)
+        self.assertIs(Resampler(44100, 44100, 2).process(block), block)
+
+    def test_block_sizes_add_up(self):
+        for src, dst in ((44100, 48000), (48000, 44100), (96000, 44100), (22050, 44100)):
+            with self.subTest(src=src, dst=dst):
+                resampler = Resampler(src, dst, 2)
+                total = sum(len(resampler.process(sine(440, src, frames)))
+                            for frames in (1000, 317, 2048, 1, 4000) * 4)
+                expected = 7366 * 4 * dst / src
+                self.assertLessEqual(abs(total - expected), 1)
+
+    def test_keeps_pitch_and_level_across_blocks(self):
+        resampler = Resampler(48000, 44100, 1)
+        blocks = [resampler.process(sine(1000, 48000, 480, 1, start)) for start in range(0, 48000, 480)]
+        out = np.concatenate(blocks)[:, 0]
+        steady = out[1000:]
+        self.assertAlmostEqual(dominant_frequency(steady, 44100), 1000, delta=5)
+        self.assertAlmostEqual(float(np.abs(steady).max()), 0.5, delta=0.02)
+        # block joins leave no clicks: the step between samples stays that of the sine
+        self.assertLess(float(np.abs(np.diff(steady)).max()), 2 * np.pi * 1000 / 44100 * 0.5 * 1.05)
+
+    def test_removes_content_above_the_new_nyquist(self):
+        resampler = Resampler(96000, 44100, 1)
+        out = resampler.process(sine(30000, 96000, 96000, 1))[1000:, 0]
+        self.assertLess(float(np.abs(out).max()), 0.01)
+
+
+class FormatTest(unittest.TestCase):
+    def test_int16_round_trip(self):
+        block = np.array([[-32768, 32767], [0, 1]], dtype=np.int16)
+        self.assertEqual(to_int16(to_float(block.tobytes())).tolist(), block.tolist())
+        self.assertEqual(to_int16(np.array([[1.5, -1.5]], dtype=np.float32)).tolist(), [[32767, -32768]])
+
+    def test_remix(self):
+        stereo = np.array([[0.2, 0.4]], dtype=np.float32)
+        self.assertEqual(remix(stereo, 1).tolist(), [[np.float32(0.3)]])
+        self.assertEqual(remix(np.array([[0.25]], dtype=np.float32), 2).tolist(), [[0.25, 0.25]])
+        self.assertIs(remix(stereo, 2), stereo)
+
+    def test_converter_mono_48k_to_engine(self):
+        converter = FormatConverter(48000, 1, 44100, 2)
+        mono = to_int16(sine(440, 48000, 4800, 1))
+        out = converter.process(mono.tobytes())
+        self.assertEqual(out.shape[1], 2)
+        self.assertEqual(out[:, 0].tolist(), out[:, 1].tolist())
+        self.assertLessEqual(abs(len(out) - 4410), 1)
+
+    def test_output_adapter_hands_out_exact_frames(self):
+        blocks = iter([to_int16(sine(440, 44100, 1024)).tobytes() for _ in range(20)])
+        adapter = OutputAdapter(lambda frames: next(blocks, None), FormatConverter(44100, 2, 48000, 2), 1024, 2)
+        sizes = [len(adapter.read(333)) for _ in range(10)]
+        self.assertEqual(sizes, [333 * 4] * 10)
+
+
+class NativeFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = AudioEngine(backend=FakeBackend(inputs=0, outputs=0))
+
+    def device(self, max_input, rate=48000.0):
+        self.engine.devices = [{"api_name": "ALSA", "name": "dev", "index": 0, "max_input_channels": max_input,
+                                "max_output_channels": max_input, "default_rate": rate}]
+
+    def test_channel_maximum_is_not_the_native_format(self):
+        for max_channels, expected in ((128, 2), (32, 2), (2, 2), (1, 1)):
+            with self.subTest(max_channels=max_channels):
+                self.device(max_channels)
+                self.assertEqual(self.engine.native_format(0, "input"), (48000, expected))
+                self.assertEqual(self.engine.native_format(0, "output"), (48000, expected))
+
+    def test_unknown_device_uses_engine_format(self):
+        self.device(2)
+        self.assertEqual(self.engine.native_format(7, "input"), (44100, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
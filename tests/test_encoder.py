@@ -0,0 +1,92 @@
+import os
+import signal
+import time
+import unittest
+import numpy as np
+from engine.encoder import EncoderPool
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def tone(seconds, rate=44100):
+    wave = np.sin(2 * np.pi * 440 * np.arange(int(seconds * rate)) / rate) * 8000
+    return np.repeat(wave[:, None], 2, axis=1).astype(np.int16).tobytes()
+
+
+class EncoderPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = EncoderPool(workers=1)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def encode(self, handle, seconds):
+        out = b""
+        block = tone(0.1)
+        for _ in range(int(seconds * 10)):
+            handle.write(block)
+            time.sleep(0.02)
+            out += handle.read()
+        time.sleep(0.3)
+        return out + handle.read()
+
+    def restart_worker(self):
+        os.kill(self.pool.processes[0].pid, signal.SIGKILL)
+        self.assertTrue(wait_for(lambda: self.pool.supervise() or self.pool.restarts == 1
+                                 and all(h.state == "running" for h in self.pool.handles.values())))
+
+    def test_header_kept_out_of_the_stream(self):
+        handle = self.pool.add_encoder("wav")
+        self.assertEqual(handle.stream_header()[:4], b"RIFF")
+        self.assertEqual(self.encode(handle, 0.5)[:4096], tone(0.5)[:4096])
+
+    def test_raw_pcm_not_chained_after_restart(self):
+        handle = self.pool.add_encoder("wav")
+        self.encode(handle, 0.2)
+        self.restart_worker()
+        out = self.encode(handle, 0.5)
+        self.assertGreater(len(out), 0)
+        self.assertNotIn(b"RIFF", out)
+
+    @unittest.skipUnless("vorbis" in EncoderPool.available_codecs(), "needs soundfile")
+    def test_ogg_chained_after_restart(self):
+        handle = self.pool.add_encoder("vorbis")
+        first_header = handle.stream_header()
+        self.assertTrue(first_header.startswith(b"OggS"))
+        self.assertNotIn(b"OggS", self.encode(handle, 0.2)[:4])
+        self.restart_worker()
+        out = self.encode(handle, 0.2)
+        # the new stream's header pages come first, and later connects send them
+        self.assertTrue(out.startswith(handle.stream_header()))
+        self.assertNotEqual(handle.stream_header(), first_header)
+
+    def test_quick_reconfigure_keeps_worker(self):
+        for _ in range(30):
+            self.pool.add_encoder("wav").close()
+        handle = self.pool.add_encoder("wav")
+        self.assertEqual(handle.state, "running")
+        self.assertTrue(self.pool.processes[0].is_alive())
+        self.pool.supervise()
+        self.assertEqual(self.pool.restarts, 0)
+
+    @unittest.skipUnless("opus" in EncoderPool.available_codecs(), "needs soundfile")
+    def test_failed_start_raises(self):
+        # libsndfile has no opus mapping for 300 channels
+        pool = EncoderPool(workers=1, channels=300)
+        try:
+            with self.assertRaises(ValueError):
+                pool.add_encoder("opus")
+            self.assertEqual(pool.handles, {})
+        finally:
+            pool.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import numpy as np
+from engine.jitter import JitterBuffer
+
+RATE = 44100
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(buffer, clock, drift_ppm, seconds, block=1024, period=256):
+    # The producer writes whole blocks on a clock drift_ppm fast, the device reads a period
+    # at a time on the nominal one. Returns the ratio and fill seen at each read.
+    producer_rate = RATE * (1 + drift_ppm / 1e6)
+    next_write = 0.0
+    next_read = 0.0
+    written = 0
+    data = np.zeros((block, buffer.channels), dtype=np.int16)
+    ratios, fills = [], []
+    while next_read < seconds:
+        if next_write <= next_read:
+            clock.now = next_write
+            data[:, :] = (np.arange(written, written + block) % 2000 - 1000)[:, None]
+            buffer.write(data)
+            written += block
+            next_write += block / producer_rate
+        else:
+            clock.now = next_read
+            buffer.read(period)
+            ratios.append(buffer.ratio)
+            fills.append(buffer.available())
+            next_read += period / RATE
+    return np.array(ratios), np.array(fills)
+
+
+class JitterBufferTest(unittest.TestCase):
+    def make(self, target=4096, **kwargs):
+        clock = Clock()
+        return JitterBuffer(RATE, target, RATE, 2, response_time=2.0, clock=clock, **kwargs), clock
+
+    def test_waits_for_target_before_playing(self):
+        buffer, clock = self.make(target=2048)
+        buffer.write(np.zeros((1024, 2), dtype=np.int16))
+        self.assertIsNone(buffer.read(256))
+        buffer.write(np.zeros((1024, 2), dtype=np.int16))
+        self.assertEqual(len(buffer.read(256)), 256 * 4)
+
+    def test_locks_onto_drift(self):
+        for drift in (-300, 0, 300):
+            with self.subTest(drift=drift):
+                buffer, clock = self.make()
+                ratios, fills = run(buffer, clock, drift, 40)
+                settled = slice(len(ratios) * 3 // 4, None)
+                # reads as much faster as the producer is, and holds the fill at the target
+                self.assertAlmostEqual(float(ratios[settled].mean() - 1) * 1e6, drift, delta=30)
+                self.assertAlmostEqual(buffer.latency_frames(), 4096, delta=4096 * 0.15)
+                self.assertLess(fills[settled].max(), 4096 * 2)
+                self.assertEqual(buffer.underruns, 0)
+                self.assertEqual(buffer.overruns, 0)
+
+    def test_ratio_is_bounded(self):
+        buffer, clock = self.make(max_ppm=500)
+        ratios, _ = run(buffer, clock, 3000, 20)
+        self.assertLessEqual(float(np.abs(ratios - 1).max()), 500e-6 + 1e-12)
+        # more drift than the loop may correct piles up in the buffer rather than running the ratio away
+        self.assertGreater(buffer.latency_frames(), 4096 * 1.2)
+
+    def test_underrun_reprimes(self):
+        buffer, clock = self.make(target=1024)
+        buffer.write(np.zeros((1024, 2), dtype=np.int16))
+        reads = 0
+        while buffer.read(256) is not None:
+            reads += 1
+        self.assertEqual(reads, 4)
+        self.assertEqual(buffer.underruns, 1)
+        self.assertFalse(buffer.primed)
+        buffer.write(np.zeros((512, 2), dtype=np.int16))
+        self.assertIsNone(buffer.read(256))
+
+    def test_silent_reads_keep_pace(self):
+        buffer, clock = self.make()
+        buffer.silent = True
+        ratios, fills = run(buffer, clock, 200, 20)
+        self.assertEqual(buffer.underruns, 0)
+        self.assertEqual(buffer.read(256), bytes(256 * 4))
+        self.assertAlmostEqual(float(ratios[len(ratios) // 2:].mean() - 1) * 1e6, 200, delta=40)
+
+
+if __name__ == "__main__":
+    unittest.main()
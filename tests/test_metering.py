@@ -0,0 +1,106 @@
+import unittest
+import numpy as np
+from engine.metering import MeterBank, SilenceDetector, block_peak
+
+
+def block(left, right, frames=256):
+    # constant level per channel
+    return np.tile(np.array([left, right], dtype=np.int16), (frames, 1)).tobytes()
+
+
+class MeterBankTest(unittest.TestCase):
+    def setUp(self):
+        self.bank = MeterBank(capacity=2, hold_decay=0.5)
+
+    def levels(self, slot):
+        row = self.bank.levels[slot]
+        return row[self.bank.peak].tolist(), row[self.bank.rms].tolist(), row[self.bank.hold].tolist()
+
+    def test_peak_and_rms_per_channel(self):
+        slot = self.bank.allocate()
+        self.bank.submit(slot, np.frombuffer(block(16384, -8192), dtype=np.int16))
+        self.bank.update()
+        peak, rms, hold = self.levels(slot)
+        self.assertEqual(peak, [0.5, 0.25])
+        self.assertEqual(rms, [0.5, 0.25])
+        self.assertEqual(hold, [0.5, 0.25])
+        self.assertEqual(self.bank.get_peak(slot), 0.5)
+
+    def test_hold_decays_without_new_blocks(self):
+        slot = self.bank.allocate()
+        self.bank.submit(slot, np.frombuffer(block(16384, 16384), dtype=np.int16))
+        self.bank.update()
+        self.bank.update()
+        peak, _, hold = self.levels(slot)
+        # the last measured peak stays, the hold falls towards it
+        self.assertEqual(peak, [0.5, 0.5])
+        self.assertEqual(hold, [0.25, 0.25])
+
+    def test_sources_with_different_block_sizes(self):
+        slots = [self.bank.allocate() for _ in range(3)]
+        self.bank.submit(slots[0], np.frombuffer(block(3277, 0, 256), dtype=np.int16))
+        self.bank.submit(slots[1], np.frombuffer(block(0, 6554, 1024), dtype=np.int16))
+        self.bank.submit(slots[2], np.frombuffer(block(-32768, 32767, 64), dtype=np.int16))
+        self.bank.update()
+        self.assertAlmostEqual(self.bank.get_peak(slots[0]), 0.1, places=3)
+        self.assertAlmostEqual(self.bank.get_peak(slots[1]), 0.2, places=3)
+        self.assertEqual(self.bank.get_peak(slots[2]), 1.0)
+        # every clipped sample is counted
+        self.assertEqual(self.bank.levels[slots[2], self.bank.clips], 128)
+
+    def test_allocate_grows_and_release_resets(self):
+        slots = [self.bank.allocate() for _ in range(5)]
+        self.assertEqual(slots, [0, 1, 2, 3, 4])
+        self.assertGreaterEqual(len(self.bank.in_use), 5)
+        self.bank.submit(3, np.frombuffer(block(1000, 1000), dtype=np.int16))
+        self.bank.update()
+        self.bank.release(3)
+        self.assertEqual(self.bank.get_peak(3), 0.0)
+        self.assertEqual(self.bank.allocate(), 3)
+
+
+def db(value):
+    return 10 ** (value / 20)
+
+
+class SilenceDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = SilenceDetector(threshold_db=-50.0, hold=10.0, hysteresis_db=6.0)
+
+    def feed(self, peak, start, seconds, step=0.5):
+        # peaks every `step` seconds, returns (time, event) for every event
+        events = []
+        for i in range(int(seconds / step)):
+            now = start + i * step
+            event = self.detector.update(peak, now)
+            if event is not None:
+                events.append((now, event))
+        return events
+
+    def test_silent_after_hold(self):
+        self.assertEqual(self.feed(db(-20), 0, 5), [])
+        self.assertEqual(self.feed(db(-60), 5, 20), [(15.0, True)])
+        self.assertTrue(self.detector.silent)
+
+    def test_signal_resets_the_hold(self):
+        self.feed(db(-60), 0, 9)
+        self.detector.update(db(-40), 9)
+        self.assertEqual(self.feed(db(-60), 9.5, 11), [(19.5, True)])
+
+    def test_hysteresis(self):
+        self.feed(db(-60), 0, 11)
+        # above the threshold but not above threshold + hysteresis keeps it silent
+        self.assertEqual(self.feed(db(-47), 11, 5), [])
+        self.assertEqual(self.feed(db(-43), 16, 1), [(16.0, False)])
+        self.assertFalse(self.detector.silent)
+        # and it takes the full hold again to go silent
+        self.assertEqual(self.feed(db(-60), 17, 12), [(27.0, True)])
+
+    def test_block_peak(self):
+        self.assertEqual(block_peak(b""), 0.0)
+        self.assertEqual(block_peak(block(-32768, 100)), 1.0)
+        self.assertEqual(block_peak(block(16384, -8192)), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
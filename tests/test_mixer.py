@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+from engine.metering import MeterBank
+from engine.mixer import Mixer
+from engine.ring_buffer import BroadcastRing
+
+CHUNK = 64
+
+
+class Hub:
+    # capture hub stand-in whose devices are rings the test writes to directly
+    def __init__(self):
+        self.meters = MeterBank()
+        self.rings = {}
+        self.subscribers = {}
+
+    def subscribe(self, dev_index, block_frames=None):
+        self.subscribers[dev_index] = self.subscribers.get(dev_index, 0) + 1
+        return self.rings.setdefault(dev_index, BroadcastRing(CHUNK * 8)).reader()
+
+    def unsubscribe(self, dev_index, reader=None):
+        self.subscribers[dev_index] -= 1
+
+
+def constant(left, right, frames=CHUNK):
+    return np.tile(np.array([left, right], dtype=np.int16), (frames, 1))
+
+
+class MixerTest(unittest.TestCase):
+    def setUp(self):
+        self.hub = Hub()
+        self.mixer = Mixer(self.hub, CHUNK)
+
+    def tearDown(self):
+        self.mixer.stop()
+        if self.mixer.thread is not None:
+            self.mixer.thread.join(2)
+
+    def mixed(self, bus_id, inputs):
+        # Blocks through the running mix thread. A new plan applies from the next block,
+        # so the second block is the one mixed with the current settings.
+        reader = self.mixer.buses[bus_id].ring.reader()
+        # the first input paces the mixer, so it is written last
+        first = next(iter(self.mixer.readers))
+        for _ in range(2):
+            for dev_index in sorted(inputs, key=lambda d: d == first):
+                self.hub.rings[dev_index].write(inputs[dev_index])
+            self.assertTrue(reader.wait_for(CHUNK, timeout=2))
+            block = np.frombuffer(reader.read(CHUNK), dtype=np.int16).reshape(-1, 2)
+        return block
+
+    def test_mix_sums_with_gain_and_saturates(self):
+        gains = np.array([[[0.5, 0.5], [1.0, 1.0]]], dtype=np.float32)
+        inputs = np.stack([constant(1000, -1000), constant(30000, -30000)]).astype(np.float32)
+        mix = np.zeros((1, CHUNK, 2), dtype=np.float32)
+        out = np.zeros((1, CHUNK, 2), dtype=np.int16)
+        Mixer.mix(gains, inputs, mix, out)
+        self.assertEqual(out[0, 0].tolist(), [30500, -30500])
+        inputs[0] = constant(32000, -32000)
+        Mixer.mix(gains, inputs, mix, out)
+        self.assertEqual(out[0, 0].tolist(), [32767, -32768])
+
+    def test_gain_mute_and_pan(self):
+        self.mixer.add_bus(0)
+        self.mixer.set_input(0, 1, gain=0.5)
+        self.mixer.set_input(0, 2, pan=-1.0)
+        self.mixer.set_input(0, 3, mute=True)
+        block = self.mixed(0, {1: constant(1000, 1000), 2: constant(100, 100), 3: constant(5000, 5000)})
+        # input 2 panned hard left, input 3 muted
+        self.assertEqual(block[0].tolist(), [600, 500])
+
+    def test_buses_share_inputs(self):
+        self.mixer.add_bus(0)
+        self.mixer.add_bus(1)
+        self.mixer.set_input(0, 1)
+        self.mixer.set_input(1, 1, gain=2.0)
+        self.assertEqual(self.mixed(0, {1: constant(100, -100)})[0].tolist(), [100, -100])
+        self.assertEqual(self.mixed(1, {1: constant(100, -100)})[0].tolist(), [200, -200])
+        # the device is subscribed once however many buses use it
+        self.assertEqual(self.hub.subscribers[1], 1)
+
+    def test_missing_input_mixes_as_silence(self):
+        self.mixer.add_bus(0)
+        self.mixer.set_input(0, 1)
+        self.mixer.set_input(0, 2)
+        block = self.mixed(0, {1: constant(700, 700)})
+        self.assertEqual(block[0].tolist(), [700, 700])
+        self.assertGreaterEqual(self.mixer.underruns, 1)
+
+    def test_remove_input_unsubscribes_unused_device(self):
+        self.mixer.add_bus(0)
+        self.mixer.set_input(0, 1)
+        self.mixer.remove_input(0, 1)
+        self.assertEqual(self.hub.subscribers[1], 0)
+        self.assertEqual(self.mixer.readers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
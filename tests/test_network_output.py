@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+import urllib.parse
+from engine.fake_backend import FakeBackend
+from engine.fake_server import FakeSourceServer
+from engine.network_output import NetworkOutput, create_mount_config
+from engine.streams import StreamEngine
+
+HEADER = b"HEADER"
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def stream_until(client, condition, timeout=5.0):
+    # a source only sees it was dropped when it next writes, as it does all the time live
+    return wait_for(lambda: client.send(b"x") or condition(), timeout)
+
+
+def songs(server):
+    return [urllib.parse.parse_qs(urllib.parse.urlsplit(path).query).get("song", [None])[0]
+            for path in server.metadata]
+
+
+class NetworkOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSourceServer(password="hackme")
+        self.port = self.server.start()
+        self.output = NetworkOutput()
+
+    def tearDown(self):
+        self.output.stop()
+        self.server.stop()
+
+    def add_mount(self, protocol="icecast_put", password="hackme", **kwargs):
+        config = create_mount_config(protocol, "127.0.0.1", self.port, "/live", password, sid=2,
+                                     content_type="audio/ogg", header=kwargs.pop("header", HEADER))
+        return self.output.add_mount(config, base_delay=0.05, max_delay=0.2, **kwargs)
+
+    def test_handshake(self):
+        for protocol in ("icecast_put", "icecast_source", "shoutcast_v1", "shoutcast_v2"):
+            with self.subTest(protocol=protocol):
+                client = self.add_mount(protocol)
+                self.assertTrue(wait_for(lambda: client.connected))
+                client.send(b"audio")
+                source = self.server.sources[-1]
+                self.assertTrue(wait_for(lambda: bytes(source.data) == HEADER + b"audio"))
+                self.assertEqual(source.headers.get("content-type"), "audio/ogg")
+                if protocol.startswith("icecast"):
+                    self.assertEqual(source.mount, "/live")
+                elif protocol == "shoutcast_v2":
+                    self.assertEqual(source.mount, "2")
+                self.output.remove_mount(client)
+
+    def test_auth_failure(self):
+        for protocol in ("icecast_put", "shoutcast_v1"):
+            with self.subTest(protocol=protocol):
+                refused = self.server.refused
+                client = self.add_mount(protocol, password="wrong")
+                # refused, then retried with backoff, and never taken for connected
+                self.assertTrue(wait_for(lambda: client.reconnects >= 2))
+                self.assertFalse(client.connected)
+                self.assertGreaterEqual(self.server.refused - refused, 2)
+                self.output.remove_mount(client)
+        self.assertEqual(self.server.sources, [])
+
+    def test_backpressure(self):
+        client = self.add_mount(queue_size=8)
+        self.assertTrue(wait_for(lambda: client.connected))
+        self.server.pause()
+        block = bytes(64 * 1024)
+        # far more than the socket buffers hold, the queue has to drop rather than grow
+        for _ in range(400):
+            client.send(block)
+            time.sleep(0.001)
+        self.assertTrue(wait_for(lambda: client.dropped > 0))
+        self.assertLessEqual(client.queue.qsize(), 8)
+        self.assertTrue(client.connected)
+        self.server.resume()
+        source = self.server.sources[-1]
+        received = len(source.data)
+        client.send(block)
+        self.assertTrue(wait_for(lambda: len(source.data) > received))
+        self.assertTrue(client.connected)
+
+    def test_reconnect_resends_header(self):
+        client = self.add_mount()
+        self.assertTrue(wait_for(lambda: client.connected))
+        client.send(b"first")
+        self.assertTrue(wait_for(lambda: bytes(self.server.sources[0].data) == HEADER + b"first"))
+        self.server.kick()
+        self.assertTrue(stream_until(client, lambda: len(self.server.sources) == 2 and client.connected))
+        self.assertGreaterEqual(client.reconnects, 1)
+        self.assertEqual(len(self.server.connected()), 1)
+        self.assertTrue(stream_until(client, lambda: len(self.server.sources[1].data) > len(HEADER)))
+        self.assertTrue(self.server.sources[1].data.startswith(HEADER))
+
+    def test_header_function(self):
+        # the encoder's header can change between connects, it is asked for on each one
+        headers = [b"one", b"two"]
+        client = self.add_mount(header=lambda: headers[0])
+        self.assertTrue(wait_for(lambda: self.server.sources and bytes(self.server.sources[0].data) == b"one"))
+        headers[0] = headers[1]
+        self.server.kick()
+        self.assertTrue(stream_until(client, lambda: len(self.server.sources) == 2))
+        self.assertTrue(wait_for(lambda: self.server.sources[1].data.startswith(b"two")))
+
+    def test_metadata(self):
+        for protocol, path in (("icecast_put", "/admin/metadata"), ("shoutcast_v2", "/admin.cgi")):
+            with self.subTest(protocol=protocol):
+                del self.server.metadata[:]
+                client = self.add_mount(protocol)
+                # set before the source is up, sent once it is
+                client.set_metadata("first song")
+                self.assertTrue(wait_for(lambda: songs(self.server) == ["first song"]))
+                client.set_metadata("second song")
+                self.assertTrue(wait_for(lambda: songs(self.server) == ["first song", "second song"]))
+                self.assertTrue(self.server.metadata[0].startswith(path))
+                if protocol == "shoutcast_v2":
+                    self.assertIn("sid=2", self.server.metadata[0])
+                self.output.remove_mount(client)
+
+    def test_metadata_resent_after_reconnect(self):
+        client = self.add_mount()
+        self.assertTrue(wait_for(lambda: client.connected))
+        client.set_metadata("song")
+        self.assertTrue(wait_for(lambda: songs(self.server) == ["song"]))
+        self.server.kick()
+        self.assertTrue(stream_until(client, lambda: songs(self.server) == ["song", "song"]))
+
+
+class StreamEngineNetworkOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSourceServer(password="hackme")
+        self.port = self.server.start()
+        self.engine = StreamEngine(backend=FakeBackend(inputs=1, outputs=1))
+
+    def tearDown(self):
+        self.engine.stop()
+        self.server.stop()
+
+    def settings(self, **changes):
+        return dict({"protocol": "icecast_put", "host": "127.0.0.1", "port": self.port, "password": "hackme",
+                     "mount": "/live", "codec": "wav", "bitrate": 128}, **changes)
+
+    def test_rejected_settings_keep_the_output(self):
+        self.assertTrue(self.engine.set_network_output(0, "icecast", self.settings()))
+        info = self.engine.configured_streams[0]
+        info.keep = True
+        source, encoder = info.output_source, info.encoder
+        for bad in ({"port": "x"}, {"codec": "nope"}, {"bitrate": "fast"}, {"sid": "y", "mount": "/other"}):
+            with self.subTest(settings=bad):
+                self.assertFalse(self.engine.set_network_output(0, "shoutcast", self.settings(**bad)))
+                self.assertEqual((info.output_type, info.port, info.codec, info.bitrate, info.mount),
+                                 ("icecast", self.port, "wav", 128, "/live"))
+                self.assertIs(info.output_source, source)
+                self.assertIs(info.encoder, encoder)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "streams.json")
+            self.engine.save_config(path)
+            with open(path) as f:
+                saved = json.load(f)["streams"][0]
+        self.assertEqual((saved["port"], saved["codec"], saved["mount"]), (self.port, "wav", "/live"))
+
+    def test_set_metadata(self):
+        self.assertTrue(self.engine.set_network_output(0, "icecast", self.settings()))
+        self.assertTrue(self.engine.set_metadata(0, "now playing"))
+        self.assertTrue(wait_for(lambda: songs(self.server) == ["now playing"]))
+        self.assertIn("mount=/live", self.server.metadata[0])
+        # hardware outputs and unknown routes have nowhere to send it
+        self.engine.set_hardware_output(0, 0)
+        self.assertFalse(self.engine.set_metadata(0, "ignored"))
+        self.assertFalse(self.engine.set_metadata(5, "ignored"))
+
+
+if __name__ == "__main__":
+    unittest.main()
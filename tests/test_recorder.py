@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+import wave
+from unittest import mock
+import numpy as np
+from engine.recorder import Recording
+
+RATE = 1000
+
+
+def frames(start, count):
+    return np.repeat((np.arange(start, start + count) % 30000).astype(np.int16)[:, None], 2, axis=1)
+
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, start, seconds, segment_seconds=60, block=700):
+        recording = Recording(self.directory.name, "s0", "wav", segment_seconds, RATE, 2)
+        total = int(seconds * RATE)
+        with mock.patch("engine.recorder.time.time", return_value=start):
+            for offset in range(0, total, block):
+                recording.write_frames(frames(offset, min(block, total - offset)))
+            recording.close()
+        return recording
+
+    def files(self):
+        result = []
+        for name in sorted(os.listdir(self.directory.name)):
+            with wave.open(os.path.join(self.directory.name, name)) as f:
+                data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).reshape(-1, 2)
+            result.append((name, data[:, 0]))
+        return result
+
+    def test_files_are_named_after_their_boundary(self):
+        # the start is rounded up to the next frame, so counting frames reaches the boundary a hair early
+        start = time.mktime((2026, 10, 18, 15, 59, 30, 0, 0, -1)) + 0.3006
+        self.record(start, 150)
+        names = [name for name, _ in self.files()]
+        self.assertEqual(names, ["s0-20261018-155930.wav", "s0-20261018-160000.wav", "s0-20261018-160100.wav",
+                                 "s0-20261018-160200.wav"])
+
+    def test_segments_cut_on_boundaries_without_gaps(self):
+        start = time.mktime((2026, 10, 18, 15, 59, 30, 0, 0, -1)) + 0.3006
+        self.record(start, 150)
+        files = self.files()
+        self.assertEqual([len(data) for _, data in files], [29699, 60000, 60000, 301])
+        joined = np.concatenate([data for _, data in files])
+        self.assertEqual(joined.tolist(), (np.arange(150000) % 30000).tolist())
+
+    def test_wav_segments_are_capped(self):
+        recording = Recording(self.directory.name, "s0", "wav", 24 * 3600, RATE, 2)
+        self.assertEqual(recording.segment_seconds, 6 * 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
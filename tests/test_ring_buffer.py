@@ -0,0 +1,125 @@
+import threading
+import time
+import unittest
+import numpy as np
+from engine.ring_buffer import RingBuffer, BroadcastRing
+
+
+def frames(start, count, channels=2):
+    # frame n holds n on every channel, so order and gaps show up in the values
+    return np.repeat(np.arange(start, start + count, dtype=np.int16)[:, None], channels, axis=1)
+
+
+def values(view, channels=2):
+    return np.frombuffer(view, dtype=np.int16).reshape(-1, channels)[:, 0].tolist()
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_fifo_across_wrap(self):
+        ring = RingBuffer(10)
+        ring.write(frames(0, 7))
+        self.assertEqual(values(ring.read(5)), [0, 1, 2, 3, 4])
+        ring.release()
+        # lands across the end of the storage
+        ring.write(frames(7, 6))
+        self.assertEqual(ring.available(), 8)
+        self.assertEqual(values(ring.read(8)), list(range(5, 13)))
+        self.assertEqual(ring.available(), 0)
+
+    def test_accepts_bytes(self):
+        ring = RingBuffer(8)
+        self.assertEqual(ring.write(frames(0, 4).tobytes()), 4)
+        self.assertEqual(values(ring.read(4)), [0, 1, 2, 3])
+
+    def test_overrun_drops_whole_chunk(self):
+        ring = RingBuffer(8)
+        ring.write(frames(0, 6))
+        self.assertEqual(ring.write(frames(6, 3)), 0)
+        self.assertEqual(ring.overruns, 1)
+        self.assertEqual(ring.dropped_frames, 3)
+        self.assertEqual(values(ring.read(6)), list(range(6)))
+
+    def test_underrun_returns_none(self):
+        ring = RingBuffer(8)
+        ring.write(frames(0, 2))
+        self.assertIsNone(ring.read(3))
+        self.assertEqual(ring.underruns, 1)
+        # nothing was consumed by the failed read
+        self.assertEqual(values(ring.read(2)), [0, 1])
+
+    def test_read_view_held_until_next_read(self):
+        ring = RingBuffer(4)
+        ring.write(frames(0, 4))
+        view = ring.read(2)
+        # the held frames are not free yet, so the producer cannot overwrite them
+        self.assertEqual(ring.free(), 0)
+        self.assertEqual(ring.write(frames(4, 1)), 0)
+        self.assertEqual(values(view), [0, 1])
+        ring.release()
+        self.assertEqual(ring.write(frames(4, 2)), 2)
+        self.assertEqual(values(ring.read(4)), [2, 3, 4, 5])
+
+    def test_wait_for_wakes_on_write(self):
+        ring = RingBuffer(16)
+        threading.Timer(0.05, ring.write, (frames(0, 4),)).start()
+        start = time.monotonic()
+        self.assertTrue(ring.wait_for(4, timeout=2))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(ring.wait_for(8, timeout=0.05))
+
+    def test_clear(self):
+        ring = RingBuffer(8)
+        ring.write(frames(0, 5))
+        ring.read(2)
+        ring.clear()
+        self.assertEqual(ring.available(), 0)
+        self.assertEqual(ring.free(), 8)
+
+
+class BroadcastRingTest(unittest.TestCase):
+    def test_readers_are_independent(self):
+        ring = BroadcastRing(16)
+        first = ring.reader()
+        ring.write(frames(0, 4))
+        # a reader starts at the live edge
+        second = ring.reader()
+        ring.write(frames(4, 4))
+        self.assertEqual(values(first.read(8)), list(range(8)))
+        self.assertEqual(values(second.read(4)), [4, 5, 6, 7])
+        self.assertEqual(first.available(), 0)
+
+    def test_lapped_reader_skips_to_oldest_kept(self):
+        ring = BroadcastRing(8)
+        reader = ring.reader()
+        for start in range(0, 12, 3):
+            ring.write(frames(start, 3))
+        self.assertEqual(values(reader.read(8)), list(range(4, 12)))
+        self.assertEqual(reader.overruns, 1)
+        self.assertEqual(reader.dropped_frames, 4)
+
+    def test_read_across_wrap(self):
+        ring = BroadcastRing(8)
+        reader = ring.reader()
+        ring.write(frames(0, 6))
+        reader.read(6)
+        ring.write(frames(6, 5))
+        self.assertEqual(values(reader.read(5)), [6, 7, 8, 9, 10])
+        self.assertIsNone(reader.read(1))
+        self.assertEqual(reader.underruns, 1)
+
+    def test_wait_for_wakes_every_reader(self):
+        ring = BroadcastRing(16)
+        readers = [ring.reader() for _ in range(3)]
+        results = []
+        threads = [threading.Thread(target=lambda r=r: results.append(r.wait_for(4, timeout=2))) for r in readers]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        ring.write(frames(0, 4))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True, True, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
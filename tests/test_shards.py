@@ -0,0 +1,137 @@
+import queue
+import time
+import unittest
+from engine.shards import HEARTBEAT_TIMEOUT, ShardSupervisor
+
+
+class Process:
+    # stands in for a worker process, so placement can be tested without spawning any
+    def __init__(self):
+        self.alive = True
+        self.killed = False
+        self.pid = 0
+
+    def is_alive(self):
+        return self.alive
+
+    def kill(self):
+        self.killed = True
+        self.alive = False
+
+    def join(self, timeout=None):
+        pass
+
+
+def drain(commands):
+    result = []
+    while True:
+        try:
+            result.append(commands.get_nowait())
+        except queue.Empty:
+            return result
+
+
+class ShardSupervisorTest(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = ShardSupervisor(shards=3)
+        self.started = []
+        self.supervisor.start_worker = self.start_worker
+        for shard in range(3):
+            self.start_worker(shard)
+        self.started = []
+
+    def tearDown(self):
+        self.supervisor.processes = [None] * 3
+        self.supervisor.commands = [None] * 3
+        self.supervisor.stop()
+
+    def start_worker(self, shard):
+        self.started.append(shard)
+        self.supervisor.processes[shard] = Process()
+        self.supervisor.commands[shard] = queue.Queue()
+        self.supervisor.started[shard] = time.time()
+        self.supervisor.workers.rows[shard] = 0
+        self.supervisor.dirty.add(shard)
+
+    def heartbeat(self):
+        self.supervisor.workers.rows[:, 0] = time.time()
+
+    def configure(self):
+        buses = {0: {"bus_id": 0, "inputs": [{"input": "mic"}, {"input": "line"}]}}
+        entries = {0: {"input": "mic", "output": "speakers"}, 1: {"input_bus": 0, "output_type": "recording"},
+                   2: {"input": "usb", "output": "speakers"}, 3: {"input": "other", "output": "headphones"},
+                   4: {"input": "radio", "output_type": "icecast"}}
+        self.supervisor.set_config(buses, entries)
+
+    def test_groups_follow_shared_devices_and_buses(self):
+        self.configure()
+        groups = sorted(sorted(group) for group in self.supervisor.groups())
+        # 0 and 1 share "mic" through the bus, 0 and 2 share "speakers"
+        self.assertEqual(groups, [[0, 1, 2], [3], [4]])
+
+    def test_place_balances_and_keeps_groups_together(self):
+        self.configure()
+        self.supervisor.place()
+        placement = self.supervisor.placement
+        self.assertEqual(len({placement[0], placement[1], placement[2]}), 1)
+        self.assertEqual(len({placement[0], placement[3], placement[4]}), 3)
+
+    def test_placed_routes_do_not_move(self):
+        self.configure()
+        self.supervisor.place()
+        before = dict(self.supervisor.placement)
+        self.supervisor.set_entry(5, {"input": "new", "output_type": "recording"})
+        self.supervisor.remove_entry(3)
+        self.supervisor.place()
+        after = self.supervisor.placement
+        self.assertEqual({s_id: after[s_id] for s_id in (0, 1, 2, 4)}, {s_id: before[s_id] for s_id in (0, 1, 2, 4)})
+        # the new route takes the shard route 3 left
+        self.assertEqual(after[5], before[3])
+
+    def test_push_sends_each_shard_its_routes(self):
+        self.configure()
+        self.heartbeat()
+        self.supervisor.supervise()
+        for shard in range(3):
+            configs = [cmd for cmd in drain(self.supervisor.commands[shard]) if cmd[0] == "config"]
+            self.assertEqual(len(configs), 1)
+            expected = {s_id for s_id, placed in self.supervisor.placement.items() if placed == shard}
+            self.assertEqual(set(configs[0][2]), expected)
+            self.assertEqual(set(configs[0][1]), {0} if 1 in expected else set())
+
+    def test_preview_of_a_route_placed_later(self):
+        self.supervisor.set_preview(3)
+        self.assertIsNone(self.supervisor.preview_shard)
+        self.configure()
+        self.heartbeat()
+        self.supervisor.supervise()
+        shard = self.supervisor.placement[3]
+        self.assertEqual(self.supervisor.preview_shard, shard)
+        self.assertIn(("preview", 3), drain(self.supervisor.commands[shard]))
+
+    def test_restarts_dead_and_silent_workers(self):
+        self.configure()
+        self.heartbeat()
+        self.supervisor.supervise()
+        self.assertEqual(self.started, [])
+        self.supervisor.processes[0].alive = False
+        hung = self.supervisor.processes[1]
+        self.supervisor.workers.rows[1, 0] = time.time() - HEARTBEAT_TIMEOUT - 1
+        self.supervisor.supervise()
+        self.assertEqual(sorted(self.started), [0, 1])
+        self.assertTrue(hung.killed)
+        self.assertEqual(self.supervisor.restarts, 2)
+
+    def test_restarts_worker_that_never_sends_a_heartbeat(self):
+        self.supervisor.supervise()
+        self.assertEqual(self.started, [])
+        hung = self.supervisor.processes[2]
+        self.supervisor.workers.rows[:2, 0] = time.time()
+        self.supervisor.started[2] = time.time() - HEARTBEAT_TIMEOUT - 1
+        self.supervisor.supervise()
+        self.assertEqual(self.started, [2])
+        self.assertTrue(hung.killed)
+
+
+if __name__ == "__main__":
+    unittest.main()